@@ -7,12 +7,32 @@ Perfect for batch processing multiple towers at once.
 Usage:
     1. Edit config.json to add your files
     2. Run: python batch_certificate_generator.py
+    
+    Process towers in parallel (one worker process per tower):
+       python batch_certificate_generator.py --jobs 4
+    
+    "template_file" in config.json is a template workbook, or a template
+    folder (e.g. Base) whose templates.json picks the template per meter
+    (see template_registry.py).
+    
+    A tower's "input_file" may also be a folder or glob pattern (e.g. a
+    folder of daily files), and "all_sheets": true reads every sheet of the
+    workbook (one sheet per floor); all of it becomes one output file
+    (see calibration_ingest.py).
 """
 
+import argparse
 import json
 import os
-from openpyxl import load_workbook, Workbook
-from copy import copy
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from openpyxl import Workbook
+
+from calibration_ingest import ingest
+from calibration_table import calibrate
+from template_cache import load_cell_mapping, load_template
+from template_registry import resolve_templates
+from universal_certificate_generator import certificate_sheet_names
+from workbook_merge import deduplicate_media
 
 def load_config(config_file='config.json'):
     """Load configuration from JSON file"""
@@ -24,7 +44,7 @@ def load_config(config_file='config.json'):
         # Create default config
         default_config = {
             "base_directory": base_dir,
-            "template_file": "CYBER_PARK_TOWER_A_complete.xlsx",
+            "template_file": os.path.join(script_dir, 'Base'),  # Template folder: template per meter
             "towers": [
                 {
                     "name": "Tower B",
@@ -61,152 +81,120 @@ def load_config(config_file='config.json'):
         return json.load(f)
 
 
-def generate_certificates(calibration_file, output_file, sheet_prefix, template_file):
-    """Generate certificates from a calibration file"""
-    wb_cal = load_workbook(calibration_file)
-    ws_cal = wb_cal['Sheet1']
-    
-    # Extract meter data
-    meters = []
-    for row in ws_cal.iter_rows(min_row=5, values_only=False):
-        if row[0].value and row[1].value:
-            before_mwh = row[7].value
-            before_kwh = row[8].value
-            if before_mwh:
-                before_unit, before_value = 'MWH', before_mwh
-            elif before_kwh:
-                before_unit, before_value = 'KWH', before_kwh
-            else:
-                before_unit, before_value = None, None
-            
-            after_mwh = row[13].value if len(row) > 13 else None
-            after_kwh = row[14].value if len(row) > 14 else None
-            if after_mwh:
-                after_unit, after_value = 'MWH', after_mwh
-            elif after_kwh:
-                after_unit, after_value = 'KWH', after_kwh
-            else:
-                after_unit, after_value = None, None
-            
-            meters.append({
-                'location': str(row[0].value).strip(),
-                'serial': str(row[1].value).strip(),
-                'meter_size': row[2].value,
-                'before_inlet': row[5].value,
-                'before_outlet': row[4].value,
-                'before_m3hr': row[6].value,
-                'before_unit': before_unit,
-                'before_value': before_value,
-                'after_inlet': row[11].value if len(row) > 11 else None,
-                'after_outlet': row[10].value if len(row) > 10 else None,
-                'after_m3hr': row[12].value if len(row) > 12 else None,
-                'after_unit': after_unit,
-                'after_value': after_value,
-            })
-    
-    # Load template and create new workbook
-    wb_template = load_workbook(template_file)
-    template_sheet = wb_template[wb_template.sheetnames[0]]
+def generate_certificates(calibration_file, output_file, sheet_prefix, template_file, all_sheets=False):
+    """Generate certificates from a calibration file (or a folder/glob of them)"""
+    meters = ingest(calibration_file, all_sheets).meters
+    calibrate(meters)
+    
+    # Pick the template of every meter (template_file may be a template folder)
+    template_file, routes = resolve_templates(template_file, meters, sheet_prefix)
+    
+    # Load templates and their cell mappings, and create new workbook
     wb_new = Workbook()
     wb_new.remove(wb_new.active)
+    if routes:
+        variants = [(template.bind(wb_new), mapping) for template, mapping in routes.variants]
+    else:
+        variants = [(load_template(template_file).bind(wb_new), load_cell_mapping(template_file))]
     
-    # Create sheets
-    for meter in meters:
-        location_clean = (meter['location'].upper()
-                         .replace(' ', '_').replace('(', '').replace(')', '')
-                         .replace('&', 'AND').replace('-', '_'))
-        sheet_name = f"{sheet_prefix}_{location_clean}"[:31]
+    # Create sheets (same Excel-safe, unique names as the other generators)
+    sheet_names = certificate_sheet_names(meters, sheet_prefix)
+    for idx, (meter, sheet_name) in enumerate(zip(meters, sheet_names)):
+        stamp, mapping = variants[routes.index[idx] if routes else 0]
         ws_new = wb_new.create_sheet(title=sheet_name)
         
         # Copy template
-        for row in template_sheet.iter_rows():
-            for cell in row:
-                new_cell = ws_new[cell.coordinate]
-                if cell.value:
-                    new_cell.value = cell.value
-                if cell.has_style:
-                    new_cell.font = copy(cell.font)
-                    new_cell.border = copy(cell.border)
-                    new_cell.fill = copy(cell.fill)
-                    new_cell.number_format = copy(cell.number_format)
-                    new_cell.protection = copy(cell.protection)
-                    new_cell.alignment = copy(cell.alignment)
-        
-        for col_letter, col_dim in template_sheet.column_dimensions.items():
-            ws_new.column_dimensions[col_letter].width = col_dim.width
-        for row_num, row_dim in template_sheet.row_dimensions.items():
-            ws_new.row_dimensions[row_num].height = row_dim.height
-        for merged_cell_range in template_sheet.merged_cells.ranges:
-            ws_new.merge_cells(str(merged_cell_range))
+        stamp.apply(ws_new)
         
         # Fill data
-        ws_new['B7'].value = f"Serial No: {meter['serial']}"
-        ws_new['B8'].value = f"Meter Location : {meter['location']}"
-        meter_size = f"DN-{meter['meter_size']}" if meter['meter_size'] else "DN-65"
-        ws_new['B9'].value = f"Meter Size : {meter_size}"
-        
-        if meter['before_unit'] and meter['before_value'] is not None:
-            ws_new['I13'].value = f"{meter['before_unit']}= BTU*{meter['before_value']}"
-        if meter['before_inlet'] is not None:
-            ws_new['D14'].value = float(meter['before_inlet'])
-        if meter['before_outlet'] is not None:
-            ws_new['D15'].value = float(meter['before_outlet'])
-        if meter['before_m3hr'] is not None:
-            ws_new['F16'].value = float(meter['before_m3hr'])
-        if meter['before_inlet'] and meter['before_outlet']:
-            ws_new['D16'].value = abs(float(meter['before_outlet']) - float(meter['before_inlet']))
-        
-        if meter['after_unit'] and meter['after_value'] is not None:
-            ws_new['I19'].value = f"{meter['after_unit']}= BTU*{meter['after_value']}"
-        if meter['after_inlet'] is not None:
-            ws_new['D20'].value = float(meter['after_inlet'])
-        if meter['after_outlet'] is not None:
-            ws_new['D21'].value = float(meter['after_outlet'])
-        if meter['after_m3hr'] is not None:
-            ws_new['F22'].value = float(meter['after_m3hr'])
+        for row, column, value in mapping.cells(meter):
+            ws_new.cell(row=row, column=column).value = value
     
     wb_new.save(output_file)
-    wb_template.close()
-    wb_cal.close()
     wb_new.close()
+    deduplicate_media(output_file)  # One copy of the logo and signature for all sheets
     
     return len(meters)
 
 
+def process_tower(tower, base_dir, template_file):
+    """
+    Generate certificates for one tower entry of the config.
+    
+    Runs in a worker process when --jobs is greater than 1.
+    
+    Returns:
+        (tower name, certificate count, status)
+    """
+    input_file = os.path.join(base_dir, tower['input_file'])
+    output_file = os.path.join(base_dir, tower['output_file'])
+    
+    try:
+        count = generate_certificates(
+            input_file,
+            output_file,
+            tower['sheet_prefix'],
+            template_file,
+            tower.get('all_sheets', False)
+        )
+        return tower['name'], count, 'SUCCESS'
+    except Exception as e:
+        return tower['name'], 0, f'FAILED: {str(e)}'
+
+
 def main():
     """Main batch processing function"""
+    parser = argparse.ArgumentParser(description="Generate certificates for every tower in config.json")
+    parser.add_argument('--config', default='config.json', help="Config file (default: config.json)")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="Number of towers to process in parallel (default: 1)")
+    args = parser.parse_args()
+    
     print("=" * 70)
     print("  BATCH CERTIFICATE GENERATOR")
     print("=" * 70)
     
     # Load config
-    config = load_config()
+    config = load_config(args.config)
     base_dir = config['base_directory']
     template_file = os.path.join(base_dir, config['template_file'])
+    towers = config['towers']
+    jobs = max(1, min(args.jobs, len(towers)))
     
     print(f"\nBase Directory: {base_dir}")
     print(f"Template: {config['template_file']}")
-    print(f"\nProcessing {len(config['towers'])} tower(s)...\n")
+    if jobs > 1:
+        print(f"\nProcessing {len(towers)} tower(s) with {jobs} parallel jobs...\n")
+    else:
+        print(f"\nProcessing {len(towers)} tower(s)...\n")
     
-    results = []
-    for idx, tower in enumerate(config['towers'], 1):
-        print(f"[{idx}/{len(config['towers'])}] Processing {tower['name']}...")
-        
-        input_file = os.path.join(base_dir, tower['input_file'])
-        output_file = os.path.join(base_dir, tower['output_file'])
-        
-        try:
-            count = generate_certificates(
-                input_file,
-                output_file,
-                tower['sheet_prefix'],
-                template_file
-            )
-            print(f"     ✓ Created {count} certificates")
-            results.append((tower['name'], count, 'SUCCESS'))
-        except Exception as e:
-            print(f"     ✗ Error: {str(e)}")
-            results.append((tower['name'], 0, f'FAILED: {str(e)}'))
+    if jobs == 1:
+        results = []
+        for idx, tower in enumerate(towers, 1):
+            print(f"[{idx}/{len(towers)}] Processing {tower['name']}...")
+            name, count, status = process_tower(tower, base_dir, template_file)
+            if status == 'SUCCESS':
+                print(f"     ✓ Created {count} certificates")
+            else:
+                print(f"     ✗ {status}")
+            results.append((name, count, status))
+    else:
+        # Each tower has its own input and output file, so towers run independently
+        results = [None] * len(towers)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(process_tower, tower, base_dir, template_file): idx
+                       for idx, tower in enumerate(towers)}
+            for done, future in enumerate(as_completed(futures), 1):
+                idx = futures[future]
+                try:
+                    name, count, status = future.result()
+                except Exception as e:  # worker process died
+                    name, count, status = towers[idx]['name'], 0, f'FAILED: {str(e)}'
+                if status == 'SUCCESS':
+                    print(f"[{done}/{len(towers)}] ✓ {name}: Created {count} certificates")
+                else:
+                    print(f"[{done}/{len(towers)}] ✗ {name}: {status}")
+                results[idx] = (name, count, status)
     
     # Summary
     print("\n" + "=" * 70)
@@ -0,0 +1,316 @@
+"""
+Certificate Generation Benchmark
+================================
+Measures the per-sheet cost of building certificate sheets from the template.
+
+Compares:
+- legacy:  walk every template cell and copy() each style object (old path)
+- stamp:   compiled template bound once to the output workbook (current path)
+
+With the stamp the per-sheet cost should stay flat as the number of sheets
+grows, because styles are registered once instead of per cell per sheet.
+
+Whole files (build and save) are timed as well:
+- openpyxl:   streaming write-only workbook stamped from the compiled template
+- direct XML: template sheet XML with the cells substituted, zipped directly
+
+It also counts Excel COM round trips per certificate for the GUI's Excel
+engine, using a stand-in COM object (no Excel needed):
+- legacy:  one Range(...).Value call per cell plus debug Worksheets.Count calls
+- batched: one Range(...).Formula 2-D array assignment per certificate
+The batched count is a check: above MAX_COM_ROUND_TRIPS_PER_SHEET the
+script fails (exit code 1), so the batched fill cannot quietly go back to
+per-cell COM traffic.
+
+Usage:
+    python benchmark_certificates.py
+    python benchmark_certificates.py --template Base/Book1.xlsx --sheets 10 50 200
+    python benchmark_certificates.py --com-only     (only the COM round trip check)
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+from copy import copy
+
+from openpyxl import load_workbook, Workbook
+
+from calibration_reader import read_meters
+from calibration_table import calibrate
+from certificate_template import compile_template
+from template_xml_writer import TemplateXmlWriter
+
+
+# Largest accepted Excel COM round trips per certificate of the batched fill
+# (the per-cell legacy fill needs about 36)
+MAX_COM_ROUND_TRIPS_PER_SHEET = 8
+
+
+def legacy_copy_sheet(template_sheet, ws_new):
+    """The per-cell template copy used before compiled templates"""
+    for row in template_sheet.iter_rows():
+        for cell in row:
+            new_cell = ws_new[cell.coordinate]
+            if cell.value:
+                new_cell.value = cell.value
+            if cell.has_style:
+                new_cell.font = copy(cell.font)
+                new_cell.border = copy(cell.border)
+                new_cell.fill = copy(cell.fill)
+                new_cell.number_format = copy(cell.number_format)
+                new_cell.protection = copy(cell.protection)
+                new_cell.alignment = copy(cell.alignment)
+
+    for col_letter, col_dim in template_sheet.column_dimensions.items():
+        ws_new.column_dimensions[col_letter].width = col_dim.width
+    for row_num, row_dim in template_sheet.row_dimensions.items():
+        ws_new.row_dimensions[row_num].height = row_dim.height
+    for merged_cell_range in template_sheet.merged_cells.ranges:
+        ws_new.merge_cells(str(merged_cell_range))
+
+
+def time_legacy(template_sheet, sheet_count):
+    """Return seconds spent building `sheet_count` sheets the legacy way"""
+    wb_new = Workbook()
+    wb_new.remove(wb_new.active)
+    start = time.perf_counter()
+    for idx in range(sheet_count):
+        legacy_copy_sheet(template_sheet, wb_new.create_sheet(title=f"Sheet{idx}"))
+    return time.perf_counter() - start
+
+
+def time_stamp(template_sheet, sheet_count):
+    """Return seconds spent building `sheet_count` sheets with a compiled template"""
+    wb_new = Workbook()
+    wb_new.remove(wb_new.active)
+    start = time.perf_counter()
+    stamp = compile_template(template_sheet).bind(wb_new)
+    for idx in range(sheet_count):
+        stamp.apply(wb_new.create_sheet(title=f"Sheet{idx}"))
+    return time.perf_counter() - start
+
+
+def sample_values(idx):
+    """Cell values of a made-up certificate"""
+    return {'B7': f"Serial No: {84000000 + idx}", 'B8': f"Meter Location : AHU{idx}", 'B9': "Meter Size : DN-65",
+            'D14': 7.1, 'D15': 12.4, 'D16': 5.3, 'F16': 21.87, 'D20': 7.0, 'D21': 12.9, 'F22': 22.1}
+
+
+def time_openpyxl_file(template_sheet, sheet_count, output_file):
+    """Return seconds spent building and saving a streamed openpyxl certificate file"""
+    start = time.perf_counter()
+    wb_new = Workbook(write_only=True)
+    stamp = compile_template(template_sheet).bind(wb_new)
+    for idx in range(sheet_count):
+        stamp.write(wb_new.create_sheet(title=f"Sheet{idx}"), sample_values(idx))
+    wb_new.save(output_file)
+    return time.perf_counter() - start
+
+
+def time_direct_xml_file(template_file, sheet_count, output_file):
+    """Return seconds spent writing a certificate file with the direct XML writer"""
+    start = time.perf_counter()
+    TemplateXmlWriter(template_file).write(
+        output_file, [(f"Sheet{idx}", sample_values(idx)) for idx in range(sheet_count)])
+    return time.perf_counter() - start
+
+
+class MockComObject:
+    """
+    Stand-in for a pywin32 Excel COM object that counts cross-process round trips.
+
+    Every property read, property write and method call is one round trip.
+    Attribute lookups are lazy: `ws.Range` alone costs nothing, calling it or
+    reading through it does.
+    """
+
+    def __init__(self, counter, resolved=True):
+        object.__setattr__(self, '_counter', counter)
+        object.__setattr__(self, '_resolved', resolved)
+
+    def _resolve(self):
+        if not self._resolved:
+            self._counter['round_trips'] += 1
+            object.__setattr__(self, '_resolved', True)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        self._resolve()
+        return MockComObject(self._counter, resolved=False)
+
+    def __setattr__(self, name, value):
+        self._resolve()
+        self._counter['round_trips'] += 1
+
+    def __call__(self, *args, **kwargs):
+        self._counter['round_trips'] += 1
+        return MockComObject(self._counter)
+
+    def __format__(self, spec):
+        self._resolve()
+        return '1'
+
+    __str__ = __format__
+
+
+def legacy_com_fill(wb_new, template_ws, meters, sheet_names):
+    """The per-cell Excel COM fill loop used before batched writes"""
+    for idx, (meter, sheet_name) in enumerate(zip(meters, sheet_names), 1):
+        if idx == 1:
+            ws_new = wb_new.Worksheets(1)
+            ws_new.Name = sheet_name
+        else:
+            f"DEBUG: Before copy - Count: {wb_new.Worksheets.Count}"
+            template_ws.Copy(None, wb_new.Worksheets(wb_new.Worksheets.Count))
+            f"DEBUG: After copy - Count: {wb_new.Worksheets.Count}"
+            ws_new = wb_new.Worksheets(wb_new.Worksheets.Count)
+            ws_new.Name = sheet_name
+        f"DEBUG: After processing sheet {idx}, workbook has {wb_new.Worksheets.Count} sheets"
+
+        ws_new.Range("B7").Value = f"Serial No: {meter.serial}"
+        ws_new.Range("B8").Value = f"Meter Location : {meter.location}"
+        meter_size = f"DN-{meter.meter_size}" if meter.meter_size else "DN-65"
+        ws_new.Range("B9").Value = f"Meter Size : {meter_size}"
+        if meter.before_unit and meter.before_value is not None:
+            ws_new.Range("I13").Value = f"{meter.before_unit}= BTU*{meter.before_value}"
+        if meter.before_inlet is not None:
+            ws_new.Range("D14").Value = float(meter.before_inlet)
+        if meter.before_outlet is not None:
+            ws_new.Range("D15").Value = float(meter.before_outlet)
+        if meter.before_m3hr is not None:
+            ws_new.Range("F16").Value = float(meter.before_m3hr)
+        if meter.before_inlet and meter.before_outlet:
+            ws_new.Range("D16").Value = abs(float(meter.before_outlet) - float(meter.before_inlet))
+        if meter.after_unit and meter.after_value is not None:
+            ws_new.Range("I19").Value = f"{meter.after_unit}= BTU*{meter.after_value}"
+        if meter.after_inlet is not None:
+            ws_new.Range("D20").Value = float(meter.after_inlet)
+        if meter.after_outlet is not None:
+            ws_new.Range("D21").Value = float(meter.after_outlet)
+        if meter.after_m3hr is not None:
+            ws_new.Range("F22").Value = float(meter.after_m3hr)
+
+
+def count_com_round_trips(template_file, calibration_file):
+    """
+    Count Excel COM round trips for the legacy and the batched fill.
+
+    Returns:
+        (certificate count, legacy round trips, batched round trips)
+    """
+    meters = read_meters(calibration_file)
+    sheet_names = [f"Sheet{idx}" for idx in range(1, len(meters) + 1)]
+
+    legacy = {'round_trips': 0}
+    wb_new = MockComObject(legacy)
+    legacy_com_fill(wb_new, wb_new.Worksheets(1), meters, sheet_names)
+
+    # Run the GUI's Excel engine against a fake win32com.client
+    batched = {'round_trips': 0}
+    win32com = types.ModuleType('win32com')
+    win32com.client = types.ModuleType('win32com.client')
+    win32com.client.Dispatch = lambda prog_id: MockComObject(batched)
+    saved_modules = {name: sys.modules.get(name) for name in ('win32com', 'win32com.client')}
+    sys.modules.update({'win32com': win32com, 'win32com.client': win32com.client})
+    try:
+        from gui_certificate_generator import CertificateGeneratorGUI
+        gui = types.SimpleNamespace()
+        work_dir = tempfile.mkdtemp()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                calibrated = read_meters(calibration_file)
+                calibrate(calibrated)
+                CertificateGeneratorGUI._generate_excel(
+                    gui, calibrated, os.path.join(work_dir, 'out.xlsx'), 'Sheet', template_file)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        for name, module in saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+    return len(meters), legacy['round_trips'], batched['round_trips']
+
+
+def main():
+    """Run the benchmark and print a per-sheet cost table"""
+    default_template = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Base', 'Book1.xlsx')
+
+    parser = argparse.ArgumentParser(description="Benchmark certificate sheet creation")
+    parser.add_argument('--template', default=default_template, help="Template Excel file")
+    parser.add_argument('--sheets', type=int, nargs='+', default=[10, 50, 200],
+                        help="Sheet counts to measure")
+    parser.add_argument('--calibration',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inputFiles',
+                                             'CP TOWER TowerB CALIBRATION Excel sheet.xlsx'),
+                        help="Calibration file used for the COM round trip count")
+    parser.add_argument('--com-only', action='store_true', help="Only run the COM round trip check")
+    args = parser.parse_args()
+
+    if args.com_only:
+        return check_com_round_trips(args.template, args.calibration)
+
+    wb_template = load_workbook(args.template)
+    template_sheet = wb_template[wb_template.sheetnames[0]]
+
+    print("=" * 70)
+    print("  CERTIFICATE SHEET BENCHMARK")
+    print("=" * 70)
+    print(f"Template: {os.path.basename(args.template)}\n")
+    print(f"  {'sheets':>7s}  {'legacy ms/sheet':>16s}  {'stamp ms/sheet':>15s}  {'speedup':>8s}")
+    for sheet_count in args.sheets:
+        legacy = time_legacy(template_sheet, sheet_count)
+        stamp = time_stamp(template_sheet, sheet_count)
+        print(f"  {sheet_count:7d}  {legacy / sheet_count * 1000:16.2f}  "
+              f"{stamp / sheet_count * 1000:15.2f}  {legacy / stamp:7.1f}x")
+    print("=" * 70)
+
+    print(f"\n  {'sheets':>7s}  {'openpyxl ms/sheet':>18s}  {'direct XML ms/sheet':>20s}  {'speedup':>8s}")
+    work_dir = tempfile.mkdtemp()
+    try:
+        for sheet_count in args.sheets:
+            openpyxl_file = time_openpyxl_file(template_sheet, sheet_count, os.path.join(work_dir, 'openpyxl.xlsx'))
+            direct_xml = time_direct_xml_file(args.template, sheet_count, os.path.join(work_dir, 'xml.xlsx'))
+            print(f"  {sheet_count:7d}  {openpyxl_file / sheet_count * 1000:18.2f}  "
+                  f"{direct_xml / sheet_count * 1000:20.2f}  {openpyxl_file / direct_xml:7.1f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("=" * 70)
+
+    wb_template.close()
+
+    return check_com_round_trips(args.template, args.calibration)
+
+
+def check_com_round_trips(template_file, calibration_file):
+    """
+    Print the COM round trip table and check the batched fill against MAX_COM_ROUND_TRIPS_PER_SHEET.
+
+    Returns:
+        Exit code: 0 when within the bound, 1 otherwise
+    """
+    count, legacy_trips, batched_trips = count_com_round_trips(template_file, calibration_file)
+    print(f"\nExcel COM round trips ({count} certificates from {os.path.basename(calibration_file)}):")
+    print(f"  {'':>7s}  {'legacy/sheet':>16s}  {'batched/sheet':>15s}  {'saving':>8s}")
+    print(f"  {'':>7s}  {legacy_trips / count:16.1f}  {batched_trips / count:15.1f}  "
+          f"{legacy_trips / batched_trips:7.1f}x")
+    print("=" * 70)
+    if batched_trips / count > MAX_COM_ROUND_TRIPS_PER_SHEET:
+        print(f"✗ Batched fill needs {batched_trips / count:.1f} round trips per certificate "
+              f"(at most {MAX_COM_ROUND_TRIPS_PER_SHEET})")
+        return 1
+    print(f"✓ Batched fill within {MAX_COM_ROUND_TRIPS_PER_SHEET} round trips per certificate")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Certificate Benchmark Suite
+===========================
+Measures end-to-end certificate generation throughput on synthetic sites.
+
+Synthetic calibration files shaped like the ones in inputFiles/ (section
+row, header row, two blank rows, one meter per row, MWH and KWH meters)
+are generated once per size and kept in the data folder. Every engine is
+then run on every size in a fresh worker process, timing the same phases
+generate_certificates() goes through:
+- extraction: read the calibration file and run the calibration maths
+- template:   parse the template (no template cache)
+- fill:       create the certificate sheets and fill in the meter values
+- save:       write the output .xlsx
+
+Engines:
+- openpyxl:   in-memory workbook stamped from the compiled template
+- streaming:  write-only workbook, sheets written to disk as they are made
+- direct_xml: template sheet XML with the cells substituted (TemplateXmlWriter);
+              its sheets are rendered while the zip is written, so "fill"
+              only builds the cell values and "save" does the rest
+
+Peak RSS is recorded per run. Results are printed as a table and written as
+JSON (with Python, openpyxl and git versions), so runs from two versions can
+be compared with --baseline.
+
+Usage:
+    python benchmark_suite.py
+    python benchmark_suite.py --sizes 10 100 --engines streaming direct_xml
+    python benchmark_suite.py --output results.json --baseline previous.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import openpyxl
+from openpyxl import Workbook
+
+from generation_metrics import peak_rss_mb
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TEMPLATE = os.path.join(BASE_DIR, 'Base', 'Book1.xlsx')
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+ENGINES = ('openpyxl', 'streaming', 'direct_xml')
+PHASES = ('extraction', 'template', 'fill', 'save')
+
+# Bump when the result layout changes
+RESULTS_FORMAT = 1
+
+# Slowdown against the baseline that is reported as a regression
+REGRESSION_THRESHOLD = 1.10
+
+LOCATION_PARTS = ('AHU', 'FCU', 'SHOP', 'ATM (LOBBY)', 'FOOD & COURT', 'OFFICE-WING')
+
+
+def make_calibration_file(path, meter_count, seed=1):
+    """
+    Write a synthetic calibration workbook laid out like the inputFiles/ sheets.
+
+    Args:
+        path: .xlsx file to create
+        meter_count: number of meter rows
+        seed: random seed, so the same size always gives the same file
+    """
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    ws.append([None, None, None, None, 'BEFORE CALIBRATION', None, None, None, None, None, 'AFTER CALIBRATION'])
+    ws.append(['Meter Location', 'Serial No', 'METER SIZE', None,
+               'Outlet Temp/Degree Cel', 'Inlet Temp', 'M3/Hr', 'MWH= ', 'KWH=', None,
+               'Outlet Temp/Degree Cel', 'Inlet Temp', 'M3/Hr', 'MWH= ', 'KWH='])
+    ws.append([])
+    ws.append([])
+    for idx in range(meter_count):
+        location = f"{idx // 20 + 1}TH {LOCATION_PARTS[idx % len(LOCATION_PARTS)]}{idx % 20 + 1}"
+        energy = round(rng.uniform(100, 900), 2)
+        kwh = idx % 4 == 3
+        ws.append([
+            location, 84000000 + idx, rng.choice([25, 32, 50, 65]), None,
+            round(rng.uniform(14, 22), 2), round(rng.uniform(6, 12), 2), round(rng.uniform(1, 25), 3),
+            None if kwh else energy, energy * 1000 if kwh else None, None,
+            round(rng.uniform(14, 22), 2), round(rng.uniform(6, 12), 2), round(rng.uniform(1, 25), 3),
+            None if kwh else energy + 0.01, (energy + 0.01) * 1000 if kwh else None,
+        ])
+    wb.save(path)
+
+
+def synthetic_file(data_dir, meter_count):
+    """Return the synthetic calibration file for `meter_count` meters, creating it if needed"""
+    path = os.path.join(data_dir, f"synthetic_{meter_count}_meters.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        make_calibration_file(path, meter_count)
+    return path
+
+
+def run_case(engine, calibration_file, template_file, output_file):
+    """
+    Worker process entry point: generate one certificate file and time each phase.
+
+    Returns:
+        dict with the phase timings (seconds), certificate count, peak RSS and output size
+    """
+    from calibration_reader import read_meters
+    from calibration_table import calibrate
+    from template_cache import load_template
+    from template_xml_writer import TemplateXmlWriter
+    from universal_certificate_generator import (build_certificate_workbook, certificate_sheet_names,
+                                                 certificate_values, save_certificate_workbook)
+
+    rss_before = peak_rss_mb()
+    timings = {}
+
+    start = time.perf_counter()
+    meters = read_meters(calibration_file)
+    calibrate(meters)
+    timings['extraction'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if engine == 'direct_xml':
+        writer = TemplateXmlWriter(template_file)
+    else:
+        template = load_template(template_file, cache_dir=None)
+    timings['template'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sheet_names = certificate_sheet_names(meters, 'Bench')
+    if engine == 'direct_xml':
+        sheets = [(sheet_name, certificate_values(meter)) for meter, sheet_name in zip(meters, sheet_names)]
+    else:
+        wb_new = build_certificate_workbook(template, meters, sheet_names, streaming=engine == 'streaming')
+    timings['fill'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if engine == 'direct_xml':
+        writer.write(output_file, sheets)
+    else:
+        save_certificate_workbook(wb_new, output_file)
+    timings['save'] = time.perf_counter() - start
+
+    return {
+        'certificates': len(meters),
+        'phases': timings,
+        'rss_before_mb': rss_before,
+        'peak_rss_mb': peak_rss_mb(),
+        'output_mb': os.path.getsize(output_file) / (1024 * 1024),
+    }
+
+
+def run_isolated(engine, calibration_file, template_file, output_file):
+    """Run one case in a fresh process so peak RSS belongs to that case alone"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_case, engine, calibration_file, template_file, output_file).result()
+
+
+def git_revision():
+    """Current git commit of the project, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline):
+    """
+    Compare runs against a baseline result file.
+
+    Returns:
+        list of (engine, meters, total seconds, baseline total seconds, ratio)
+    """
+    previous = {(run['engine'], run['meters']): run for run in baseline.get('runs', [])}
+    comparisons = []
+    for run in results['runs']:
+        old = previous.get((run['engine'], run['meters']))
+        if old:
+            comparisons.append((run['engine'], run['meters'], run['total_s'], old['total_s'],
+                                run['total_s'] / old['total_s']))
+    return comparisons
+
+
+def main():
+    """Run the benchmark suite and write the JSON results"""
+    parser = argparse.ArgumentParser(description="Benchmark certificate generation on synthetic calibration files")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Meter counts to run")
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES), help="Engines to run")
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE, help="Template Excel file")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'certificate_benchmark'),
+                        help="Folder for the synthetic calibration files (reused between runs)")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON results file")
+    parser.add_argument('--baseline', help="Earlier JSON results file to compare against")
+    args = parser.parse_args()
+
+    results = {
+        'format': RESULTS_FORMAT,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'openpyxl': openpyxl.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'template': os.path.basename(args.template),
+        'runs': [],
+    }
+
+    print("=" * 78)
+    print("  CERTIFICATE BENCHMARK SUITE")
+    print("=" * 78)
+    print(f"  {'engine':10s} {'meters':>7s} " + ' '.join(f"{phase:>10s}" for phase in PHASES)
+          + f" {'total s':>8s} {'ms/cert':>8s} {'peak MB':>8s}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for meter_count in args.sizes:
+            calibration_file = synthetic_file(args.data_dir, meter_count)
+            for engine in args.engines:
+                output_file = os.path.join(work_dir, f"{engine}_{meter_count}.xlsx")
+                case = run_isolated(engine, calibration_file, args.template, output_file)
+                os.remove(output_file)
+
+                total = sum(case['phases'].values())
+                run = {'engine': engine, 'meters': meter_count, 'total_s': total,
+                       'ms_per_certificate': total / max(case['certificates'], 1) * 1000}
+                run.update(case)
+                results['runs'].append(run)
+
+                peak = f"{case['peak_rss_mb']:8.0f}" if case['peak_rss_mb'] is not None else f"{'n/a':>8s}"
+                print(f"  {engine:10s} {meter_count:7d} "
+                      + ' '.join(f"{case['phases'][phase]:10.3f}" for phase in PHASES)
+                      + f" {total:8.2f} {run['ms_per_certificate']:8.2f} {peak}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print("=" * 78)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.baseline} (git {baseline.get('git_revision') or 'unknown'}):")
+        for engine, meter_count, total, old_total, ratio in compare_results(results, baseline):
+            flag = "  REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+            print(f"  {engine:10s} {meter_count:7d}  {old_total:8.2f}s -> {total:8.2f}s  ({ratio:5.2f}x){flag}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
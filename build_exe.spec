@@ -13,6 +13,7 @@ a = Analysis(
         'win32com.client',
         'win32com.gen_py',
         'openpyxl',
+        'reportlab',
         'pandas',
         'tkinter',
     ],
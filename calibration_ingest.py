@@ -0,0 +1,244 @@
+"""
+Calibration Ingest
+==================
+Reads the meters of a whole site in one pass, so one generation run covers
+what used to be dozens of single-file runs:
+- every calibration sheet of a workbook (sites that deliver one sheet per
+  floor), and/or
+- every calibration file of a folder or glob pattern (a folder of daily
+  logger files).
+
+Each (file, sheet) source is extracted by calibration_reader; with jobs > 1
+the sources are read in parallel worker processes (openpyxl parsing is CPU
+bound). With all_sheets, sheets without a calibration header row (notes,
+summaries) are skipped.
+
+The meters come back in source order: files sorted by name, sheets in
+workbook order. A serial delivered again, by a later row of the same source
+or by a later source (e.g. the next daily file), replaces the earlier
+reading in place, so every meter gets one certificate with its newest data.
+
+Usage:
+    result = ingest(["incoming/TowerB"], jobs=4)        # every file in a folder
+    result = ingest(["site.xlsx"], all_sheets=True)     # one sheet per floor
+    result = ingest(["daily/*.csv"])
+    for source, count in result.sources:
+        print(source_label(source), count)
+    generate_certificates(["site.xlsx"], "Site.xlsx", "TowerB", template, all_sheets=True)
+
+    python calibration_ingest.py "incoming/TowerB" --all-sheets --jobs 4
+    python -m doctest calibration_ingest.py     (check the de-duplication)
+"""
+
+import argparse
+import glob
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from openpyxl import load_workbook
+
+from calibration_reader import ROW_READERS, read_meters
+
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+DEFAULT_SHEET = 'Sheet1'
+
+# One sheet of a calibration file (sheet is None for CSV and Parquet files)
+CalibrationSource = namedtuple('CalibrationSource', 'file sheet')
+
+# meters:     MeterRecords of all sources, duplicates removed
+# sources:    [(CalibrationSource, meters read from it)], in reading order
+# duplicates: [(serial, replaced source, replacing source)]; both sources are the same for
+#             a serial repeated inside one source
+# origins:    CalibrationSource of every meter (the one its reading came from)
+IngestResult = namedtuple('IngestResult', 'meters sources duplicates origins')
+
+
+class IngestError(ValueError):
+    """A calibration input that cannot be read"""
+
+
+def source_label(source):
+    """Short name of a source for messages: 'file.xlsx' or 'file.xlsx [Floor 2]'"""
+    name = os.path.basename(source.file)
+    return f"{name} [{source.sheet}]" if source.sheet and source.sheet != DEFAULT_SHEET else name
+
+
+def _is_calibration_file(path):
+    name = os.path.basename(path)
+    return (os.path.isfile(path) and not name.startswith('~$')
+            and os.path.splitext(name)[1].lower() in ROW_READERS)
+
+
+def calibration_files(inputs):
+    """
+    Expand files, folders and glob patterns into calibration files.
+
+    Folders contribute the calibration files directly inside them; Excel lock
+    files (~$*.xlsx) and unsupported file types found that way are skipped.
+
+    Args:
+        inputs: list of file names, folders and glob patterns
+
+    Returns:
+        list of paths, sorted by name within each input, without repeats
+    """
+    files = []
+    for pattern in inputs:
+        if glob.has_magic(pattern):
+            matches = [path for path in sorted(glob.glob(pattern, recursive=True)) if _is_calibration_file(path)]
+            if not matches:
+                raise IngestError(f"No calibration files match {pattern}")
+        elif os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))
+                       if _is_calibration_file(os.path.join(pattern, name))]
+            if not matches:
+                raise IngestError(f"No calibration files in {pattern}")
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            raise IngestError(f"File not found: {pattern}")
+        for path in matches:
+            if os.path.abspath(path) not in map(os.path.abspath, files):
+                files.append(path)
+    return files
+
+
+def calibration_sources(inputs, all_sheets=False):
+    """
+    List the (file, sheet) sources to read.
+
+    Args:
+        inputs: list of files, folders and glob patterns
+        all_sheets: Every worksheet of the Excel files instead of Sheet1 only
+
+    Returns:
+        list of CalibrationSource
+    """
+    sources = []
+    for calibration_file in calibration_files(inputs):
+        if os.path.splitext(calibration_file)[1].lower() not in EXCEL_EXTENSIONS:
+            sources.append(CalibrationSource(calibration_file, None))
+        elif not all_sheets:
+            sources.append(CalibrationSource(calibration_file, DEFAULT_SHEET))
+        else:
+            wb_cal = load_workbook(calibration_file, read_only=True)
+            try:
+                sheet_names = wb_cal.sheetnames
+            finally:
+                wb_cal.close()
+            sources.extend(CalibrationSource(calibration_file, sheet) for sheet in sheet_names)
+    return sources
+
+
+def read_source(source, require_header=False):
+    """
+    Read the meters of one source (runs in a worker process with jobs > 1).
+
+    Returns:
+        list of MeterRecords
+    """
+    try:
+        return read_meters(source.file, source.sheet or DEFAULT_SHEET, require_header)
+    except Exception as e:
+        raise IngestError(f"{source_label(source)}: {type(e).__name__}: {e}") from e
+
+
+def merge_sources(results):
+    """
+    Join the meters of several sources, one record per serial.
+
+    A repeated serial, inside one source or in a later one, replaces the
+    earlier reading at the earlier position (the last reading wins):
+
+        >>> from types import SimpleNamespace as Meter
+        >>> merged = merge_sources([('a', [Meter(serial='X', reading=1), Meter(serial='Y', reading=1),
+        ...                                Meter(serial='x', reading=2)]),
+        ...                         ('b', [Meter(serial='X', reading=3)])])
+        >>> [(meter.serial, meter.reading) for meter in merged.meters], merged.origins
+        ([('X', 3), ('Y', 1)], ['b', 'a'])
+        >>> merged.duplicates
+        [('x', 'a', 'a'), ('X', 'a', 'b')]
+
+    Args:
+        results: [(CalibrationSource, list of MeterRecords)] in source order
+
+    Returns:
+        IngestResult
+    """
+    meters = []
+    origins = []
+    position = {}  # serial -> (index in meters, source)
+    duplicates = []
+    for source, source_meters in results:
+        for meter in source_meters:
+            key = meter.serial.upper()
+            if key in position:
+                idx, earlier = position[key]
+                meters[idx] = meter
+                origins[idx] = source
+                duplicates.append((meter.serial, earlier, source))
+            else:
+                idx = len(meters)
+                meters.append(meter)
+                origins.append(source)
+            position[key] = (idx, source)
+    return IngestResult(meters, [(source, len(source_meters)) for source, source_meters in results],
+                        duplicates, origins)
+
+
+def ingest(inputs, all_sheets=False, jobs=1):
+    """
+    Read the meters of several calibration sheets and files for one generation pass.
+
+    Args:
+        inputs: Calibration file, folder or glob pattern, or a list of them
+        all_sheets: Read every calibration sheet of the Excel files, not only Sheet1
+        jobs: Number of worker processes reading sources in parallel
+
+    Returns:
+        IngestResult
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    sources = calibration_sources(inputs, all_sheets)
+
+    # With all_sheets, worksheets that are not a calibration table are skipped
+    require_header = [all_sheets and source.sheet is not None for source in sources]
+    jobs = min(jobs, len(sources))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            meters = list(executor.map(read_source, sources, require_header))
+    else:
+        meters = [read_source(source, required) for source, required in zip(sources, require_header)]
+    return merge_sources([(source, source_meters) for source, source_meters, required
+                          in zip(sources, meters, require_header) if source_meters or not required])
+
+
+def main():
+    """List the meters a set of calibration inputs yields"""
+    parser = argparse.ArgumentParser(description="Read the meters of several calibration sheets or files")
+    parser.add_argument('inputs', nargs='+', help="Calibration files, folders or glob patterns")
+    parser.add_argument('--all-sheets', action='store_true', help="Read every sheet of the Excel files")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Worker processes (default: 1)")
+    args = parser.parse_args()
+
+    try:
+        result = ingest(args.inputs, args.all_sheets, args.jobs)
+    except IngestError as e:
+        print(f"ERROR: {e}")
+        return 1
+
+    for source, count in result.sources:
+        print(f"  {count:5d} meters  {source_label(source)}")
+    for serial, earlier, later in result.duplicates:
+        print(f"  ! Serial {serial}: {source_label(later)} replaces {source_label(earlier)}")
+    print(f"✓ {len(result.meters)} meters from {len(result.sources)} source(s), "
+          f"{len(result.duplicates)} duplicate(s) replaced")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
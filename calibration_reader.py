@@ -0,0 +1,385 @@
+"""
+Calibration Reader
+==================
+Reads meter rows from a calibration file: Excel (.xlsx/.xlsm), CSV from the
+data loggers, or Parquet from the data warehouse.
+
+A row reader per file type streams the file as plain value tuples, and the
+same meter extraction runs on top of all of them:
+- xlsx:    opened read-only with cached values (read_only=True, data_only=True)
+- csv:     the csv module; the delimiter (, ; tab |) is detected, empty
+           cells become None and numbers become int/float like in Excel
+           (decimal commas are accepted when the delimiter is not a comma)
+- parquet: pyarrow (optional dependency), read in record batches; the
+           column names are the header row
+All of them keep memory constant however long the file is. More file types
+can be added with register_row_reader().
+
+Column positions are resolved ONCE from the header row, so a calibration
+sheet with a different column order only needs matching headers, not code
+edits. Besides the Excel headers below, a header may be a field name such
+as before_inlet or after_kwh (flat CSV/Parquet exports).
+
+Every meter row becomes a MeterRecord: a small __slots__ object with one
+attribute per field (meter.location, meter.before_inlet, ...), which takes a
+fraction of the memory of a 13-key dict and needs no string hashing per
+field lookup.
+
+Readings are kept as they appear in the sheet; calibration_table.calibrate()
+turns them into floats and fills in the derived before/after Delta T.
+
+Expected layout (as in inputFiles/):
+    Row 1:  ...  BEFORE CALIBRATION  ...  AFTER CALIBRATION  ...
+    Row 2:  Meter Location | Serial No | METER SIZE | | Outlet Temp | Inlet Temp
+            | M3/Hr | MWH= | KWH= | | Outlet Temp | Inlet Temp | M3/Hr | MWH= | KWH=
+    Row 5+: one meter per row
+
+Usage:
+    meters = read_meters("CP TOWER TowerB CALIBRATION Excel sheet.xlsx")
+    meters = read_meters("logger_export.csv")
+    for meter in iter_meters("warehouse_export.parquet"):
+        print(meter.location, meter.serial, meter.before_inlet)
+"""
+
+import csv
+import os
+
+from openpyxl import load_workbook
+
+
+# Column positions used when no header row can be found (columns A..O)
+DEFAULT_COLUMNS = {
+    'location': 0,
+    'serial': 1,
+    'meter_size': 2,
+    'before_outlet': 4,
+    'before_inlet': 5,
+    'before_m3hr': 6,
+    'before_mwh': 7,
+    'before_kwh': 8,
+    'after_outlet': 10,
+    'after_inlet': 11,
+    'after_m3hr': 12,
+    'after_mwh': 13,
+    'after_kwh': 14,
+}
+DEFAULT_FIRST_ROW = 5
+
+# Header text prefixes (upper case) for each field; before/after is decided by section
+HEADER_PREFIXES = (
+    ('location', ('METER LOCATION', 'LOCATION')),
+    ('serial', ('SERIAL',)),
+    ('meter_size', ('METER SIZE', 'SIZE')),
+    ('outlet', ('OUTLET',)),
+    ('inlet', ('INLET',)),
+    ('m3hr', ('M3/HR', 'M3HR')),
+    ('mwh', ('MWH',)),
+    ('kwh', ('KWH',)),
+)
+SECTION_FIELDS = ('outlet', 'inlet', 'm3hr', 'mwh', 'kwh')
+
+# Number of rows searched for the header row
+HEADER_SEARCH_ROWS = 10
+
+# CSV: bytes looked at to detect the delimiter, and the delimiters accepted
+CSV_SNIFF_BYTES = 64 * 1024
+CSV_DELIMITERS = ',;\t|'
+
+# Parquet rows decoded at a time
+PARQUET_BATCH_ROWS = 10000
+
+# MeterRecord fields, in order (the Delta T fields are derived, not read)
+METER_FIELDS = (
+    'location', 'serial', 'meter_size',
+    'before_inlet', 'before_outlet', 'before_m3hr', 'before_unit', 'before_value',
+    'after_inlet', 'after_outlet', 'after_m3hr', 'after_unit', 'after_value',
+    'before_delta_t', 'after_delta_t',
+)
+
+
+class MeterRecord:
+    """One meter row of a calibration sheet"""
+
+    __slots__ = METER_FIELDS
+
+    def __init__(self, location, serial, meter_size=None,
+                 before_inlet=None, before_outlet=None, before_m3hr=None, before_unit=None, before_value=None,
+                 after_inlet=None, after_outlet=None, after_m3hr=None, after_unit=None, after_value=None,
+                 before_delta_t=None, after_delta_t=None):
+        self.location = location
+        self.serial = serial
+        self.meter_size = meter_size
+        self.before_inlet = before_inlet
+        self.before_outlet = before_outlet
+        self.before_m3hr = before_m3hr
+        self.before_unit = before_unit
+        self.before_value = before_value
+        self.after_inlet = after_inlet
+        self.after_outlet = after_outlet
+        self.after_m3hr = after_m3hr
+        self.after_unit = after_unit
+        self.after_value = after_value
+        self.before_delta_t = before_delta_t  # Derived by calibration_table.calibrate()
+        self.after_delta_t = after_delta_t
+
+    def as_dict(self):
+        """Return the fields as a {field: value} dict"""
+        return {field: getattr(self, field) for field in METER_FIELDS}
+
+    def __eq__(self, other):
+        if not isinstance(other, MeterRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in METER_FIELDS)
+
+    def __repr__(self):
+        return f"MeterRecord(location={self.location!r}, serial={self.serial!r})"
+
+
+def _header_field(text):
+    """Return the field a header cell refers to, or None"""
+    text = str(text).strip().upper()
+    name = text.lower().replace(' ', '_')
+    if name in DEFAULT_COLUMNS:
+        return name  # Already a field name, e.g. "before_inlet" in a flat export
+    for field, prefixes in HEADER_PREFIXES:
+        if text.startswith(prefixes):
+            return field
+    return None
+
+
+def resolve_columns(header_rows):
+    """
+    Resolve field -> column index from the first rows of a calibration sheet.
+
+    Args:
+        header_rows: list of value tuples (the first rows of the sheet)
+
+    Returns:
+        (columns, first_row): column index map and the first data row number
+        (1-based), or (DEFAULT_COLUMNS, DEFAULT_FIRST_ROW) if no header is found
+    """
+    for header_idx, header in enumerate(header_rows):
+        fields = [_header_field(value) if value is not None else None for value in header]
+        if 'location' not in fields or 'serial' not in fields:
+            continue
+
+        # "AFTER CALIBRATION" in the section row above marks where the after block starts
+        after_start = None
+        if header_idx > 0:
+            for col_idx, value in enumerate(header_rows[header_idx - 1]):
+                if value is not None and 'AFTER' in str(value).upper():
+                    after_start = col_idx
+                    break
+
+        columns = {}
+        for col_idx, field in enumerate(fields):
+            if field is None:
+                continue
+            if field in SECTION_FIELDS:
+                if after_start is not None:
+                    section = 'after' if col_idx >= after_start else 'before'
+                else:
+                    section = 'after' if f'before_{field}' in columns else 'before'
+                field = f'{section}_{field}'
+            columns.setdefault(field, col_idx)
+        return columns, header_idx + 2
+
+    return DEFAULT_COLUMNS, DEFAULT_FIRST_ROW
+
+
+def _energy(mwh, kwh):
+    """Pick the MWH reading first, then KWH: returns (unit, value)"""
+    if mwh:
+        return 'MWH', mwh
+    if kwh:
+        return 'KWH', kwh
+    return None, None
+
+
+def meter_from_row(values, columns):
+    """
+    Build a MeterRecord from one row of values.
+
+    Args:
+        values: tuple of cell values for the row
+        columns: field -> column index map from resolve_columns()
+
+    Returns:
+        MeterRecord, or None if the row has no location and serial
+    """
+    def get(field):
+        idx = columns.get(field)
+        if idx is None or idx >= len(values):
+            return None
+        return values[idx]
+
+    location = get('location')
+    serial = get('serial')
+    if not (location and serial):
+        return None
+
+    before_unit, before_value = _energy(get('before_mwh'), get('before_kwh'))
+    after_unit, after_value = _energy(get('after_mwh'), get('after_kwh'))
+
+    return MeterRecord(
+        location=str(location).strip(),
+        serial=str(serial).strip(),
+        meter_size=get('meter_size'),
+        before_inlet=get('before_inlet'),
+        before_outlet=get('before_outlet'),
+        before_m3hr=get('before_m3hr'),
+        before_unit=before_unit,
+        before_value=before_value,
+        after_inlet=get('after_inlet'),
+        after_outlet=get('after_outlet'),
+        after_m3hr=get('after_m3hr'),
+        after_unit=after_unit,
+        after_value=after_value,
+    )
+
+
+def _xlsx_rows(calibration_file, sheet_name):
+    """Rows of an Excel worksheet as value tuples"""
+    wb_cal = load_workbook(calibration_file, read_only=True, data_only=True)
+    try:
+        yield from wb_cal[sheet_name].iter_rows(values_only=True)
+    finally:
+        wb_cal.close()
+
+
+def _csv_number(text, decimal_comma):
+    """CSV cell text -> None, int, float or the stripped text"""
+    text = text.strip()
+    if not text:
+        return None
+    if text.isdigit():
+        if len(text) > 1 and text[0] == '0':
+            return text  # Serial numbers like 0084001234 keep their leading zeros
+        return int(text)
+    try:
+        return float(text.replace(',', '.') if decimal_comma else text)
+    except ValueError:
+        return text
+
+
+def _csv_rows(calibration_file, sheet_name=None):
+    """Rows of a CSV file as value tuples (sheet_name is ignored)"""
+    with open(calibration_file, 'r', encoding='utf-8-sig', newline='') as f:
+        sample = f.read(CSV_SNIFF_BYTES)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS)
+        except csv.Error:
+            dialect = csv.excel
+        decimal_comma = dialect.delimiter != ','
+        for row in csv.reader(f, dialect):
+            yield tuple(_csv_number(text, decimal_comma) for text in row)
+
+
+def _parquet_rows(calibration_file, sheet_name=None):
+    """Rows of a Parquet file as value tuples, the column names first (sheet_name is ignored)"""
+    try:
+        import pyarrow.parquet as pq
+        import pyarrow.types as pa_types
+    except ImportError:
+        raise ImportError("Reading Parquet files needs pyarrow (pip install pyarrow)")
+    parquet_file = pq.ParquetFile(calibration_file)
+    try:
+        schema = parquet_file.schema_arrow
+        # Whole floats become int, as openpyxl returns them ("DN-65", not "DN-65.0")
+        float_columns = [pa_types.is_floating(field.type) for field in schema]
+        yield tuple(schema.names)
+        for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS):
+            columns = []
+            for column, is_float in zip(batch.columns, float_columns):
+                values = column.to_pylist()
+                if is_float:
+                    values = [int(value) if value is not None and value.is_integer() else value
+                              for value in values]
+                columns.append(values)
+            yield from zip(*columns)
+    finally:
+        parquet_file.close()
+
+
+# File extension -> function(calibration_file, sheet_name) yielding row value tuples
+ROW_READERS = {
+    '.xlsx': _xlsx_rows,
+    '.xlsm': _xlsx_rows,
+    '.csv': _csv_rows,
+    '.txt': _csv_rows,
+    '.parquet': _parquet_rows,
+}
+
+
+def register_row_reader(extension, reader):
+    """
+    Add (or replace) the row reader for a file extension.
+
+    Args:
+        extension: File extension including the dot, e.g. '.tsv'
+        reader: function(calibration_file, sheet_name) yielding one tuple of values per row
+    """
+    ROW_READERS[extension.lower()] = reader
+
+
+def iter_rows(calibration_file, sheet_name='Sheet1'):
+    """
+    Stream the rows of a calibration file with the reader for its extension.
+
+    Args:
+        calibration_file: Path to the calibration file
+        sheet_name: Worksheet holding the calibration table (Excel files only)
+
+    Returns:
+        iterator of row value tuples
+    """
+    extension = os.path.splitext(calibration_file)[1].lower()
+    reader = ROW_READERS.get(extension)
+    if reader is None:
+        raise ValueError(f"Unsupported calibration file type '{extension}' "
+                         f"(supported: {', '.join(sorted(ROW_READERS))})")
+    return reader(calibration_file, sheet_name)
+
+
+def iter_meters(calibration_file, sheet_name='Sheet1', require_header=False):
+    """
+    Stream MeterRecords from a calibration file.
+
+    Args:
+        calibration_file: Path to the calibration file (.xlsx, .csv, .parquet, ...)
+        sheet_name: Worksheet holding the calibration table (Excel files only)
+        require_header: Yield nothing when no header row is found, instead of
+            reading the default columns (for sheets that may not be a
+            calibration table, e.g. a notes sheet)
+
+    Yields:
+        MeterRecord per meter row, in sheet order
+    """
+    rows = iter_rows(calibration_file, sheet_name)
+    try:
+        header_rows = []
+        for values in rows:
+            header_rows.append(values)
+            if len(header_rows) == HEADER_SEARCH_ROWS:
+                break
+        columns, first_row = resolve_columns(header_rows)
+        if require_header and columns is DEFAULT_COLUMNS:
+            return
+
+        for row_num, values in enumerate(header_rows, 1):
+            if row_num >= first_row:
+                meter = meter_from_row(values, columns)
+                if meter:
+                    yield meter
+        for values in rows:
+            meter = meter_from_row(values, columns)
+            if meter:
+                yield meter
+    finally:
+        rows.close()
+
+
+def read_meters(calibration_file, sheet_name='Sheet1', require_header=False):
+    """Return the list of MeterRecords in a calibration file"""
+    return list(iter_meters(calibration_file, sheet_name, require_header))
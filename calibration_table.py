@@ -0,0 +1,262 @@
+"""
+Calibration Table
+=================
+Vectorised calibration maths over a whole site.
+
+The readings of all meters are loaded into NumPy columns once. A single
+pass then computes:
+- numeric inlet / outlet / flow readings (non-numeric cells become missing)
+- Delta T before and after calibration, and its change
+- flow percent error of the "before" reading against the "after"
+  (calibrated) reading
+- energy registers normalised to MWH (KWH / 1000) and the energy counted
+  between the two readings
+- masks for incomplete readings, out-of-tolerance flow (only with a
+  tolerance) and energy registers that ran backwards
+
+The flow error uses the "after" reading as the reference: it is the one
+taken once the meter was calibrated. A meter is recalibrated because its
+"before" reading was off, so on most sites many meters are well outside
+any tolerance; the tolerance check is therefore opt-in (--tolerance).
+Energy registers that go down by less than ENERGY_TOLERANCE_MWH (1 KWH)
+are reading noise and are not flagged.
+
+calibrate() stores the typed readings and Delta T back on each MeterRecord,
+so the sheet writers only place precomputed values. The summary works
+without rendering any sheets, which makes it cheap for very large sites.
+
+Usage:
+    python calibration_table.py "CP TOWER TowerB CALIBRATION Excel sheet.xlsx"
+    python calibration_table.py calibration.xlsx --tolerance 5 --json
+
+    table = calibrate(meters)
+    print(table.summary())
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+
+# Readings converted to float columns
+READING_FIELDS = ('before_inlet', 'before_outlet', 'before_m3hr',
+                  'after_inlet', 'after_outlet', 'after_m3hr')
+
+# Largest accepted |flow percent error| between the before and after readings
+# (None: no flow tolerance check, see the module docstring)
+DEFAULT_TOLERANCE_PERCENT = None
+
+# Smallest drop of an energy register that counts as running backwards
+ENERGY_TOLERANCE_MWH = 0.001
+
+# Energy unit -> factor to MWH
+ENERGY_TO_MWH = {'MWH': 1.0, 'KWH': 0.001}
+
+
+def _to_float(value):
+    """Cell value -> float, or NaN when it is missing or not a number"""
+    if value is None or isinstance(value, bool):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _column(meters, field):
+    """Float column of one MeterRecord field"""
+    return np.fromiter((_to_float(getattr(meter, field)) for meter in meters),
+                       dtype=np.float64, count=len(meters))
+
+
+def _percent_error(measured, reference):
+    """(measured - reference) / reference in percent; NaN where the reference is 0 or missing"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        error = (measured - reference) / reference * 100.0
+    error[~np.isfinite(error)] = np.nan
+    return error
+
+
+def _optional(value):
+    """NumPy float -> Python float, NaN -> None"""
+    return None if np.isnan(value) else float(value)
+
+
+class CalibrationTable:
+    """Columnar calibration data and derived values for a list of MeterRecords"""
+
+    def __init__(self, meters, tolerance_percent=DEFAULT_TOLERANCE_PERCENT):
+        """
+        Args:
+            meters: list of MeterRecords
+            tolerance_percent: largest accepted |flow percent error|, or None
+                to not check the flow error
+        """
+        self.meters = meters
+        self.tolerance_percent = tolerance_percent
+
+        for field in READING_FIELDS:
+            setattr(self, field, _column(meters, field))
+
+        self.before_delta_t = np.abs(self.before_outlet - self.before_inlet)
+        self.after_delta_t = np.abs(self.after_outlet - self.after_inlet)
+        self.delta_t_change = self.after_delta_t - self.before_delta_t
+        self.flow_change = self.after_m3hr - self.before_m3hr
+
+        # The "after" reading is the calibrated reference
+        self.flow_error_percent = _percent_error(self.before_m3hr, self.after_m3hr)
+
+        self.before_mwh = self._energy_mwh('before')
+        self.after_mwh = self._energy_mwh('after')
+        self.energy_mwh = self.after_mwh - self.before_mwh
+
+        readings = np.column_stack([getattr(self, field) for field in READING_FIELDS]) \
+            if meters else np.empty((0, len(READING_FIELDS)))
+        self.incomplete = np.isnan(readings).any(axis=1)
+        with np.errstate(invalid='ignore'):
+            if tolerance_percent is None:
+                self.out_of_tolerance = np.zeros(len(meters), dtype=bool)
+            else:
+                self.out_of_tolerance = np.abs(self.flow_error_percent) > tolerance_percent
+            self.energy_decreased = self.energy_mwh <= -ENERGY_TOLERANCE_MWH
+
+    def _energy_mwh(self, section):
+        """Energy readings of one section normalised to MWH"""
+        units = [getattr(meter, f'{section}_unit') for meter in self.meters]
+        factors = np.array([ENERGY_TO_MWH.get(unit, np.nan) for unit in units], dtype=np.float64)
+        return _column(self.meters, f'{section}_value') * factors
+
+    def __len__(self):
+        return len(self.meters)
+
+    def store_on_meters(self):
+        """Write the typed readings and Delta T back onto the MeterRecords"""
+        columns = [getattr(self, field).tolist() for field in READING_FIELDS]
+        before_delta_t = self.before_delta_t.tolist()
+        after_delta_t = self.after_delta_t.tolist()
+        for idx, meter in enumerate(self.meters):
+            for field, column in zip(READING_FIELDS, columns):
+                value = column[idx]
+                setattr(meter, field, None if value != value else value)  # NaN -> None
+            meter.before_delta_t = None if before_delta_t[idx] != before_delta_t[idx] else before_delta_t[idx]
+            meter.after_delta_t = None if after_delta_t[idx] != after_delta_t[idx] else after_delta_t[idx]
+
+    def flagged(self):
+        """Return [(MeterRecord, reasons)] for incomplete, out-of-tolerance or decreasing meters"""
+        flagged = []
+        for idx in np.flatnonzero(self.incomplete | self.out_of_tolerance | self.energy_decreased):
+            reasons = []
+            if self.incomplete[idx]:
+                reasons.append("incomplete readings")
+            if self.out_of_tolerance[idx]:
+                reasons.append(f"flow error {self.flow_error_percent[idx]:+.1f}%")
+            if self.energy_decreased[idx]:
+                reasons.append(f"energy register went down by {-self.energy_mwh[idx]:.3f} MWH")
+            flagged.append((self.meters[idx], reasons))
+        return flagged
+
+    def summary(self):
+        """Return site-level statistics as a plain dict"""
+        def stats(values):
+            values = values[~np.isnan(values)]
+            if not len(values):
+                return None
+            return {'mean': float(values.mean()), 'min': float(values.min()), 'max': float(values.max())}
+
+        return {
+            'meters': len(self),
+            'incomplete': int(self.incomplete.sum()),
+            'out_of_tolerance': int(self.out_of_tolerance.sum()),
+            'energy_decreased': int(self.energy_decreased.sum()),
+            'tolerance_percent': self.tolerance_percent,
+            'before_delta_t': stats(self.before_delta_t),
+            'after_delta_t': stats(self.after_delta_t),
+            'flow_error_percent': stats(self.flow_error_percent),
+            'delta_t_change': stats(self.delta_t_change),
+            'energy_mwh_total': float(np.nansum(self.energy_mwh)),
+            'flagged': [{'location': meter.location, 'serial': meter.serial, 'reasons': reasons}
+                        for meter, reasons in self.flagged()],
+        }
+
+    def row(self, idx):
+        """Derived values of one meter as a dict (NaN as None)"""
+        return {
+            'before_delta_t': _optional(self.before_delta_t[idx]),
+            'after_delta_t': _optional(self.after_delta_t[idx]),
+            'delta_t_change': _optional(self.delta_t_change[idx]),
+            'flow_change': _optional(self.flow_change[idx]),
+            'flow_error_percent': _optional(self.flow_error_percent[idx]),
+            'before_mwh': _optional(self.before_mwh[idx]),
+            'after_mwh': _optional(self.after_mwh[idx]),
+            'energy_mwh': _optional(self.energy_mwh[idx]),
+            'incomplete': bool(self.incomplete[idx]),
+            'out_of_tolerance': bool(self.out_of_tolerance[idx]),
+            'energy_decreased': bool(self.energy_decreased[idx]),
+        }
+
+
+def calibrate(meters, tolerance_percent=DEFAULT_TOLERANCE_PERCENT):
+    """
+    Run the calibration stage over all meters.
+
+    Readings on the MeterRecords are replaced by floats (None when missing
+    or not a number) and before_delta_t / after_delta_t are filled in.
+
+    Args:
+        meters: list of MeterRecords
+        tolerance_percent: largest accepted |flow percent error|, or None
+            to not check the flow error
+
+    Returns:
+        CalibrationTable
+    """
+    table = CalibrationTable(meters, tolerance_percent)
+    table.store_on_meters()
+    return table
+
+
+def main():
+    """Print a calibration summary for a calibration file"""
+    from calibration_reader import read_meters
+
+    parser = argparse.ArgumentParser(description="Summarise a calibration file without generating certificates")
+    parser.add_argument('calibration_file', help="Calibration Excel file")
+    parser.add_argument('--sheet', default='Sheet1', help="Worksheet with the calibration table")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE_PERCENT,
+                        help="Flag meters whose |flow percent error| is larger than this "
+                             "(default: no flow check)")
+    parser.add_argument('--json', action='store_true', help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    table = CalibrationTable(read_meters(args.calibration_file, args.sheet), args.tolerance)
+    summary = table.summary()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+
+    print("=" * 70)
+    print("  CALIBRATION SUMMARY")
+    print("=" * 70)
+    print(f"Meters:            {summary['meters']}")
+    print(f"Incomplete:        {summary['incomplete']}")
+    if args.tolerance is not None:
+        print(f"Out of tolerance:  {summary['out_of_tolerance']} (flow error > {args.tolerance}%)")
+    print(f"Energy decreased:  {summary['energy_decreased']}")
+    print(f"Energy counted:    {summary['energy_mwh_total']:.3f} MWH")
+    for key, label in (('before_delta_t', 'Delta T before'), ('after_delta_t', 'Delta T after'),
+                       ('delta_t_change', 'Delta T change'), ('flow_error_percent', 'Flow error %')):
+        if summary[key]:
+            print(f"{label + ':':19s}mean {summary[key]['mean']:8.2f}   "
+                  f"min {summary[key]['min']:8.2f}   max {summary[key]['max']:8.2f}")
+    if summary['flagged']:
+        print("\nFlagged meters:")
+        for entry in summary['flagged']:
+            print(f"  {entry['location']:30s} {entry['serial']:12s} {', '.join(entry['reasons'])}")
+    print("=" * 70)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
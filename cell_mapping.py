@@ -0,0 +1,287 @@
+"""
+Cell Mapping
+============
+Describes which meter fields go into which template cells, so every engine
+(openpyxl, streaming, direct_xml, Excel COM, PDF) fills certificates the
+same way and templates of other clients only need a mapping file.
+
+A mapping file is JSON (or YAML when PyYAML is installed) with one entry
+per target cell:
+
+    {
+        "cells": {
+            "B7":  {"format": "Serial No: {serial}"},
+            "B9":  {"format": "Meter Size : DN-{meter_size}", "defaults": {"meter_size": 65},
+                    "missing": [0]},
+            "D14": "before_inlet",
+            "D16": {"source": "before_delta_t", "digits": 2}
+        }
+    }
+
+Entries:
+- "field" or {"source": "field"}: the meter field as is (numbers stay numbers)
+    "transform": upper, lower, strip, str, int, float or abs
+    "digits":    round to this many decimals
+    "default":   value written when the field is missing
+- {"format": "text {field}"}: str.format text over meter fields
+    "defaults":  {field: value} used when a field is missing
+    "require":   fields that must be present (default: every field without a default)
+Both kinds take "missing": a list of further values that count as missing
+(e.g. [0] for a meter size of 0).
+
+A field is missing when it is None or an empty string; a cell whose value
+comes out missing is not written, so the template contents stay. Field
+names are the MeterRecord fields (calibration_reader.METER_FIELDS).
+
+The mapping is compiled once into (row, column, coordinate, setter) entries,
+so filling a sheet is one function call per cell with no coordinate parsing.
+
+A template uses the mapping file next to it (<template name>.mapping.json,
+.yaml or .yml); templates without one use Base/Book1.mapping.json.
+
+Usage:
+    mapping = read_mapping(mapping_file_for("Base/Book1.xlsx"))
+    values = mapping.values(meter)          # {"B7": "Serial No: 84089186", ...}
+    for row, column, value in mapping.cells(meter):
+        ws.cell(row=row, column=column).value = value
+
+    python cell_mapping.py Base/Book1.xlsx  (check a template's mapping)
+"""
+
+import hashlib
+import json
+import os
+import string
+import sys
+
+from openpyxl.utils.cell import coordinate_to_tuple
+
+from calibration_reader import METER_FIELDS
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MAPPING_FILE = os.path.join(BASE_DIR, 'Base', 'Book1.mapping.json')
+MAPPING_SUFFIXES = ('.mapping.json', '.mapping.yaml', '.mapping.yml')
+
+TRANSFORMS = {
+    'upper': lambda value: str(value).upper(),
+    'lower': lambda value: str(value).lower(),
+    'strip': lambda value: str(value).strip(),
+    'str': str,
+    'int': int,
+    'float': float,
+    'abs': abs,
+}
+
+SOURCE_KEYS = {'source', 'transform', 'digits', 'default', 'missing'}
+FORMAT_KEYS = {'format', 'defaults', 'require', 'missing'}
+
+
+class MappingError(ValueError):
+    """A mapping file that cannot be compiled"""
+
+
+def _missing(value, extra=()):
+    return value is None or value == '' or value in extra
+
+
+def _extra_missing(coordinate, entry):
+    """The entry's "missing" values as a tuple"""
+    extra = entry.get('missing', [])
+    if not isinstance(extra, list):
+        raise MappingError(f"{coordinate}: 'missing' must be a list of values, got {extra!r}")
+    return tuple(extra)
+
+
+def _check_field(coordinate, field):
+    if field not in METER_FIELDS:
+        raise MappingError(f"{coordinate}: unknown meter field {field!r} "
+                           f"(expected one of {', '.join(METER_FIELDS)})")
+
+
+def _source_setter(coordinate, entry):
+    """Setter for a {"source": field} entry"""
+    field = entry['source']
+    _check_field(coordinate, field)
+    transform = entry.get('transform')
+    if transform is not None and transform not in TRANSFORMS:
+        raise MappingError(f"{coordinate}: unknown transform {transform!r} "
+                           f"(expected one of {', '.join(TRANSFORMS)})")
+    transform = TRANSFORMS.get(transform)
+    digits = entry.get('digits')
+    default = entry.get('default')
+    extra = _extra_missing(coordinate, entry)
+
+    def setter(meter):
+        value = getattr(meter, field)
+        if _missing(value, extra):
+            return default
+        if transform is not None:
+            value = transform(value)
+        if digits is not None:
+            value = round(value, digits)
+        return value
+
+    return setter
+
+
+def _format_setter(coordinate, entry):
+    """Setter for a {"format": text} entry"""
+    text = entry['format']
+    try:
+        fields = [name for _, name, _, _ in string.Formatter().parse(text) if name is not None]
+    except ValueError as e:
+        raise MappingError(f"{coordinate}: invalid format {text!r} ({e})")
+    for field in fields:
+        if not field:
+            raise MappingError(f"{coordinate}: format fields must be named, e.g. {{serial}}")
+        _check_field(coordinate, field)
+    fields = tuple(dict.fromkeys(fields))
+    defaults = dict(entry.get('defaults') or {})
+    for field in defaults:
+        _check_field(coordinate, field)
+    required = entry.get('require')
+    if required is None:
+        required = [field for field in fields if field not in defaults]
+    for field in required:
+        _check_field(coordinate, field)
+    required = frozenset(required)
+    extra = _extra_missing(coordinate, entry)
+
+    def setter(meter):
+        args = {}
+        for field in fields:
+            value = getattr(meter, field)
+            if _missing(value, extra):
+                if field in required:
+                    return None
+                value = defaults.get(field, '')
+            args[field] = value
+        return text.format_map(args)
+
+    return setter
+
+
+def _compile_entry(coordinate, entry):
+    """Return the setter function for one cell entry"""
+    if isinstance(entry, str):
+        entry = {'source': entry}
+    if not isinstance(entry, dict):
+        raise MappingError(f"{coordinate}: expected a field name or an object, got {entry!r}")
+    if ('source' in entry) == ('format' in entry):
+        raise MappingError(f"{coordinate}: needs exactly one of 'source' and 'format'")
+    allowed = SOURCE_KEYS if 'source' in entry else FORMAT_KEYS
+    unknown = set(entry) - allowed
+    if unknown:
+        raise MappingError(f"{coordinate}: unknown keys {', '.join(sorted(unknown))}")
+    if 'source' in entry:
+        return _source_setter(coordinate, entry)
+    return _format_setter(coordinate, entry)
+
+
+class CellMapping:
+    """A compiled mapping: meter -> values for the template cells"""
+
+    def __init__(self, spec, name=None):
+        """
+        Args:
+            spec: Parsed mapping file ({"cells": {coordinate: entry}})
+            name: Where the spec came from, for messages
+        """
+        if not isinstance(spec, dict) or not isinstance(spec.get('cells'), dict) or not spec['cells']:
+            raise MappingError(f"{name or 'mapping'}: expected an object with a non-empty 'cells' object")
+        self.spec = spec
+        self.name = name
+        self.setters = []
+        for coordinate, entry in spec['cells'].items():
+            try:
+                row, column = coordinate_to_tuple(coordinate.upper())
+            except (AttributeError, TypeError, ValueError):
+                raise MappingError(f"Invalid cell coordinate: {coordinate!r}")
+            self.setters.append((row, column, coordinate.upper(), _compile_entry(coordinate, entry)))
+        self.digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def __reduce__(self):
+        # Setters are closures: worker processes recompile from the spec
+        return CellMapping, (self.spec, self.name)
+
+    @property
+    def coordinates(self):
+        return [coordinate for _, _, coordinate, _ in self.setters]
+
+    def values(self, meter):
+        """
+        Return the cell values for one meter.
+
+        Returns:
+            dict of {cell coordinate: value}, without the cells that stay as in the template
+        """
+        values = {}
+        for _, _, coordinate, setter in self.setters:
+            value = setter(meter)
+            if value is not None:
+                values[coordinate] = value
+        return values
+
+    def cells(self, meter):
+        """Return [(row, column, value)] for one meter (same cells as values())"""
+        cells = []
+        for row, column, _, setter in self.setters:
+            value = setter(meter)
+            if value is not None:
+                cells.append((row, column, value))
+        return cells
+
+
+def read_mapping(mapping_file):
+    """
+    Read and compile a mapping file.
+
+    Args:
+        mapping_file: .json, .yaml or .yml mapping file
+
+    Returns:
+        CellMapping
+    """
+    with open(mapping_file, 'r', encoding='utf-8') as f:
+        if mapping_file.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise MappingError(f"{mapping_file}: YAML mapping files need PyYAML (pip install pyyaml)")
+            spec = yaml.safe_load(f)
+        else:
+            try:
+                spec = json.load(f)
+            except json.JSONDecodeError as e:
+                raise MappingError(f"{mapping_file}: invalid JSON ({e})")
+    return CellMapping(spec, name=mapping_file)
+
+
+def mapping_file_for(template_file):
+    """Mapping file used with a template: the one next to it, else the default mapping"""
+    stem = os.path.splitext(os.path.abspath(template_file))[0]
+    for suffix in MAPPING_SUFFIXES:
+        if os.path.exists(stem + suffix):
+            return stem + suffix
+    return DEFAULT_MAPPING_FILE
+
+
+def main():
+    """Compile the mapping of a template (or a mapping file) and list its cells"""
+    target = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MAPPING_FILE
+    mapping_file = mapping_file_for(target) if target.lower().endswith(('.xlsx', '.xlsm')) else target
+    try:
+        mapping = read_mapping(mapping_file)
+    except (OSError, MappingError) as e:
+        print(f"ERROR: {e}")
+        return 1
+    print(f"Mapping: {mapping_file}")
+    for coordinate, entry in mapping.spec['cells'].items():
+        print(f"  {coordinate:6s} {json.dumps(entry, ensure_ascii=False)}")
+    print(f"✓ {len(mapping.setters)} cells")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
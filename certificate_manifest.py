@@ -0,0 +1,102 @@
+"""
+Certificate Manifest
+====================
+Remembers what every sheet of a generated certificate file was built from,
+so a rerun can rebuild only the sheets whose meter data changed.
+
+The manifest is stored next to the output file as
+<output file>.manifest.json:
+
+    {
+        "format": 2,
+        "template_hash": "<sha256 of the template file>:<sha256 of its cell mapping>",
+        "output_size": 123456,
+        "output_mtime_ns": 1700000000000000000,
+        "sheets": [{"name": "TowerB_12TH_AHU1", "fingerprint": "<sha256>"}, ...]
+    }
+
+The output size and mtime detect files that were rewritten by anything other
+than an incremental run, in which case everything is rebuilt. So does a
+manifest with a different format, written by a generator that laid the
+sheets out differently.
+"""
+
+import hashlib
+import json
+import os
+
+
+# Bump when generated sheets change shape (v2: template pictures on every sheet)
+MANIFEST_FORMAT = 2
+
+
+def manifest_path(output_file):
+    """Path of the manifest that belongs to `output_file`"""
+    return f"{output_file}.manifest.json"
+
+
+def meter_fingerprint(sheet_name, meter):
+    """Return a stable hash of a sheet name and its MeterRecord"""
+    payload = json.dumps([sheet_name, meter.as_dict()], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def read_manifest(output_file):
+    """Return the manifest dict for `output_file`, or None if there is none"""
+    try:
+        with open(manifest_path(output_file), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(output_file, template_hash, sheet_names, fingerprints):
+    """Record what `output_file` was just built from"""
+    stat = os.stat(output_file)
+    manifest = {
+        'format': MANIFEST_FORMAT,
+        'template_hash': template_hash,
+        'output_size': stat.st_size,
+        'output_mtime_ns': stat.st_mtime_ns,
+        'sheets': [{'name': name, 'fingerprint': fingerprint}
+                   for name, fingerprint in zip(sheet_names, fingerprints)],
+    }
+    with open(manifest_path(output_file), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def changed_sheets(output_file, template_hash, sheet_names, fingerprints):
+    """
+    Work out which sheets need rebuilding.
+
+    Args:
+        output_file: Existing certificate file
+        template_hash: Hash of the template used for this run
+        sheet_names: Sheet names for this run, in order
+        fingerprints: meter_fingerprint() for each sheet
+
+    Returns:
+        List of sheet indexes to rebuild (sheets added at the end are
+        included), or None if the whole file has to be regenerated.
+    """
+    manifest = read_manifest(output_file)
+    if manifest is None or not os.path.exists(output_file):
+        return None
+
+    stat = os.stat(output_file)
+    if (manifest.get('format') != MANIFEST_FORMAT
+            or manifest.get('template_hash') != template_hash
+            or manifest.get('output_size') != stat.st_size
+            or manifest.get('output_mtime_ns') != stat.st_mtime_ns):
+        return None
+
+    old_sheets = manifest.get('sheets', [])
+    old_names = [sheet['name'] for sheet in old_sheets]
+    if old_names != list(sheet_names[:len(old_names)]):
+        # Sheets were removed or reordered
+        return None
+
+    changed = [idx for idx, sheet in enumerate(old_sheets)
+               if sheet['fingerprint'] != fingerprints[idx]]
+    changed.extend(range(len(old_sheets), len(sheet_names)))
+    return changed
@@ -0,0 +1,1037 @@
+"""
+Certificate PDF Renderer
+========================
+Draws certificate pages straight to PDF with reportlab, without Excel.
+
+The page is laid out from the compiled template (column widths, row heights,
+merged ranges, borders, fills, fonts, alignment, logos and signatures, print
+area, margins and scale), and filled with the cell values of one certificate
+sheet. Simple formulas (arithmetic, ROUND, POWER, ABS, SUM, ...) are
+evaluated so the calculated columns show numbers like they do in Excel.
+
+It is pure Python, so it runs headless on Linux render servers and in any
+number of worker processes. export_sheet_pdfs(jobs=N) splits the sheets
+over N worker processes, each with its own workbook reader and renderer.
+
+export_combined_pdf() writes all sheets as pages of one PDF instead, in
+sheet order and with a bookmark per meter location. Pages are rendered in
+batches that are appended to the file right away (pdf_merge), so memory
+does not grow with the number of pages.
+
+A workbook that mixes templates is drawn with the template of each sheet,
+as recorded next to it at generation time (template_registry
+read_sheet_templates()); the command line picks that record up by itself.
+
+Usage:
+    python certificate_pdf.py "Output/CYBER_PARK_TOWER_B_complete.xlsx"
+    python certificate_pdf.py certificates.xlsx --sheets TowerB_CAFETERIA --output PDF_Certificates
+    python certificate_pdf.py certificates.xlsx --jobs 4
+    python certificate_pdf.py certificates.xlsx --combined TowerB.pdf
+
+    # From Python
+    renderer = CertificatePdfRenderer(load_template("Base/Book1.xlsx"))
+    renderer.render(values, "certificate.pdf")
+"""
+
+import argparse
+import math
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal, ROUND_HALF_UP
+from io import BytesIO
+
+from openpyxl import load_workbook
+from openpyxl.styles.colors import COLOR_INDEX
+from openpyxl.utils.cell import (column_index_from_string, coordinate_to_tuple, get_column_letter,
+                                 range_boundaries)
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A3, A4, A5, landscape, legal, letter, portrait
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+from pdf_merge import PdfBundleWriter
+from template_cache import load_template
+from template_registry import read_sheet_templates
+
+
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Base', 'Book1.xlsx')
+
+# Excel paperSize codes -> reportlab page sizes (anything else prints on A4)
+PAPER_SIZES = {1: letter, 5: legal, 8: A3, 9: A4, 11: A5}
+
+POINTS_PER_INCH = 72.0
+
+# A parallel export only starts a worker per this many sheets (smaller exports stay serial,
+# because starting a worker costs more than rendering a few pages)
+MIN_SHEETS_PER_WORKER = 8
+
+# Sheets handed to a worker process at a time
+EXPORT_CHUNK_SIZE = 4
+
+# Pages rendered before they are appended to a combined PDF (bounds its memory use)
+COMBINED_CHUNK_PAGES = 50
+
+# Certificate cell holding "Meter Location : <location>", used for the bookmarks
+LOCATION_CELL = 'B8'
+_LOCATION_LABEL_RE = re.compile(r'^\s*Meter Location\s*:\s*', re.IGNORECASE)
+EMU_PER_POINT = 12700.0
+
+# Excel column width unit -> points (7 px per character for the default 10-11 pt fonts)
+POINTS_PER_CHARACTER = 7 * 0.75
+
+# Gap between the cell border and its text, in points
+CELL_PADDING = 1.5
+
+# Line widths for Excel border styles (points); dash patterns for the dashed ones
+BORDER_WIDTHS = {
+    'hair': 0.25, 'thin': 0.5, 'dotted': 0.5, 'dashed': 0.5, 'dashDot': 0.5, 'dashDotDot': 0.5,
+    'double': 0.5, 'medium': 1.0, 'mediumDashed': 1.0, 'mediumDashDot': 1.0,
+    'mediumDashDotDot': 1.0, 'slantDashDot': 1.0, 'thick': 1.5,
+}
+BORDER_DASHES = {
+    'dotted': (0.5, 1), 'hair': (0.5, 0.5), 'dashed': (3, 1.5), 'mediumDashed': (4, 2),
+    'dashDot': (3, 1, 0.5, 1), 'mediumDashDot': (4, 2, 1, 2), 'slantDashDot': (4, 1, 1, 1),
+    'dashDotDot': (3, 1, 0.5, 1, 0.5, 1), 'mediumDashDotDot': (4, 2, 1, 2, 1, 2),
+}
+
+# TrueType files tried for template fonts, as (regular, bold, italic, bold italic)
+FONT_FILES = {
+    'Arial': ('arial.ttf', 'arialbd.ttf', 'ariali.ttf', 'arialbi.ttf'),
+    'Tahoma': ('tahoma.ttf', 'tahomabd.ttf', 'tahoma.ttf', 'tahomabd.ttf'),
+    'Calibri': ('calibri.ttf', 'calibrib.ttf', 'calibrii.ttf', 'calibriz.ttf'),
+    'Verdana': ('verdana.ttf', 'verdanab.ttf', 'verdanai.ttf', 'verdanaz.ttf'),
+    'Times New Roman': ('times.ttf', 'timesbd.ttf', 'timesi.ttf', 'timesbi.ttf'),
+}
+FONT_DIRS = (
+    os.path.join(os.environ.get('WINDIR', r'C:\Windows'), 'Fonts'),
+    '/usr/share/fonts/truetype/msttcorefonts',
+    '/usr/share/fonts/truetype/ms-fonts',
+    os.path.expanduser('~/.fonts'),
+)
+
+# Built-in PDF fonts used when no TrueType file is found
+STANDARD_FONTS = {
+    'times': ('Times-Roman', 'Times-Bold', 'Times-Italic', 'Times-BoldItalic'),
+    'courier': ('Courier', 'Courier-Bold', 'Courier-Oblique', 'Courier-BoldOblique'),
+    'helvetica': ('Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique', 'Helvetica-BoldOblique'),
+}
+
+_registered_fonts = {}
+
+# Embed image streams as binary instead of ASCII85 text: smaller files, and the
+# pure-Python encoder was most of the render time for the logo and signature
+rl_config.useA85 = 0
+
+
+def pdf_font_name(name, bold=False, italic=False):
+    """Return a reportlab font name for an Excel font, registering TrueType files once"""
+    variant = (2 if italic else 0) + (1 if bold else 0)
+    key = (name, variant)
+    if key in _registered_fonts:
+        return _registered_fonts[key]
+
+    font_name = None
+    for font_dir in FONT_DIRS:
+        file_name = FONT_FILES.get(name, ('',) * 4)[variant]
+        path = os.path.join(font_dir, file_name)
+        if file_name and os.path.isfile(path):
+            font_name = f"{name}-{variant}"
+            try:
+                pdfmetrics.registerFont(TTFont(font_name, path))
+            except Exception:
+                font_name = None
+            break
+
+    if font_name is None:
+        lower = (name or '').lower()
+        family = 'times' if 'times' in lower else 'courier' if 'courier' in lower else 'helvetica'
+        font_name = STANDARD_FONTS[family][variant]
+
+    _registered_fonts[key] = font_name
+    return font_name
+
+
+def _tint(rgb, tint):
+    """Apply an Excel colour tint (-1..1) to an (r, g, b) tuple of 0..1 floats"""
+    if not tint:
+        return rgb
+    if tint < 0:
+        return tuple(channel * (1 + tint) for channel in rgb)
+    return tuple(channel + (1 - channel) * tint for channel in rgb)
+
+
+def resolve_color(color, theme_colors, default=None):
+    """
+    Turn an openpyxl Color into an (r, g, b) tuple of 0..1 floats.
+
+    Args:
+        color: openpyxl Color (or None)
+        theme_colors: TemplatePage.theme_colors
+        default: returned for automatic / unresolvable colours
+    """
+    if color is None:
+        return default
+    value = None
+    if color.type == 'rgb' and isinstance(color.rgb, str):
+        value = color.rgb[-6:]
+        if color.rgb == '00000000':
+            # openpyxl's "no colour" default
+            return default
+    elif color.type == 'theme' and color.theme is not None and color.theme < len(theme_colors):
+        value = theme_colors[color.theme]
+    elif color.type == 'indexed' and color.indexed is not None and color.indexed < len(COLOR_INDEX):
+        value = COLOR_INDEX[color.indexed][-6:]
+    if not value:
+        return default
+    rgb = tuple(int(value[i:i + 2], 16) / 255.0 for i in (0, 2, 4))
+    return _tint(rgb, color.tint)
+
+
+# ---------------------------------------------------------------------------
+# Formulas
+# ---------------------------------------------------------------------------
+
+class FormulaError(ValueError):
+    """A formula the renderer cannot evaluate"""
+
+
+_FORMULA_TOKEN_RE = re.compile(r'''
+    \s*(?:
+      (?P<range>\$?[A-Z]{1,3}\$?\d+:\$?[A-Z]{1,3}\$?\d+)
+    | (?P<func>[A-Z][A-Z0-9.]*)\s*\(
+    | (?P<ref>\$?[A-Z]{1,3}\$?\d+)
+    | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)
+    | (?P<string>"(?:[^"]|"")*")
+    | (?P<op><>|<=|>=|[-+*/^&(),=<>%])
+    )''', re.VERBOSE)
+
+
+def _excel_round(value, digits=0):
+    """ROUND(): halves round away from zero, like Excel"""
+    quantum = Decimal(1).scaleb(-int(digits))
+    return float(Decimal(repr(float(value))).quantize(quantum, rounding=ROUND_HALF_UP))
+
+
+def _flatten(args):
+    for arg in args:
+        if isinstance(arg, list):
+            yield from (value for value in arg if isinstance(value, (int, float)))
+        else:
+            yield arg
+
+
+FORMULA_FUNCTIONS = {
+    'ABS': abs,
+    'ROUND': _excel_round,
+    'INT': lambda value: math.floor(value),
+    'POWER': lambda base, exponent: base ** exponent,
+    'SQRT': math.sqrt,
+    'SUM': lambda *args: sum(_flatten(args)),
+    'MIN': lambda *args: min(_flatten(args)),
+    'MAX': lambda *args: max(_flatten(args)),
+    'AVERAGE': lambda *args: (lambda values: sum(values) / len(values))(list(_flatten(args))),
+    'IF': lambda condition, if_true=True, if_false=False: if_true if condition else if_false,
+}
+
+
+def _translate_formula(formula):
+    """Translate an Excel formula into a Python expression over _ref/_range/_fn"""
+    parts = []
+    pos = 1  # skip the leading '='
+    while pos < len(formula):
+        match = _FORMULA_TOKEN_RE.match(formula, pos)
+        if not match or match.end() == pos:
+            if formula[pos:].strip():
+                raise FormulaError(formula)
+            break
+        pos = match.end()
+        kind = match.lastgroup
+        token = match.group(kind)
+        if kind == 'range':
+            start, end = token.replace('$', '').split(':')
+            parts.append(f"_range({start!r}, {end!r})")
+        elif kind == 'func':
+            if token not in FORMULA_FUNCTIONS:
+                raise FormulaError(formula)
+            parts.append(f"_fn[{token!r}](")
+        elif kind == 'ref':
+            parts.append(f"_ref({token.replace('$', '')!r})")
+        elif kind == 'number':
+            parts.append(token)
+        elif kind == 'string':
+            parts.append(repr(token[1:-1].replace('""', '"')))
+        else:
+            parts.append({'^': '**', '=': '==', '<>': '!=', '&': '+', '%': '/100'}.get(token, token))
+    return ' '.join(parts)
+
+
+def evaluate_formulas(values):
+    """
+    Replace formulas in a {coordinate: value} dict with their computed values.
+
+    Formulas that cannot be evaluated show as '#VALUE!'.
+    """
+    results = {}
+    pending = set()
+
+    def ref(coordinate):
+        if coordinate in results:
+            return results[coordinate]
+        value = values.get(coordinate)
+        if isinstance(value, str) and value.startswith('='):
+            if coordinate in pending:
+                raise FormulaError(coordinate)
+            pending.add(coordinate)
+            try:
+                value = eval(_translate_formula(value), {'__builtins__': {}}, namespace)
+            finally:
+                pending.discard(coordinate)
+            results[coordinate] = value
+        return 0 if value is None else value
+
+    def cell_range(start, end):
+        min_col, min_row, max_col, max_row = range_boundaries(f"{start}:{end}")
+        return [ref(f"{get_column_letter(column)}{row}")
+                for row in range(min_row, max_row + 1)
+                for column in range(min_col, max_col + 1)]
+
+    namespace = {'_ref': ref, '_range': cell_range, '_fn': FORMULA_FUNCTIONS}
+
+    evaluated = {}
+    for coordinate, value in values.items():
+        if isinstance(value, str) and value.startswith('='):
+            try:
+                value = ref(coordinate)
+            except Exception:
+                value = results[coordinate] = '#VALUE!'
+        evaluated[coordinate] = value
+    return evaluated
+
+
+# ---------------------------------------------------------------------------
+# Number formats
+# ---------------------------------------------------------------------------
+
+_SIMPLE_FORMAT_RE = re.compile(r'^(?P<grouping>#,##)?0(?:\.(?P<decimals>0+))?(?P<percent>%)?$')
+
+
+def format_general(value):
+    """Format a number the way Excel's General format shows it (up to 10 significant digits)"""
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer() and abs(value) < 1e11):
+        return str(int(value))
+    text = f"{value:.10G}"
+    if 'E' in text:
+        mantissa, exponent = text.split('E')
+        if '.' in mantissa:
+            mantissa = mantissa.rstrip('0').rstrip('.')
+        return f"{mantissa}E{exponent[0]}{exponent[1:].zfill(2)}"
+    return text
+
+
+def format_value(value, number_format='General'):
+    """Return the text Excel would display for `value` in `number_format`"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        if hasattr(value, 'strftime'):
+            return value.strftime('%d-%m-%Y')
+        return format_general(value) if isinstance(value, bool) else str(value)
+
+    match = _SIMPLE_FORMAT_RE.match((number_format or 'General').split(';')[0])
+    if not match:
+        return format_general(value)
+    if match.group('percent'):
+        value = value * 100
+    decimals = len(match.group('decimals') or '')
+    text = f"{value:{',' if match.group('grouping') else ''}.{decimals}f}"
+    return text + ('%' if match.group('percent') else '')
+
+
+# ---------------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------------
+
+class CertificatePdfRenderer:
+    """Renders certificate pages from a CompiledTemplate"""
+
+    def __init__(self, template):
+        """
+        Args:
+            template: CompiledTemplate (see template_cache.load_template)
+        """
+        self.template = template
+        page = template.page
+        self.theme_colors = page.theme_colors if page else ()
+
+        paper = PAPER_SIZES.get(page.paper_size if page else None, A4)
+        self.page_size = landscape(paper) if page and page.orientation == 'landscape' else portrait(paper)
+
+        self._layout_columns_and_rows()
+        self._layout_page()
+
+        self.styles = template.styles
+        self.cells = {(tcell.row, tcell.column): tcell for tcell in template.cells}
+
+        # Merged ranges: top-left cell -> (max_row, max_col); covered cells are skipped
+        self.merged = {}
+        self.covered = set()
+        for merged_range in template.merged_ranges:
+            min_col, min_row, max_col, max_row = range_boundaries(merged_range)
+            self.merged[(min_row, min_col)] = (max_row, max_col)
+            for row in range(min_row, max_row + 1):
+                for column in range(min_col, max_col + 1):
+                    if (row, column) != (min_row, min_col):
+                        self.covered.add((row, column))
+
+        self.images = [(ImageReader(BytesIO(image.data)), self._image_box(image))
+                       for image in template.images]
+
+    def _layout_columns_and_rows(self):
+        """Compute column and row edges (points, relative to A1)"""
+        template = self.template
+        page = template.page
+
+        if page and page.print_area:
+            self.min_col, self.min_row, self.max_col, self.max_row = range_boundaries(page.print_area)
+        else:
+            self.min_col = self.min_row = 1
+            self.max_col = max([tcell.column for tcell in template.cells] + [1])
+            self.max_row = max([tcell.row for tcell in template.cells] + [1])
+
+        # Merged ranges and pictures may reach past the print area
+        last_col = self.max_col
+        last_row = self.max_row
+        for merged_range in template.merged_ranges:
+            _, _, max_col, max_row = range_boundaries(merged_range)
+            last_col = max(last_col, max_col)
+            last_row = max(last_row, max_row)
+        for image in template.images:
+            anchor_to = getattr(image.anchor, 'to', None) or getattr(image.anchor, '_from', None)
+            if anchor_to is not None:
+                last_col = max(last_col, anchor_to.col + 2)
+                last_row = max(last_row, anchor_to.row + 2)
+
+        default_width = page.default_column_width if page else 8.43
+        widths = {}
+        hidden = set()
+        for min_col, max_col, width, is_hidden in (page.columns if page else ()):
+            for column in range(min_col, min(max_col, last_col) + 1):
+                widths[column] = width if width is not None else default_width
+                if is_hidden:
+                    hidden.add(column)
+        if not page:
+            for col_letter, width in template.column_widths:
+                widths[column_index_from_string(col_letter)] = width
+
+        # col_x[c] is the left edge of column c; hidden columns have no width
+        self.col_x = [0.0, 0.0]
+        for column in range(1, last_col + 1):
+            width = 0.0 if column in hidden else widths.get(column, default_width) * POINTS_PER_CHARACTER
+            self.col_x.append(self.col_x[-1] + width)
+
+        default_height = page.default_row_height if page else 15
+        heights = dict(template.row_heights)
+        self.row_y = [0.0, 0.0]
+        for row in range(1, last_row + 1):
+            height = heights.get(row)
+            self.row_y.append(self.row_y[-1] + (height if height is not None else default_height))
+
+    def _layout_page(self):
+        """Work out the origin and scale of the print area on the page"""
+        page = self.template.page
+        page_width, page_height = self.page_size
+        left, right, top, bottom = (margin * POINTS_PER_INCH for margin in
+                                    (page.margins if page else (0.7, 0.7, 0.75, 0.75)))
+
+        area_width = self.col_x[self.max_col + 1] - self.col_x[self.min_col]
+        area_height = self.row_y[self.max_row + 1] - self.row_y[self.min_row]
+        available_width = page_width - left - right
+        available_height = page_height - top - bottom
+
+        scale = (page.scale or 100) / 100.0 if page else 1.0
+        # A certificate is always one page: shrink anything that would spill over
+        if page and page.fit_to_page or area_width * scale > available_width or area_height * scale > available_height:
+            scale = min(scale, available_width / area_width, available_height / area_height)
+        self.scale = scale
+
+        offset_x = left
+        if page and page.horizontal_centered:
+            offset_x += (available_width - area_width * scale) / 2
+        self.origin_x = offset_x - self.col_x[self.min_col] * scale
+        self.origin_y = page_height - top + self.row_y[self.min_row] * scale
+
+    def _image_box(self, image):
+        """Return (x, y, width, height) of a picture, in sheet points relative to A1"""
+        anchor = image.anchor
+        kind = type(anchor).__name__
+        if kind == 'AbsoluteAnchor':
+            x = anchor.pos.x / EMU_PER_POINT
+            y = anchor.pos.y / EMU_PER_POINT
+            return x, y, anchor.ext.width / EMU_PER_POINT, anchor.ext.height / EMU_PER_POINT
+
+        start = anchor._from
+        x = self.col_x[start.col + 1] + start.colOff / EMU_PER_POINT
+        y = self.row_y[start.row + 1] + start.rowOff / EMU_PER_POINT
+        if kind == 'TwoCellAnchor':
+            end = anchor.to
+            end_x = self.col_x[end.col + 1] + end.colOff / EMU_PER_POINT
+            end_y = self.row_y[end.row + 1] + end.rowOff / EMU_PER_POINT
+            return x, y, end_x - x, end_y - y
+        if getattr(anchor, 'ext', None) is not None:
+            return x, y, anchor.ext.width / EMU_PER_POINT, anchor.ext.height / EMU_PER_POINT
+        # Pixel size at 96 dpi
+        return x, y, image.width * 0.75, image.height * 0.75
+
+    def _rect(self, row, column, max_row=None, max_col=None):
+        """Page rectangle (x, y, width, height) of a cell or cell block, y at the bottom"""
+        max_row = max_row or row
+        max_col = max_col or column
+        scale = self.scale
+        x = self.origin_x + self.col_x[column] * scale
+        width = (self.col_x[max_col + 1] - self.col_x[column]) * scale
+        top = self.origin_y - self.row_y[row] * scale
+        height = (self.row_y[max_row + 1] - self.row_y[row]) * scale
+        return x, top - height, width, height
+
+    def draw(self, canvas, values=None):
+        """
+        Draw one certificate page onto a reportlab canvas (ends the page).
+
+        Args:
+            canvas: reportlab Canvas
+            values: {coordinate: value} of the certificate sheet; template
+                values are used for cells that are not in it
+        """
+        cell_values = {f"{get_column_letter(tcell.column)}{tcell.row}": tcell.value
+                       for tcell in self.template.cells if tcell.value is not None}
+        if values:
+            cell_values.update(values)
+        cell_values = evaluate_formulas(cell_values)
+
+        positions = set()
+        for coordinate in cell_values:
+            positions.add(coordinate_to_tuple(coordinate))
+        positions.update(self.cells)
+        visible = sorted((row, column) for row, column in positions
+                         if self.min_row <= row <= self.max_row
+                         and self.min_col <= column <= self.max_col)
+
+        # Fills first, then text, then borders and pictures on top (Excel's paint order)
+        for row, column in visible:
+            if (row, column) not in self.covered:
+                self._draw_fill(canvas, row, column)
+        for row, column in visible:
+            if (row, column) not in self.covered:
+                value = cell_values.get(f"{get_column_letter(column)}{row}")
+                if value is not None and value != '':
+                    self._draw_text(canvas, row, column, value)
+        for row, column in visible:
+            self._draw_borders(canvas, row, column)
+        self._draw_images(canvas)
+
+        canvas.showPage()
+
+    def render(self, values, pdf_path, title=None):
+        """Write a single-page PDF for one certificate"""
+        canvas = Canvas(pdf_path, pagesize=self.page_size, pageCompression=1)
+        if title:
+            canvas.setTitle(title)
+        self.draw(canvas, values)
+        canvas.save()
+
+    def _style(self, row, column):
+        tcell = self.cells.get((row, column))
+        if tcell is None or tcell.style is None:
+            return None
+        return self.styles[tcell.style]
+
+    def _draw_fill(self, canvas, row, column):
+        style = self._style(row, column)
+        if style is None or style.fill is None or getattr(style.fill, 'fill_type', None) != 'solid':
+            return
+        color = resolve_color(style.fill.fgColor, self.theme_colors)
+        if color is None:
+            return
+        max_row, max_col = self.merged.get((row, column), (row, column))
+        x, y, width, height = self._rect(row, column, max_row, max_col)
+        canvas.setFillColorRGB(*color)
+        canvas.rect(x, y, width, height, stroke=0, fill=1)
+
+    def _draw_borders(self, canvas, row, column):
+        style = self._style(row, column)
+        if style is None or style.border is None:
+            return
+        x, y, width, height = self._rect(row, column)
+        if width <= 0:
+            return
+        edges = {
+            'left': (x, y, x, y + height),
+            'right': (x + width, y, x + width, y + height),
+            'top': (x, y + height, x + width, y + height),
+            'bottom': (x, y, x + width, y),
+        }
+        for side, (x1, y1, x2, y2) in edges.items():
+            border_side = getattr(style.border, side)
+            if border_side is None or not border_side.style:
+                continue
+            canvas.setStrokeColorRGB(*resolve_color(border_side.color, self.theme_colors, (0, 0, 0)))
+            canvas.setLineWidth(BORDER_WIDTHS.get(border_side.style, 0.5) * self.scale)
+            canvas.setDash(*((list(BORDER_DASHES[border_side.style]), 0)
+                             if border_side.style in BORDER_DASHES else ([], 0)))
+            canvas.line(x1, y1, x2, y2)
+            if border_side.style == 'double':
+                gap = 1.5 * self.scale
+                dx, dy = (gap, 0) if x1 == x2 else (0, gap)
+                inward = -1 if side in ('right', 'top') else 1
+                canvas.line(x1 + dx * inward, y1 + dy * inward, x2 + dx * inward, y2 + dy * inward)
+        canvas.setDash([], 0)
+
+    def _draw_text(self, canvas, row, column, value):
+        style = self._style(row, column)
+        font = style.font if style else None
+        alignment = style.alignment if style else None
+        number_format = style.number_format if style else 'General'
+
+        text = format_value(value, number_format)
+        if not text.strip():
+            return
+
+        font_name = pdf_font_name(font.name if font and font.name else 'Arial',
+                                  bool(font and font.b), bool(font and font.i))
+        size = (font.sz if font and font.sz else 10) * self.scale
+        color = resolve_color(font.color if font else None, self.theme_colors, (0, 0, 0))
+
+        max_row, max_col = self.merged.get((row, column), (row, column))
+        x, y, width, height = self._rect(row, column, max_row, max_col)
+        padding = CELL_PADDING * self.scale
+        inner_width = max(width - 2 * padding, 1)
+
+        horizontal = alignment.horizontal if alignment else None
+        if horizontal in (None, 'general'):
+            horizontal = 'right' if isinstance(value, (int, float)) and not isinstance(value, bool) else 'left'
+        elif horizontal in ('centerContinuous', 'distributed'):
+            horizontal = 'center'
+        vertical = (alignment.vertical if alignment else None) or 'bottom'
+        wrap = bool(alignment and alignment.wrap_text)
+
+        lines = text.split('\n')
+        if wrap:
+            lines = [wrapped for line in lines
+                     for wrapped in self._wrap(line, font_name, size, inner_width)]
+        if not wrap and len(lines) > 1:
+            # Excel only breaks lines in wrapped cells
+            lines = [' '.join(lines)]
+        # Trailing blank lines take no room
+        while len(lines) > 1 and not lines[-1].strip():
+            lines.pop()
+
+        leading = size * 1.2
+        block_height = leading * len(lines)
+        if vertical == 'top':
+            first_baseline = y + height - padding - size
+        elif vertical in ('center', 'justify', 'distributed'):
+            first_baseline = y + (height + block_height) / 2 - size
+        else:
+            first_baseline = y + padding + block_height - size + size * 0.2
+
+        clip = wrap or (row, column) in self.merged
+        canvas.saveState()
+        if clip:
+            path = canvas.beginPath()
+            path.rect(x, y, width, height)
+            canvas.clipPath(path, stroke=0, fill=0)
+        canvas.setFillColorRGB(*color)
+        canvas.setFont(font_name, size)
+        for line_num, line in enumerate(lines):
+            baseline = first_baseline - line_num * leading
+            if horizontal == 'center':
+                canvas.drawCentredString(x + width / 2, baseline, line)
+            elif horizontal == 'right':
+                canvas.drawRightString(x + width - padding, baseline, line)
+            else:
+                canvas.drawString(x + padding, baseline, line)
+            if font and font.u:
+                line_width = pdfmetrics.stringWidth(line, font_name, size)
+                start = {'center': x + (width - line_width) / 2,
+                         'right': x + width - padding - line_width}.get(horizontal, x + padding)
+                canvas.setStrokeColorRGB(*color)
+                canvas.setLineWidth(size / 18)
+                canvas.line(start, baseline - size * 0.12, start + line_width, baseline - size * 0.12)
+        canvas.restoreState()
+
+    @staticmethod
+    def _wrap(line, font_name, size, width):
+        """Greedy word wrap of one line of text"""
+        words = line.split(' ')
+        lines = []
+        current = ''
+        for word in words:
+            candidate = f"{current} {word}" if current else word
+            if current and pdfmetrics.stringWidth(candidate, font_name, size) > width:
+                lines.append(current)
+                current = word
+            else:
+                current = candidate
+        lines.append(current)
+        return lines
+
+    def _draw_images(self, canvas):
+        scale = self.scale
+        for reader, (x, y, width, height) in self.images:
+            canvas.drawImage(reader, self.origin_x + x * scale,
+                             self.origin_y - (y + height) * scale,
+                             width * scale, height * scale, mask='auto')
+
+
+def sheet_values(ws):
+    """Return {coordinate: value} for every non-empty cell of a (read-only) worksheet"""
+    values = {}
+    for row in ws.iter_rows():
+        for cell in row:
+            if cell.value is not None and hasattr(cell, 'column'):
+                values[f"{get_column_letter(cell.column)}{cell.row}"] = cell.value
+    return values
+
+
+def export_workers(sheet_count, jobs):
+    """Number of worker processes a parallel export of `sheet_count` sheets uses (1 = serial)"""
+    return max(1, min(jobs or 1, sheet_count // MIN_SHEETS_PER_WORKER))
+
+
+def template_runs(sheet_names, template_file, sheet_templates=None):
+    """
+    Split sheets into runs of consecutive sheets drawn with the same template.
+
+    Args:
+        sheet_names: Sheets in export order
+        template_file: Template of the sheets `sheet_templates` does not list
+        sheet_templates: Optional {sheet name: template file}
+
+    Returns:
+        list of (template file, sheet names)
+    """
+    runs = []
+    for sheet_name in sheet_names:
+        sheet_template = (sheet_templates or {}).get(sheet_name, template_file)
+        if runs and runs[-1][0] == sheet_template:
+            runs[-1][1].append(sheet_name)
+        else:
+            runs.append((sheet_template, [sheet_name]))
+    return runs
+
+
+def export_sheet_pdfs(excel_file, sheet_names, output_folder, template_file=DEFAULT_TEMPLATE,
+                      progress_callback=None, jobs=1, sheet_templates=None):
+    """
+    Export certificate sheets to one PDF per sheet (<output_folder>/<sheet>.pdf).
+
+    Args:
+        excel_file: Certificate workbook generated from `template_file`
+        sheet_names: Sheets to export (None for all)
+        output_folder: Folder for the PDF files (created if missing)
+        template_file: Template the certificates were generated from
+        progress_callback: Optional function(current, total, sheet_name)
+        jobs: Worker processes; with more than one the sheets are rendered in
+            parallel (see MIN_SHEETS_PER_WORKER) and progress is reported as
+            sheets finish
+        sheet_templates: Optional {sheet name: template file} of a workbook
+            that mixes templates; other sheets use `template_file`
+
+    Returns:
+        (exported, failed): list of PDF paths, list of (sheet_name, error message)
+    """
+    os.makedirs(output_folder, exist_ok=True)
+
+    wb = load_workbook(excel_file, read_only=True)
+    try:
+        sheet_names = list(sheet_names or wb.sheetnames)
+        groups = {}
+        for sheet_template, run in template_runs(sheet_names, template_file, sheet_templates):
+            groups.setdefault(sheet_template, []).extend(run)
+        if len(groups) > 1:
+            wb.close()
+            return _export_groups(excel_file, groups, output_folder, progress_callback, jobs)
+        template_file = next(iter(groups), template_file)
+        workers = export_workers(len(sheet_names), jobs)
+        if workers > 1:
+            wb.close()
+            return _export_parallel(excel_file, sheet_names, output_folder, template_file,
+                                    progress_callback, workers)
+
+        renderer = CertificatePdfRenderer(load_template(template_file))
+        exported = []
+        failed = []
+        for idx, sheet_name in enumerate(sheet_names, 1):
+            if progress_callback:
+                progress_callback(idx, len(sheet_names), sheet_name)
+            pdf_path, error = _export_sheet(wb, renderer, sheet_name, output_folder)
+            if error is None:
+                exported.append(pdf_path)
+            else:
+                failed.append((sheet_name, error))
+    finally:
+        wb.close()
+
+    return exported, failed
+
+
+def _export_groups(excel_file, groups, output_folder, progress_callback, jobs):
+    """export_sheet_pdfs() of the sheets of several templates, one template after the other"""
+    total = sum(len(sheet_names) for sheet_names in groups.values())
+    exported = []
+    failed = []
+    for template_file, sheet_names in groups.items():
+        offset = len(exported) + len(failed)
+
+        def progress(current, _total, sheet_name, offset=offset):
+            progress_callback(offset + current, total, sheet_name)
+
+        done, errors = export_sheet_pdfs(excel_file, sheet_names, output_folder, template_file,
+                                         progress if progress_callback else None, jobs)
+        exported.extend(done)
+        failed.extend(errors)
+    return exported, failed
+
+
+def _export_sheet(wb, renderer, sheet_name, output_folder):
+    """Render one sheet to <output_folder>/<sheet>.pdf; returns (pdf_path, error message or None)"""
+    try:
+        pdf_path = os.path.join(output_folder, f"{sheet_name}.pdf")
+        renderer.render(sheet_values(wb[sheet_name]), pdf_path, title=sheet_name)
+        return pdf_path, None
+    except Exception as e:
+        return None, str(e)
+
+
+# Workbook and renderer of a PDF export worker process
+_worker_state = None
+
+
+def _init_export_worker(excel_file, template_file):
+    """Worker process initializer: open the workbook and build the renderer once"""
+    global _worker_state
+    _worker_state = (load_workbook(excel_file, read_only=True), template_file,
+                     {template_file: CertificatePdfRenderer(load_template(template_file))})
+
+
+def _worker_renderer(template_file=None):
+    """Workbook and renderer of a worker process; renderers of other templates are built on first use"""
+    wb, default, renderers = _worker_state
+    template_file = template_file or default
+    if template_file not in renderers:
+        renderers[template_file] = CertificatePdfRenderer(load_template(template_file))
+    return wb, renderers[template_file]
+
+
+def _export_chunk(sheet_names, output_folder):
+    """Worker process task: render a few sheets; returns [(sheet_name, pdf_path, error)]"""
+    wb, renderer = _worker_renderer()
+    return [(sheet_name,) + _export_sheet(wb, renderer, sheet_name, output_folder)
+            for sheet_name in sheet_names]
+
+
+def _export_parallel(excel_file, sheet_names, output_folder, template_file, progress_callback, workers):
+    """export_sheet_pdfs() over `workers` processes; results keep the order of `sheet_names`"""
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_export_worker,
+                             initargs=(excel_file, template_file)) as executor:
+        futures = [executor.submit(_export_chunk, sheet_names[start:start + EXPORT_CHUNK_SIZE], output_folder)
+                   for start in range(0, len(sheet_names), EXPORT_CHUNK_SIZE)]
+        for future in as_completed(futures):
+            for sheet_name, pdf_path, error in future.result():
+                results[sheet_name] = (pdf_path, error)
+                if progress_callback:
+                    progress_callback(len(results), len(sheet_names), sheet_name)
+
+    exported = []
+    failed = []
+    for sheet_name in sheet_names:
+        pdf_path, error = results[sheet_name]
+        if error is None:
+            exported.append(pdf_path)
+        else:
+            failed.append((sheet_name, error))
+    return exported, failed
+
+
+def bookmark_title(sheet_name, values):
+    """Bookmark for a certificate page: its meter location, or the sheet name"""
+    location = values.get(LOCATION_CELL)
+    if isinstance(location, str) and _LOCATION_LABEL_RE.match(location):
+        location = _LOCATION_LABEL_RE.sub('', location).strip()
+        if location:
+            return location
+    return sheet_name
+
+
+def _render_pages(wb, renderer, sheet_names):
+    """
+    Render sheets as the pages of one in-memory PDF.
+
+    A sheet that cannot be read or drawn is reported as failed and the
+    other pages are still rendered. A page that failed half drawn would
+    leave its partial content on the canvas, so the batch is then drawn
+    again on a fresh canvas without it.
+
+    Returns:
+        (pdf bytes or None if no page rendered, bookmark titles, [(sheet_name, error message)])
+    """
+    pages = []
+    failed = []
+    for sheet_name in sheet_names:
+        try:
+            pages.append((sheet_name, sheet_values(wb[sheet_name])))
+        except Exception as e:
+            failed.append((sheet_name, str(e)))
+
+    while pages:
+        buffer = BytesIO()
+        canvas = Canvas(buffer, pagesize=renderer.page_size, pageCompression=1)
+        for number, (sheet_name, values) in enumerate(pages):
+            try:
+                renderer.draw(canvas, values)
+            except Exception as e:
+                failed.append((sheet_name, str(e)))
+                del pages[number]
+                break
+        else:
+            canvas.save()
+            order = {sheet_name: idx for idx, sheet_name in enumerate(sheet_names)}
+            failed.sort(key=lambda entry: order[entry[0]])
+            return (buffer.getvalue(), [bookmark_title(sheet_name, values) for sheet_name, values in pages],
+                    failed)
+    return None, [], failed
+
+
+def _combined_chunk(sheet_names, template_file=None):
+    """Worker process task: render a batch of pages for a combined PDF"""
+    wb, renderer = _worker_renderer(template_file)
+    return _render_pages(wb, renderer, sheet_names)
+
+
+def export_combined_pdf(excel_file, sheet_names, pdf_path, template_file=DEFAULT_TEMPLATE,
+                        progress_callback=None, jobs=1, title=None, sheet_templates=None):
+    """
+    Export certificate sheets as the pages of one PDF, bookmarked per meter location.
+
+    Pages are rendered in batches of COMBINED_CHUNK_PAGES and each batch is
+    appended to the file as soon as it is done, so a report of thousands of
+    pages never has them all in memory. With jobs > 1 the batches are
+    rendered in worker processes and still written in sheet order.
+
+    Args:
+        excel_file: Certificate workbook generated from `template_file`
+        sheet_names: Sheets to export, in page order (None for all)
+        pdf_path: Output .pdf file
+        template_file: Template the certificates were generated from
+        progress_callback: Optional function(current, total, sheet_name)
+        jobs: Worker processes (see export_workers())
+        title: Document title (default: the workbook file name)
+        sheet_templates: Optional {sheet name: template file} of a workbook
+            that mixes templates; other sheets use `template_file`
+
+    Returns:
+        (pages, failed): number of pages written, list of (sheet_name, error message)
+    """
+    folder = os.path.dirname(os.path.abspath(pdf_path))
+    os.makedirs(folder, exist_ok=True)
+    title = title or os.path.splitext(os.path.basename(excel_file))[0]
+
+    wb = load_workbook(excel_file, read_only=True)
+    sheet_names = list(sheet_names or wb.sheetnames)
+    workers = export_workers(len(sheet_names), jobs)
+    if workers > 1:
+        wb.close()  # Every worker opens its own copy
+    # A batch never mixes templates: each is drawn by one renderer
+    chunks = [(run_template, run[start:start + COMBINED_CHUNK_PAGES])
+              for run_template, run in template_runs(sheet_names, template_file, sheet_templates)
+              for start in range(0, len(run), COMBINED_CHUNK_PAGES)]
+
+    pages = 0
+    failed = []
+    done = 0
+    with PdfBundleWriter(pdf_path, title) as bundle:
+        def append(chunk, rendered):
+            nonlocal pages, done
+            data, titles, chunk_failed = rendered
+            if data:
+                bundle.add_pdf(data, titles)
+            pages += len(titles)
+            failed.extend(chunk_failed)
+            done += len(chunk)
+            if progress_callback:
+                progress_callback(done, len(sheet_names), chunk[-1])
+
+        if workers > 1:
+            # Results are taken in order; only a few batches are in flight at a time
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_export_worker,
+                                     initargs=(excel_file, template_file)) as executor:
+                pending = []
+                for chunk_template, chunk in chunks:
+                    pending.append((chunk, executor.submit(_combined_chunk, chunk, chunk_template)))
+                    if len(pending) > workers:
+                        chunk, future = pending.pop(0)
+                        append(chunk, future.result())
+                for chunk, future in pending:
+                    append(chunk, future.result())
+        else:
+            try:
+                renderers = {}
+                for chunk_template, chunk in chunks:
+                    if chunk_template not in renderers:
+                        renderers[chunk_template] = CertificatePdfRenderer(load_template(chunk_template))
+                    append(chunk, _render_pages(wb, renderers[chunk_template], chunk))
+            finally:
+                wb.close()
+
+    return pages, failed
+
+
+def main():
+    """Command-line PDF export"""
+    parser = argparse.ArgumentParser(description="Export certificate sheets to PDF without Excel")
+    parser.add_argument('excel_file', help="Certificate workbook")
+    parser.add_argument('--sheets', nargs='+', help="Sheets to export (default: all)")
+    parser.add_argument('--output', default='PDF_Certificates', help="Output folder")
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE,
+                        help="Template the certificates were generated from "
+                             "(sheets listed in <excel_file>.templates.json use the template recorded there)")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: %(default)s; small exports run serially)")
+    parser.add_argument('--combined', metavar='PDF_FILE',
+                        help="Write one PDF with a bookmarked page per sheet instead of a PDF per sheet")
+    args = parser.parse_args()
+
+    def progress(current, total, sheet_name):
+        print(f"   [{current}/{total}] {sheet_name}")
+
+    sheet_templates = read_sheet_templates(args.excel_file)
+
+    if args.combined:
+        print(f"Exporting {args.excel_file} -> {args.combined}")
+        pages, failed = export_combined_pdf(args.excel_file, args.sheets, args.combined, args.template,
+                                            progress, args.jobs, sheet_templates=sheet_templates)
+        print(f"✓ Wrote {pages} page(s) to {args.combined}")
+        for sheet_name, error in failed:
+            print(f"✗ {sheet_name}: {error}")
+        return 0 if not failed else 1
+
+    print(f"Exporting {args.excel_file} -> {args.output}")
+    exported, failed = export_sheet_pdfs(args.excel_file, args.sheets, args.output,
+                                         args.template, progress, args.jobs, sheet_templates)
+    print(f"✓ Exported {len(exported)} PDF(s)")
+    for sheet_name, error in failed:
+        print(f"✗ {sheet_name}: {error}")
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
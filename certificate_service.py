@@ -0,0 +1,437 @@
+"""
+Certificate Service
+===================
+Local HTTP service that keeps certificate generation warm.
+
+Every run of the command-line scripts pays for interpreter startup, the
+openpyxl import and loading the template. The service pays that once: a
+pool of worker processes is started with the template already compiled
+(and the direct_xml writer and PDF renderer built), so a request only
+reads the calibration file and writes the certificates.
+
+It uses the standard library only and works fully offline. It listens on
+127.0.0.1 (or a Unix socket) and is meant for a single trusted machine:
+JSON requests may name any file the service user can read and write, so
+there is no authentication and hosts other than a loopback address
+(127.0.0.1, ::1, localhost) are refused.
+
+Endpoints:
+    GET  /health     Service status, worker count and request statistics (JSON)
+    POST /generate   Generate certificates for one calibration file
+
+/generate accepts either
+- the calibration file (.xlsx, .csv or .parquet; name it with filename=) as
+  the raw request body; options go in the query
+  string (prefix, format, engine, template, filename). template may be a
+  template file or a template folder such as Base (see template_registry).
+  The response is the
+  certificate workbook, or a zip of the PDFs (format=pdf) or of the
+  workbook and the PDFs (format=both).
+- a JSON body {"input": path, "output": path, "prefix": ..., "format": ...,
+  "engine": ..., "template": ...}. With "output" the files are written on
+  the server and the JSON result (as printed by the CLI) is returned;
+  without it the artifact is returned like for an upload. "input" may be
+  a folder of calibration files: the whole site goes into one file.
+
+all_sheets=1 (or "all_sheets": true) reads every sheet of the workbook(s),
+e.g. one sheet per floor, instead of Sheet1 only.
+
+Defaults: format xlsx, engine direct_xml, prefix guessed from the file name.
+Generation details are returned in the X-Certificates, X-Flagged and
+X-Generation-Seconds headers; failures return a JSON error.
+
+Usage:
+    python certificate_service.py --port 8765 --workers 2
+    python certificate_service.py --unix-socket /run/certificates.sock
+
+    curl --data-binary @"CP TOWER TowerB CALIBRATION Excel sheet.xlsx" \\
+         "http://127.0.0.1:8765/generate?prefix=TowerB" -o TowerB.xlsx
+    curl -H "Content-Type: application/json" \\
+         -d '{"input": "/data/cal.xlsx", "output": "/data/TowerB.xlsx", "format": "both"}' \\
+         http://127.0.0.1:8765/generate
+"""
+
+import argparse
+import contextlib
+import io
+import ipaddress
+import json
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from calibration_reader import ROW_READERS
+from universal_certificate_generator import DEFAULT_TEMPLATE, default_sheet_prefix, process_file
+
+
+DEFAULT_PORT = 8765
+FORMATS = ('xlsx', 'pdf', 'both')
+ENGINES = ('openpyxl', 'streaming', 'direct_xml')
+DEFAULT_ENGINE = 'direct_xml'
+
+# Largest accepted request body
+MAX_UPLOAD_BYTES = 64 * 1024 * 1024
+
+# Characters of the generation log returned with a failure
+ERROR_LOG_CHARS = 4000
+
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class RequestError(Exception):
+    """A request the service cannot handle; carries the HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def is_loopback(host):
+    """True for addresses only this machine can connect to (127.0.0.1, ::1, localhost)"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def warm_worker(template_file):
+    """Worker process initializer: load the template(s) for every engine up front"""
+    from certificate_pdf import CertificatePdfRenderer
+    from template_cache import load_template, load_xml_writer
+    from template_registry import load_registry
+
+    if os.path.isdir(template_file):
+        template_files = list(load_registry(template_file).paths.values())
+    else:
+        template_files = [template_file]
+    for path in template_files:
+        template = load_template(path)
+        load_xml_writer(path)
+        CertificatePdfRenderer(template)
+
+
+def ping():
+    """No-op task used to start the worker processes"""
+    return os.getpid()
+
+
+def run_job(calibration_file, output_file, sheet_prefix, template_file, output_format, engine, all_sheets=False):
+    """
+    Worker process task: generate one calibration file with the CLI's process_file().
+
+    Returns:
+        process_file() result dict; failed results carry the end of the log as 'log'
+    """
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        result = process_file(calibration_file, output_file, sheet_prefix, template_file,
+                              output_format, engine, all_sheets=all_sheets)
+    if result['status'] != 'ok':
+        result['log'] = log.getvalue()[-ERROR_LOG_CHARS:]
+    return result
+
+
+def zip_artifacts(result):
+    """Return a zip (bytes) with the workbook (if kept) and the PDFs of a result"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        if result['output']:
+            archive.write(result['output'], os.path.basename(result['output']))
+        if result['pdf_folder']:
+            folder_name = os.path.basename(result['pdf_folder'])
+            for name in sorted(os.listdir(result['pdf_folder'])):
+                archive.write(os.path.join(result['pdf_folder'], name), f"{folder_name}/{name}")
+    return buffer.getvalue()
+
+
+class CertificateService:
+    """Worker pool, defaults and statistics shared by all request handlers"""
+
+    def __init__(self, template_file=DEFAULT_TEMPLATE, workers=1, engine=DEFAULT_ENGINE):
+        """
+        Args:
+            template_file: Default template Excel file or template folder (requests may name another)
+            workers: Number of worker processes
+            engine: Default workbook writer
+        """
+        self.template_file = os.path.abspath(template_file)
+        self.workers = workers
+        self.engine = engine
+        self.started = time.time()
+        self.work_dir = tempfile.mkdtemp(prefix='certificate_service_')
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_worker,
+                                        initargs=(self.template_file,))
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.certificates = 0
+        self.busy_seconds = 0.0
+
+    def warm_up(self):
+        """Start every worker process now instead of on the first requests"""
+        futures = [self.pool.submit(ping) for _ in range(self.workers)]
+        return sorted({future.result() for future in futures})
+
+    def close(self):
+        """Stop the workers and remove the work folder"""
+        self.pool.shutdown(cancel_futures=True)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def health(self):
+        """Return the service status as a plain dict"""
+        with self.lock:
+            return {
+                'status': 'ok',
+                'pid': os.getpid(),
+                'uptime_seconds': round(time.time() - self.started, 1),
+                'workers': self.workers,
+                'template': self.template_file,
+                'engine': self.engine,
+                'requests': self.requests,
+                'failures': self.failures,
+                'certificates': self.certificates,
+                'average_seconds': round(self.busy_seconds / self.requests, 3) if self.requests else None,
+            }
+
+    def generate(self, calibration_file, output_file, options):
+        """
+        Run one generation in the worker pool.
+
+        Args:
+            calibration_file: Calibration Excel file on this machine
+            output_file: Output .xlsx path (PDFs go to <output name>_PDF/)
+            options: dict with prefix, format, engine, template and all_sheets (all optional)
+
+        Returns:
+            process_file() result dict
+        """
+        output_format = options.get('format') or 'xlsx'
+        engine = options.get('engine') or self.engine
+        if output_format not in FORMATS:
+            raise RequestError(400, f"format must be one of {', '.join(FORMATS)}")
+        if engine not in ENGINES:
+            raise RequestError(400, f"engine must be one of {', '.join(ENGINES)}")
+        template_file = os.path.abspath(options.get('template') or self.template_file)
+        if not os.path.exists(template_file):
+            raise RequestError(400, f"Template file or folder not found: {template_file}")
+        sheet_prefix = options.get('prefix') or default_sheet_prefix(options.get('filename') or calibration_file)
+        all_sheets = str(options.get('all_sheets', '')).lower() in ('1', 'true', 'yes')
+
+        started = time.perf_counter()
+        result = self.pool.submit(run_job, calibration_file, output_file, sheet_prefix, template_file,
+                                  output_format, engine, all_sheets).result()
+        with self.lock:
+            self.requests += 1
+            self.busy_seconds += time.perf_counter() - started
+            if result['status'] == 'ok':
+                self.certificates += result['certificates']
+            else:
+                self.failures += 1
+        return result
+
+
+class CertificateRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of CertificateService (self.server.service)"""
+
+    server_version = 'CertificateService/1.0'
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def send_json(self, status, payload):
+        """Send `payload` as a JSON response"""
+        body = json.dumps(payload, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_artifact(self, body, content_type, filename, result):
+        """Send a generated file with the generation details as headers"""
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        self.send_header('X-Certificates', str(result['certificates']))
+        self.send_header('X-Flagged', str(result['flagged']))
+        self.send_header('X-Generation-Seconds', f"{result['seconds']:.3f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self.send_json(200, self.server.service.health())
+        else:
+            self.send_json(404, {'error': f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/generate':
+            self.send_json(404, {'error': f"Unknown path: {self.path}"})
+            return
+        try:
+            self.handle_generate({key: values[-1] for key, values in parse_qs(url.query).items()})
+        except RequestError as e:
+            self.send_json(e.status, {'error': str(e)})
+        except Exception as e:
+            self.send_json(500, {'error': f"{type(e).__name__}: {e}"})
+
+    def read_body(self):
+        """Return the request body as bytes"""
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            raise RequestError(400, "Empty request body (send the calibration file or a JSON request)")
+        if length > MAX_UPLOAD_BYTES:
+            raise RequestError(413, f"Request body larger than {MAX_UPLOAD_BYTES} bytes")
+        return self.rfile.read(length)
+
+    def handle_generate(self, options):
+        """Generate from an uploaded calibration file or a JSON request"""
+        service = self.server.service
+        body = self.read_body()
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip()
+
+        if content_type == 'application/json':
+            try:
+                options.update(json.loads(body))
+            except (ValueError, TypeError):
+                raise RequestError(400, "Invalid JSON request")
+            calibration_file = options.get('input')
+            if not calibration_file:
+                raise RequestError(400, "JSON requests need an 'input' path")
+            if not os.path.exists(calibration_file):
+                raise RequestError(404, f"Calibration file not found: {calibration_file}")
+            if options.get('output'):
+                result = service.generate(calibration_file, os.path.abspath(options['output']), options)
+                self.send_json(200 if result['status'] == 'ok' else 422, result)
+                return
+            upload = None
+        else:
+            calibration_file = None
+            upload = body
+
+        filename = os.path.basename(os.path.normpath(options.get('filename') or calibration_file or 'calibration.xlsx'))
+        if filename in ('', '.', '..'):
+            raise RequestError(400, f"Invalid file name: {options.get('filename')!r}")
+        if upload is not None and os.path.splitext(filename)[1].lower() not in ROW_READERS:
+            raise RequestError(400, f"filename must end in one of {', '.join(sorted(ROW_READERS))}")
+        with tempfile.TemporaryDirectory(dir=service.work_dir) as request_dir:
+            if upload is not None:
+                calibration_file = os.path.join(request_dir, filename)
+                with open(calibration_file, 'wb') as f:
+                    f.write(upload)
+            options['filename'] = filename
+            stem = os.path.splitext(filename)[0]
+            output_file = os.path.join(request_dir, 'output', f"{stem}_certificates.xlsx")
+            result = service.generate(calibration_file, output_file, options)
+            if result['status'] != 'ok':
+                self.send_json(422, {'error': result['error'], 'log': result.get('log', '')})
+                return
+
+            if result['pdf_folder']:
+                self.send_artifact(zip_artifacts(result), 'application/zip', f"{stem}_certificates.zip", result)
+            else:
+                with open(output_file, 'rb') as f:
+                    self.send_artifact(f.read(), XLSX_TYPE, os.path.basename(output_file), result)
+
+    def log_message(self, format, *args):
+        print(f"[{self.log_date_time_string()}] {self.address_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ThreadingHTTPServer on a Unix socket"""
+
+    daemon_threads = True
+
+    def server_bind(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+class IPv6HTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer on an IPv6 address (::1)"""
+
+    address_family = socket.AF_INET6
+
+
+def create_server(service, host='127.0.0.1', port=DEFAULT_PORT, unix_socket=None):
+    """Return an HTTP server for `service` on host:port (a loopback address) or on a Unix socket"""
+    if not unix_socket and not is_loopback(host):
+        raise ValueError(f"The service only listens on a loopback address, not {host}")
+    if unix_socket:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise RuntimeError("Unix sockets are not available on this platform")
+        server = UnixHTTPServer(unix_socket, CertificateRequestHandler)
+    elif ':' in host:
+        server = IPv6HTTPServer((host, port), CertificateRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), CertificateRequestHandler)
+    server.service = service
+    return server
+
+
+def main():
+    """Run the certificate service until interrupted"""
+    parser = argparse.ArgumentParser(description="Local HTTP service for certificate generation")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="Loopback address to listen on: 127.0.0.1, ::1 or localhost (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port to listen on (default: %(default)s)")
+    parser.add_argument('--unix-socket', help="Listen on this Unix socket instead of a TCP port")
+    parser.add_argument('--workers', type=int, default=max(1, min(4, os.cpu_count() or 1)),
+                        help="Worker processes (default: %(default)s)")
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE,
+                        help="Default template Excel file, or a template folder such as Base")
+    parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE,
+                        help="Default workbook writer (default: %(default)s)")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if not os.path.exists(args.template):
+        parser.error(f"Template file or folder not found: {args.template}")
+    if not args.unix_socket and not is_loopback(args.host):
+        parser.error(f"--host must be a loopback address (127.0.0.1, ::1 or localhost), not {args.host}: "
+                     f"requests may read and write any file of the service user")
+
+    service = CertificateService(args.template, args.workers, args.engine)
+    print(f"Starting {args.workers} worker(s) with template {os.path.basename(args.template)}...")
+    service.warm_up()
+    server = create_server(service, args.host, args.port, args.unix_socket)
+    where = args.unix_socket or f"http://{args.host}:{server.server_port}"
+    print(f"✓ Certificate service listening on {where} (Ctrl+C to stop)")
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)  # Service managers stop with SIGTERM
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        server.server_close()
+        service.close()
+        if args.unix_socket:
+            with contextlib.suppress(OSError):
+                os.remove(args.unix_socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+"""
+Compiled Certificate Template
+=============================
+Parses a certificate template sheet ONCE into an immutable "stamp" that can be
+applied to any number of certificate sheets.
+
+The old approach walked every template cell for every meter and copy()-ed the
+font, border, fill, number format, protection and alignment objects each time.
+A compiled template keeps:
+- cell values (only the ones the old loop copied, i.e. truthy values)
+- one entry per distinct cell style
+- column widths and row heights
+- merged cell ranges
+- embedded pictures (logos, signatures) and the print layout
+
+When bound to an output workbook the distinct styles are registered in that
+workbook's shared style tables once, and every certificate sheet simply
+reuses the resulting style IDs.
+
+A bound stamp can also stream a sheet into a write-only workbook
+(Workbook(write_only=True)), so each certificate is written to disk as soon
+as it is produced instead of being held in memory until the final save.
+
+Usage:
+    template = compile_template(template_sheet)
+    stamp = template.bind(wb_new)
+    for meter in meters:
+        ws_new = wb_new.create_sheet(title=sheet_name)
+        stamp.apply(ws_new)
+
+    # Write-only workbook
+    stamp = template.bind(wb_stream)
+    for meter in meters:
+        stamp.write(wb_stream.create_sheet(title=sheet_name), values)
+"""
+
+from collections import namedtuple
+from copy import copy
+from io import BytesIO
+from xml.etree import ElementTree
+
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.drawing.image import Image
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE, BUILTIN_FORMATS_REVERSE
+from openpyxl.utils.cell import coordinate_to_tuple, get_column_letter, range_boundaries
+from openpyxl.worksheet.cell_range import MultiCellRange
+
+
+# A distinct combination of the style attributes the generators copy
+TemplateStyle = namedtuple(
+    'TemplateStyle', 'font border fill number_format protection alignment')
+
+# A template cell: value to write (or None) and index into CompiledTemplate.styles (or None)
+TemplateCell = namedtuple('TemplateCell', 'row column value data_type style')
+
+# A picture on the template sheet: raw image bytes plus its drawing anchor
+TemplateImage = namedtuple('TemplateImage', 'data format width height anchor')
+
+# Print layout of the template sheet, used by renderers that draw the page themselves
+TemplatePage = namedtuple(
+    'TemplatePage',
+    'print_area orientation paper_size scale fit_to_page margins horizontal_centered '
+    'columns default_column_width default_row_height theme_colors')
+
+# Theme colour indexes used by styles -> clrScheme element names
+THEME_COLOR_NAMES = ('lt1', 'dk1', 'lt2', 'dk2', 'accent1', 'accent2', 'accent3',
+                     'accent4', 'accent5', 'accent6', 'hlink', 'folHlink')
+DRAWINGML_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+
+
+class CompiledTemplate:
+    """Immutable, workbook-independent snapshot of a template sheet"""
+
+    __slots__ = ('title', 'cells', 'styles', 'column_widths', 'row_heights', 'merged_ranges',
+                 'images', 'page')
+
+    def __init__(self, title, cells, styles, column_widths, row_heights, merged_ranges,
+                 images=(), page=None):
+        self.title = title
+        self.cells = tuple(cells)
+        self.styles = tuple(styles)
+        self.column_widths = tuple(column_widths)
+        self.row_heights = tuple(row_heights)
+        self.merged_ranges = tuple(merged_ranges)
+        self.images = tuple(images)
+        self.page = page
+
+    def bind(self, workbook):
+        """Register the template styles in `workbook` and return a TemplateStamp"""
+        style_arrays = []
+        for style in self.styles:
+            style_array = StyleArray()
+            style_array.fontId = workbook._fonts.add(style.font)
+            style_array.borderId = workbook._borders.add(style.border)
+            style_array.fillId = workbook._fills.add(style.fill)
+            if style.number_format in BUILTIN_FORMATS_REVERSE:
+                style_array.numFmtId = BUILTIN_FORMATS_REVERSE[style.number_format]
+            else:
+                style_array.numFmtId = (workbook._number_formats.add(style.number_format)
+                                        + BUILTIN_FORMATS_MAX_SIZE)
+            style_array.protectionId = workbook._protections.add(style.protection)
+            style_array.alignmentId = workbook._alignments.add(style.alignment)
+            style_arrays.append(style_array)
+        return TemplateStamp(self, style_arrays)
+
+    def value_block(self, values):
+        """
+        Return one rectangular block of cell contents covering `values`.
+
+        Used to fill a copied template sheet with a single range assignment
+        (e.g. Excel COM Range.Formula = rows). The block is widened until it
+        does not cut through any merged range; cells that are not in `values`
+        keep the template contents (formulas included) and merged cells other
+        than the top-left one are left empty.
+
+        Args:
+            values: {coordinate: value} to write
+
+        Returns:
+            (range address like "B7:L22", tuple of row tuples)
+        """
+        positions = [coordinate_to_tuple(coordinate) for coordinate in values]
+        min_row = min(row for row, _ in positions)
+        max_row = max(row for row, _ in positions)
+        min_col = min(column for _, column in positions)
+        max_col = max(column for _, column in positions)
+
+        merged = [range_boundaries(merged_range) for merged_range in self.merged_ranges]
+        widened = True
+        while widened:
+            widened = False
+            for m_min_col, m_min_row, m_max_col, m_max_row in merged:
+                overlaps = (m_min_row <= max_row and m_max_row >= min_row
+                            and m_min_col <= max_col and m_max_col >= min_col)
+                inside = (min_row <= m_min_row and m_max_row <= max_row
+                          and min_col <= m_min_col and m_max_col <= max_col)
+                if overlaps and not inside:
+                    min_row, max_row = min(min_row, m_min_row), max(max_row, m_max_row)
+                    min_col, max_col = min(min_col, m_min_col), max(max_col, m_max_col)
+                    widened = True
+
+        contents = {(tcell.row, tcell.column): tcell.value
+                    for tcell in self.cells if tcell.value is not None}
+        for (row, column), value in zip(positions, values.values()):
+            contents[row, column] = value
+
+        rows = tuple(
+            tuple('' if contents.get((row, column)) is None else contents[row, column]
+                  for column in range(min_col, max_col + 1))
+            for row in range(min_row, max_row + 1))
+        address = f"{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}"
+        return address, rows
+
+
+class TemplateStamp:
+    """A CompiledTemplate whose styles are registered in one output workbook"""
+
+    def __init__(self, template, style_arrays):
+        self.template = template
+        self.style_arrays = style_arrays
+
+    def apply(self, ws):
+        """Stamp the template cells, dimensions and merged ranges onto `ws`"""
+        template = self.template
+        style_arrays = self.style_arrays
+
+        for tcell in template.cells:
+            cell = ws.cell(row=tcell.row, column=tcell.column)
+            if tcell.value is not None:
+                cell._value = tcell.value
+                cell.data_type = tcell.data_type
+            if tcell.style is not None:
+                cell._style = copy(style_arrays[tcell.style])
+
+        for col_letter, width in template.column_widths:
+            ws.column_dimensions[col_letter].width = width
+        for row_num, height in template.row_heights:
+            ws.row_dimensions[row_num].height = height
+
+        for merged_range in template.merged_ranges:
+            ws.merge_cells(merged_range)
+
+        self.add_images(ws)
+
+    def add_images(self, ws):
+        """Place the template pictures (logo, signature) on `ws`"""
+        for template_image in self.template.images:
+            image = Image(BytesIO(template_image.data))
+            image.width = template_image.width
+            image.height = template_image.height
+            image.anchor = copy(template_image.anchor)
+            ws.add_image(image)
+
+    def write(self, ws, values=None, cells=None):
+        """
+        Stream the template onto a write-only worksheet and close it.
+
+        Args:
+            ws: worksheet created by a Workbook(write_only=True)
+            values: optional {coordinate: value} overriding template cell values
+            cells: optional [(row, column, value)] overriding template cell values
+                (e.g. CellMapping.cells(), no coordinate parsing)
+        """
+        template = self.template
+
+        # Dimensions must be set before the first row is appended
+        for col_letter, width in template.column_widths:
+            ws.column_dimensions[col_letter].width = width
+        for row_num, height in template.row_heights:
+            ws.row_dimensions[row_num].height = height
+        for merged_range in template.merged_ranges:
+            ws.merged_cells.add(merged_range)
+        # Pictures are written with the sheet, so they must be added before close()
+        self.add_images(ws)
+
+        rows = {}
+        for tcell in template.cells:
+            cell = WriteOnlyCell(ws)
+            if tcell.value is not None:
+                cell._value = tcell.value
+                cell.data_type = tcell.data_type
+            if tcell.style is not None:
+                cell._style = copy(self.style_arrays[tcell.style])
+            rows.setdefault(tcell.row, {})[tcell.column] = cell
+
+        cells = list(cells or [])
+        for coordinate, value in (values or {}).items():
+            cells.append(coordinate_to_tuple(coordinate) + (value,))
+        for row, column, value in cells:
+            cell = rows.setdefault(row, {}).get(column)
+            if cell is None:
+                cell = rows[row][column] = WriteOnlyCell(ws)
+            cell.value = value
+
+        max_row = max(list(rows) + [row_num for row_num, _ in template.row_heights] + [0])
+        for row_num in range(1, max_row + 1):
+            row = rows.get(row_num, {})
+            ws.append([row.get(column) for column in range(1, max(row, default=0) + 1)])
+
+        ws.close()
+
+        # The sheet XML is on disk now, so the layout objects are no longer needed
+        ws.column_dimensions.clear()
+        ws.row_dimensions.clear()
+        ws.merged_cells = MultiCellRange()
+
+
+def theme_colors(workbook):
+    """
+    Return the workbook theme palette as RGB hex strings, in style theme index order.
+
+    Args:
+        workbook: openpyxl workbook loaded from a file
+
+    Returns:
+        tuple of 'RRGGBB' strings (empty if the workbook has no theme)
+    """
+    if not workbook.loaded_theme:
+        return ()
+    scheme = ElementTree.fromstring(workbook.loaded_theme).find(
+        f'{DRAWINGML_NS}themeElements/{DRAWINGML_NS}clrScheme')
+    if scheme is None:
+        return ()
+
+    colors = []
+    for name in THEME_COLOR_NAMES:
+        color = scheme.find(f'{DRAWINGML_NS}{name}')
+        value = None
+        if color is not None and len(color):
+            value = color[0].get('lastClr') or color[0].get('val')
+        colors.append(value or '000000')
+    return tuple(colors)
+
+
+def compile_page(template_sheet):
+    """Capture the print layout of a template worksheet as a TemplatePage"""
+    page_setup = template_sheet.page_setup
+    margins = template_sheet.page_margins
+    properties = template_sheet.sheet_properties.pageSetUpPr
+    sheet_format = template_sheet.sheet_format
+
+    columns = [(col_dim.min, col_dim.max, col_dim.width, bool(col_dim.hidden))
+               for col_dim in template_sheet.column_dimensions.values()
+               if col_dim.min is not None]
+    default_column_width = sheet_format.defaultColWidth or (sheet_format.baseColWidth or 8) + 0.7109375
+
+    print_area = template_sheet.print_area
+    if print_area:
+        # "'Sheet'!$A$1:$J$35" -> "A1:J35" (first area only)
+        print_area = print_area.split(',')[0].rsplit('!', 1)[-1].replace('$', '')
+
+    return TemplatePage(
+        print_area=print_area,
+        orientation=page_setup.orientation,
+        paper_size=page_setup.paperSize,
+        scale=page_setup.scale,
+        fit_to_page=bool(properties is not None and properties.fitToPage),
+        margins=(margins.left, margins.right, margins.top, margins.bottom),
+        horizontal_centered=bool(template_sheet.print_options.horizontalCentered),
+        columns=tuple(columns),
+        default_column_width=default_column_width,
+        default_row_height=sheet_format.defaultRowHeight or 15,
+        theme_colors=theme_colors(template_sheet.parent),
+    )
+
+
+def _image_data(image):
+    """Return the bytes of an openpyxl Image and leave the image readable again"""
+    data = image._data()  # Closes the underlying file object
+    image.ref = BytesIO(data)
+    return data
+
+
+def compile_template(template_sheet):
+    """
+    Compile a template worksheet into a CompiledTemplate.
+
+    Args:
+        template_sheet: openpyxl worksheet loaded from the template file
+
+    Returns:
+        CompiledTemplate
+    """
+    cells = []
+    styles = []
+    style_index = {}
+
+    for row in template_sheet.iter_rows():
+        for cell in row:
+            value = cell.value if cell.value else None
+            style = None
+            if cell.has_style:
+                key = TemplateStyle(
+                    copy(cell.font),
+                    copy(cell.border),
+                    copy(cell.fill),
+                    cell.number_format,
+                    copy(cell.protection),
+                    copy(cell.alignment),
+                )
+                style = style_index.get(key)
+                if style is None:
+                    style = style_index[key] = len(styles)
+                    styles.append(key)
+            if value is None and style is None:
+                continue
+            cells.append(TemplateCell(cell.row, cell.column, value, cell.data_type, style))
+
+    column_widths = [(col_letter, col_dim.width)
+                     for col_letter, col_dim in template_sheet.column_dimensions.items()]
+    row_heights = [(row_num, row_dim.height)
+                   for row_num, row_dim in template_sheet.row_dimensions.items()]
+    merged_ranges = [str(merged_range) for merged_range in template_sheet.merged_cells.ranges]
+
+    # Pictures are only loaded by openpyxl when Pillow is installed
+    images = [TemplateImage(_image_data(image), image.format, image.width, image.height, copy(image.anchor))
+              for image in template_sheet._images]
+
+    return CompiledTemplate(template_sheet.title, cells, styles,
+                            column_widths, row_heights, merged_ranges,
+                            images, compile_page(template_sheet))
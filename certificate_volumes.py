@@ -0,0 +1,212 @@
+"""
+Certificate Volumes
+===================
+Splits the certificates of one run into several workbooks ("volumes"), so
+no single file has thousands of sheets for Excel to open, the PDF tab to
+list or an email to carry.
+
+Volume policy (generate_certificates(volume_size=..., volume_by=...)):
+- volume_size N:       a new volume every N sheets
+- volume_by 'floor':   one volume per floor, taken from the location text
+                       before the first '/' (12TH/AHU1 -> 12TH); meters
+                       without a floor share one volume
+- volume_by 'source':  one volume per calibration sheet or file the meters
+                       were read from (see calibration_ingest)
+With both, floors or sources larger than N sheets are split again.
+
+The volumes of Site.xlsx are written next to it as Site_001.xlsx, ... (or
+Site_12TH.xlsx, Site_12TH_2.xlsx, ... when grouped), together with an index
+manifest Site.volumes.json:
+
+    {
+        "format": 1,
+        "output": "Site.xlsx",
+        "policy": {"size": 500, "by": "floor"},
+        "sheets": 1234,
+        "volumes": [{"file": "Site_12TH.xlsx", "key": "12TH", "sheets": ["Site_12TH_AHU1", ...]}, ...]
+    }
+
+so a certificate can be found without opening every volume. Site.xlsx
+itself is not written.
+
+Usage:
+    volumes = plan_volumes("Site.xlsx", meters, volume_size=500, volume_by="floor")
+    write_volume_index("Site.xlsx", volumes, sheet_names, {"size": 500, "by": "floor"})
+
+    python certificate_volumes.py Site.xlsx                    (list the volumes)
+    python certificate_volumes.py Site.xlsx TowerB_12TH_AHU1   (find a certificate)
+"""
+
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+
+from template_registry import sheet_templates_path
+
+
+VOLUME_INDEX_FORMAT = 1
+VOLUME_GROUPS = ('floor', 'source')
+
+# key:     floor or source name ('' when split by size only)
+# file:    volume .xlsx path
+# indexes: positions of its meters/sheets in the whole run, in order
+Volume = namedtuple('Volume', 'key file indexes')
+
+_UNSAFE_NAME = re.compile(r'[^0-9A-Za-z-]+')
+
+
+def floor_of(meter):
+    """Floor of a meter: the location text before '/' in upper case (12th/AHU1 -> 12TH), or ''"""
+    location = meter.location or ''
+    return location.split('/', 1)[0].strip().upper() if '/' in location else ''
+
+
+def source_key(source):
+    """Volume key of a calibration_ingest.CalibrationSource: the file name, plus the sheet"""
+    stem = os.path.splitext(os.path.basename(source.file))[0]
+    return f"{stem} {source.sheet}" if source.sheet else stem
+
+
+def volume_index_path(output_file):
+    """Path of the index manifest of a split `output_file`"""
+    return f"{os.path.splitext(output_file)[0]}.volumes.json"
+
+
+def plan_volumes(output_file, meters, volume_size=None, volume_by=None, origins=None):
+    """
+    Decide which sheets go into which volume.
+
+    Args:
+        output_file: The single output file the volumes replace (names them)
+        meters: list of MeterRecords, in sheet order
+        volume_size: Maximum sheets per volume, or None
+        volume_by: 'floor', 'source' or None
+        origins: CalibrationSource of every meter (IngestResult.origins), for 'source'
+
+    Returns:
+        list of Volume, in order of their first sheet
+    """
+    if volume_by not in (None,) + VOLUME_GROUPS:
+        raise ValueError(f"volume_by must be one of {', '.join(VOLUME_GROUPS)}")
+    if volume_size is not None and volume_size < 1:
+        raise ValueError("volume_size must be at least 1")
+
+    groups = {}
+    for idx, meter in enumerate(meters):
+        if volume_by == 'floor':
+            key = floor_of(meter)
+        elif volume_by == 'source':
+            key = source_key(origins[idx]) if origins else ''
+        else:
+            key = ''
+        groups.setdefault(key, []).append(idx)
+
+    stem = os.path.splitext(output_file)[0]
+    volumes = []
+    used = set()
+    for key, indexes in groups.items():
+        size = volume_size or len(indexes)
+        parts = [indexes[start:start + size] for start in range(0, len(indexes), size)]
+        name = _UNSAFE_NAME.sub('_', key).strip('_') or ('other' if volume_by else '')
+        for number, part in enumerate(parts, 1):
+            if not name:
+                suffix = f"{len(volumes) + 1:03d}"
+            else:
+                suffix = f"{name}_{number}" if len(parts) > 1 else name
+            volume_file = f"{stem}_{suffix}.xlsx"
+            count = 2
+            while volume_file.lower() in used:  # '12th' and '12TH ' both become 12TH
+                volume_file = f"{stem}_{suffix}_{count}.xlsx"
+                count += 1
+            used.add(volume_file.lower())
+            volumes.append(Volume(key, volume_file, part))
+    return volumes
+
+
+def read_volume_index(output_file):
+    """Return the volume index of `output_file`, or None if it was not split"""
+    try:
+        with open(volume_index_path(output_file), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_volume_index(output_file, volumes, sheet_names, policy):
+    """
+    Write the index manifest of a split run.
+
+    Volume files listed by the previous index that this run did not write
+    again are removed (with their template record), so the folder never
+    mixes volumes of two runs.
+
+    Args:
+        output_file: The output file the volumes replace
+        volumes: list of Volume as written
+        sheet_names: Sheet name of every meter of the run
+        policy: {'size': volume_size, 'by': volume_by}
+    """
+    folder = os.path.dirname(os.path.abspath(output_file))
+    previous = read_volume_index(output_file)
+    if previous:
+        written = {os.path.basename(volume.file) for volume in volumes}
+        for entry in previous.get('volumes', []):
+            stale = os.path.join(folder, os.path.basename(entry['file']))
+            if entry['file'] not in written:
+                for path in (stale, sheet_templates_path(stale)):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    index = {
+        'format': VOLUME_INDEX_FORMAT,
+        'output': os.path.basename(output_file),
+        'policy': policy,
+        'sheets': len(sheet_names),
+        'volumes': [{'file': os.path.basename(volume.file), 'key': volume.key,
+                     'sheets': [sheet_names[idx] for idx in volume.indexes]} for volume in volumes],
+    }
+    with open(volume_index_path(output_file), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1)
+
+
+def volume_files(output_file):
+    """
+    Return [(volume path, sheet names)] of a split output file, or None.
+    """
+    index = read_volume_index(output_file)
+    if index is None:
+        return None
+    folder = os.path.dirname(os.path.abspath(output_file))
+    return [(os.path.join(folder, entry['file']), entry['sheets']) for entry in index['volumes']]
+
+
+def main():
+    """List the volumes of a split output file, or find the volume of one certificate"""
+    if len(sys.argv) < 2:
+        print("Usage: python certificate_volumes.py <output .xlsx> [sheet name]")
+        return 2
+    output_file = sys.argv[1]
+    volumes = volume_files(output_file)
+    if volumes is None:
+        print(f"ERROR: No volume index: {volume_index_path(output_file)}")
+        return 1
+
+    if len(sys.argv) > 2:
+        sheet_name = sys.argv[2]
+        for volume_file, sheet_names in volumes:
+            if sheet_name in sheet_names:
+                print(f"{sheet_name}: {volume_file}")
+                return 0
+        print(f"ERROR: {sheet_name} is in none of the {len(volumes)} volumes")
+        return 1
+
+    for volume_file, sheet_names in volumes:
+        print(f"  {len(sheet_names):5d} sheets  {os.path.basename(volume_file)}")
+    print(f"✓ {sum(len(sheet_names) for _, sheet_names in volumes)} sheets in {len(volumes)} volume(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Generation Metrics
+==================
+Instrumentation for certificate generation runs.
+
+generate_certificates() reports what it does to an observer:
+- phase_started / phase_finished: wall time and peak memory of each phase
+  (load, template, names, fill, save)
+- meters_loaded: number of meters read and how many were flagged
+- sheet_written: time and cells written for every certificate sheet
+- file_saved: size of the output file
+
+GenerationMetrics is the observer used by default; it collects the events
+and prints the timing summary at the end of a run. Pass your own
+GenerationObserver subclass to get the raw events (for logging, a progress
+bar or a monitoring system).
+
+profile_call() runs any function under cProfile and tracemalloc and writes
+the results next to the output file (the --profile option).
+
+Usage:
+    metrics = GenerationMetrics()
+    generate_certificates(cal_file, out_file, 'TowerB', template_file, observer=metrics)
+    print(metrics.summary()['phases'])
+
+    profile_call("TowerB.xlsx", generate_certificates, cal_file, "TowerB.xlsx", 'TowerB', template_file)
+"""
+
+import cProfile
+import io
+import pstats
+import sys
+import time
+import tracemalloc
+
+
+# Phases of a generation run, in order
+PHASES = ('load', 'template', 'names', 'fill', 'save')
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if it cannot be read"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                    ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / (1024 * 1024)
+    return None
+
+
+class GenerationObserver:
+    """Receives instrumentation events from a generation run; override the hooks you need"""
+
+    def phase_started(self, phase):
+        """A phase (see PHASES) begins"""
+
+    def phase_finished(self, phase, seconds, peak_rss):
+        """A phase ended after `seconds`; `peak_rss` is the process peak RSS in MB so far (or None)"""
+
+    def meters_loaded(self, count, flagged):
+        """`count` meters were read from the calibration file, `flagged` of them were flagged"""
+
+    def sheet_written(self, index, sheet_name, seconds, cells):
+        """Certificate sheet number `index` (1-based) took `seconds` and wrote `cells` cells"""
+
+    def file_saved(self, path, size):
+        """The output file was written with `size` bytes"""
+
+
+class ObserverGroup(GenerationObserver):
+    """Forwards every event to several observers"""
+
+    def __init__(self, observers):
+        self.observers = [observer for observer in observers if observer is not None]
+
+    def phase_started(self, phase):
+        for observer in self.observers:
+            observer.phase_started(phase)
+
+    def phase_finished(self, phase, seconds, peak_rss):
+        for observer in self.observers:
+            observer.phase_finished(phase, seconds, peak_rss)
+
+    def meters_loaded(self, count, flagged):
+        for observer in self.observers:
+            observer.meters_loaded(count, flagged)
+
+    def sheet_written(self, index, sheet_name, seconds, cells):
+        for observer in self.observers:
+            observer.sheet_written(index, sheet_name, seconds, cells)
+
+    def file_saved(self, path, size):
+        for observer in self.observers:
+            observer.file_saved(path, size)
+
+
+class GenerationMetrics(GenerationObserver):
+    """Collects the events of one run into totals"""
+
+    def __init__(self):
+        self.phases = {}
+        self.phase_peak_rss = {}
+        self.meters = 0
+        self.flagged = 0
+        self.sheets = 0
+        self.sheet_seconds = 0.0
+        self.slowest_sheet = (0.0, None)
+        self.cells = 0
+        self.bytes_saved = 0
+
+    def phase_finished(self, phase, seconds, peak_rss):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.phase_peak_rss[phase] = peak_rss
+
+    def meters_loaded(self, count, flagged):
+        self.meters += count
+        self.flagged += flagged
+
+    def sheet_written(self, index, sheet_name, seconds, cells):
+        self.sheets += 1
+        self.sheet_seconds += seconds
+        self.cells += cells
+        if seconds > self.slowest_sheet[0]:
+            self.slowest_sheet = (seconds, sheet_name)
+
+    def file_saved(self, path, size):
+        self.bytes_saved += size
+
+    def summary(self):
+        """Return the collected totals as a plain dict"""
+        peaks = [peak for peak in self.phase_peak_rss.values() if peak is not None]
+        return {
+            'phases': dict(self.phases),
+            'phase_peak_rss_mb': dict(self.phase_peak_rss),
+            'total_seconds': sum(self.phases.values()),
+            'meters': self.meters,
+            'flagged': self.flagged,
+            'sheets': self.sheets,
+            'sheet_seconds': self.sheet_seconds,
+            'slowest_sheet': {'name': self.slowest_sheet[1], 'seconds': self.slowest_sheet[0]},
+            'cells': self.cells,
+            'bytes_saved': self.bytes_saved,
+            'peak_rss_mb': max(peaks) if peaks else None,
+        }
+
+    def report(self):
+        """Return the summary as printable lines"""
+        lines = []
+        for phase, seconds in self.phases.items():
+            peak = self.phase_peak_rss.get(phase)
+            memory = f"   peak {peak:.0f} MB" if peak is not None else ""
+            lines.append(f"   {phase:9s} {seconds:8.3f} s{memory}")
+        if self.sheets:
+            lines.append(f"   sheets    {self.sheets} in {self.sheet_seconds:.3f} s "
+                         f"({self.sheet_seconds / self.sheets * 1000:.2f} ms avg, slowest "
+                         f"{self.slowest_sheet[0] * 1000:.2f} ms: {self.slowest_sheet[1]})")
+        if self.cells:
+            lines.append(f"   cells     {self.cells} written")
+        if self.bytes_saved:
+            lines.append(f"   saved     {self.bytes_saved / (1024 * 1024):.2f} MB")
+        return lines
+
+
+class PhaseTimer:
+    """Times consecutive phases: start() ends the running phase and begins the next"""
+
+    def __init__(self, observer):
+        self.observer = observer
+        self.phase = None
+        self.started = None
+
+    def start(self, phase):
+        """End the running phase (if any) and start `phase`"""
+        self.stop()
+        self.phase = phase
+        self.started = time.perf_counter()
+        self.observer.phase_started(phase)
+
+    def stop(self):
+        """End the running phase"""
+        if self.phase is None:
+            return
+        seconds = time.perf_counter() - self.started
+        self.observer.phase_finished(self.phase, seconds, peak_rss_mb())
+        self.phase = None
+
+
+def profile_call(profile_prefix, func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) under cProfile and tracemalloc.
+
+    Writes:
+        <profile_prefix>.prof          cProfile data (open with pstats or snakeviz)
+        <profile_prefix>.profile.txt   top functions by cumulative time, peak traced
+                                       memory and the largest allocation sites
+
+    Only the calling process is profiled, not worker processes.
+
+    Returns:
+        What func returned
+    """
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(f"{profile_prefix}.prof")
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+        report.write(f"\nPeak traced Python memory: {traced_peak / (1024 * 1024):.1f} MB\n")
+        report.write("\nLargest allocations still held at the end (by line):\n")
+        for stat in snapshot.statistics('lineno')[:25]:
+            report.write(f"  {stat}\n")
+        with open(f"{profile_prefix}.profile.txt", 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+
+        print(f"\nProfile written to {profile_prefix}.prof and {profile_prefix}.profile.txt "
+              f"(peak traced memory {traced_peak / (1024 * 1024):.1f} MB)")
@@ -5,7 +5,10 @@ User-friendly graphical interface for generating certificates and exporting to P
 
 Features:
 - File browser for easy file selection
+- A whole site in one run: a folder of calibration files and/or every sheet
+  of a workbook (one sheet per floor)
 - Real-time progress display
+- Generations and exports run as background jobs; several can run at once
 - Success/error notifications
 - PDF Export: Export one, multiple, or all certificate sheets to PDF
 - No command-line knowledge required
@@ -17,23 +20,60 @@ Usage:
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, Listbox, Scrollbar, MULTIPLE
 import os
-from openpyxl import load_workbook, Workbook
-from copy import copy
-import threading
+from openpyxl import load_workbook
+import multiprocessing
+import subprocess
+
+from calibration_ingest import ingest, source_label
+from calibration_table import calibrate
+from generation_metrics import GenerationMetrics, PhaseTimer
+from universal_certificate_generator import (build_certificate_workbook, certificate_sheet_names,
+                                             certificate_values, default_sheet_prefix,
+                                             save_certificate_workbook)
+from certificate_pdf import export_combined_pdf, export_sheet_pdfs
+from template_cache import load_cell_mapping, load_template
+from template_registry import (RegistryError, load_registry, read_sheet_templates, resolve_templates,
+                               write_sheet_templates)
+from job_queue import DONE, FAILED, JobQueue
+
+# Generate through Excel COM instead of the in-process engine (Windows + Excel only)
+USE_EXCEL_COM = False
+
+# Excel XlCalculation constant
+XL_CALCULATION_MANUAL = -4135
+
+# Generations/exports that run at the same time (more are queued)
+GUI_JOB_WORKERS = 2
+
+# How often the Tk loop picks up job progress (milliseconds)
+JOB_POLL_MS = 100
+
+# Rows kept in the jobs list (the oldest finished jobs are removed)
+MAX_JOB_ROWS = 50
+
+# Worker processes for one PDF export (small exports run serially)
+PDF_EXPORT_JOBS = os.cpu_count() or 1
 
 
 class CertificateGeneratorGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Certificate Generator & PDF Export")
-        self.root.geometry("850x700")
+        self.root.geometry("850x800")
         self.root.resizable(False, False)
         
         # Base directory (parent folder)
         self.base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
         
+        # Background jobs; their progress is applied to the widgets by poll_jobs()
+        self.jobs = JobQueue(GUI_JOB_WORKERS)
+        self.job_rows = []
+        self.active_job = {'generate': None, 'export': None}
+        
         # Create UI
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(JOB_POLL_MS, self.poll_jobs)
     
     def create_widgets(self):
         """Create all UI widgets"""
@@ -57,6 +97,13 @@ class CertificateGeneratorGUI:
         # Create widgets for each tab
         self.create_generate_tab(tab_generate)
         self.create_pdf_tab(tab_pdf)
+        
+        # Jobs list (all generations and exports of this session)
+        jobs_frame = tk.Frame(self.root, padx=20)
+        jobs_frame.pack(fill="x", pady=(0, 10))
+        tk.Label(jobs_frame, text="Jobs:", font=("Arial", 10, "bold")).pack(anchor="w")
+        self.jobs_listbox = Listbox(jobs_frame, height=4, width=100)
+        self.jobs_listbox.pack(fill="x")
     
     def create_generate_tab(self, parent):
         """Create widgets for certificate generation tab"""
@@ -77,6 +124,14 @@ class CertificateGeneratorGUI:
         browse_btn = tk.Button(file_frame, text="Browse", command=self.browse_file)
         browse_btn.pack(side="left")
         
+        # A folder of calibration files (e.g. daily files) is generated as one site
+        browse_site_btn = tk.Button(file_frame, text="Folder", command=self.browse_calibration_folder)
+        browse_site_btn.pack(side="left", padx=(5, 0))
+        
+        # Read every sheet of the workbook(s), e.g. one sheet per floor
+        self.all_sheets = tk.BooleanVar(value=False)
+        tk.Checkbutton(file_frame, text="All sheets", variable=self.all_sheets).pack(side="left", padx=(5, 0))
+        
         # Output folder selection
         tk.Label(main_frame, text="2. Output Folder:", 
                 font=("Arial", 11, "bold")).grid(row=2, column=0, sticky="w", pady=(20, 5))
@@ -186,6 +241,11 @@ class CertificateGeneratorGUI:
         browse_folder_btn = tk.Button(folder_frame, text="Browse", command=self.browse_output_folder)
         browse_folder_btn.pack(side="left")
         
+        # Output mode: one PDF per sheet, or one bookmarked PDF for the whole file
+        self.combined_pdf = tk.BooleanVar(value=False)
+        tk.Checkbutton(main_frame, text="Combined PDF (one file, a bookmarked page per certificate)",
+                       variable=self.combined_pdf).grid(row=7, column=0, sticky="w", pady=(10, 0))
+        
         # Export button
         self.export_btn = tk.Button(main_frame, text="📄 Export to PDF", 
                                     command=self.export_to_pdf,
@@ -193,48 +253,52 @@ class CertificateGeneratorGUI:
                                     bg="#E91E63", fg="white",
                                     padx=20, pady=10,
                                     cursor="hand2")
-        self.export_btn.grid(row=7, column=0, pady=20)
+        self.export_btn.grid(row=8, column=0, pady=20)
         
         # Progress bar
         self.pdf_progress = ttk.Progressbar(main_frame, length=500, mode='determinate')
-        self.pdf_progress.grid(row=8, column=0, pady=10)
+        self.pdf_progress.grid(row=9, column=0, pady=10)
         
         # Status label
         self.pdf_status_label = tk.Label(main_frame, text="Select a certificate file to begin", 
                                         font=("Arial", 10), fg="gray")
-        self.pdf_status_label.grid(row=9, column=0, pady=5)
+        self.pdf_status_label.grid(row=10, column=0, pady=5)
     
     def browse_file(self):
         """Open file browser dialog"""
         filename = filedialog.askopenfilename(
             initialdir=self.base_dir,
             title="Select Calibration File",
-            filetypes=(("Excel Files", "*.xlsx *.xls"), ("All Files", "*.*"))
+            filetypes=(("Calibration Files", "*.xlsx *.xlsm *.csv *.parquet"), ("Excel Files", "*.xlsx *.xls"),
+                       ("All Files", "*.*"))
         )
         if filename:
-            self.file_entry.delete(0, tk.END)
-            self.file_entry.insert(0, filename)
-            
-            # Auto-generate output name based on input
-            base_name = os.path.splitext(os.path.basename(filename))[0]
-            # Extract tower name (e.g., "TowerB", "GF", "Basement")
-            if "TowerB" in base_name or "TOWER B" in base_name.upper():
-                prefix = "TowerB"
-            elif "TowerC" in base_name or "TOWER C" in base_name.upper():
-                prefix = "TowerC"
-            elif "GROUND" in base_name.upper():
-                prefix = "GF"
-            elif "BASEMENT" in base_name.upper():
-                prefix = "Basement"
-            else:
-                prefix = "Tower"
-            
-            self.prefix_entry.delete(0, tk.END)
-            self.prefix_entry.insert(0, prefix)
-            
-            output_name = f"CYBER_PARK_{prefix.upper()}_complete.xlsx"
-            self.output_entry.delete(0, tk.END)
-            self.output_entry.insert(0, output_name)
+            self.set_calibration_input(filename)
+    
+    def browse_calibration_folder(self):
+        """Open folder browser for a folder of calibration files (one site)"""
+        folder = filedialog.askdirectory(
+            initialdir=self.base_dir,
+            title="Select Folder of Calibration Files"
+        )
+        if folder:
+            self.set_calibration_input(folder)
+    
+    def set_calibration_input(self, path):
+        """Show the selected calibration file or folder and fill in prefix and output name"""
+        self.file_entry.delete(0, tk.END)
+        self.file_entry.insert(0, path)
+        
+        # Auto-generate output name based on input
+        # Extract tower name (e.g., "TowerB", "GF", "Basement")
+        prefix = default_sheet_prefix(path)
+        
+        self.prefix_entry.delete(0, tk.END)
+        self.prefix_entry.insert(0, prefix)
+        
+        output_name = f"CYBER_PARK_{prefix.upper()}_complete.xlsx"
+        self.output_entry.delete(0, tk.END)
+        self.output_entry.insert(0, output_name)
     
     def browse_output_folder(self):
         """Open folder browser for output folder"""
@@ -249,10 +313,9 @@ class CertificateGeneratorGUI:
     def update_status(self, message, color="black"):
         """Update status label"""
         self.status_label.config(text=message, fg=color)
-        self.root.update()
     
     def generate_certificates(self):
-        """Generate certificates in a separate thread"""
+        """Queue a certificate generation job"""
         calibration_file = self.file_entry.get().strip()
         output_folder = self.output_folder_entry.get().strip()
         output_file = self.output_entry.get().strip()
@@ -287,140 +350,178 @@ class CertificateGeneratorGUI:
             messagebox.showerror("Error", "Please enter a sheet prefix")
             return
         
-        # Disable button and start progress
-        self.generate_btn.config(state="disabled")
-        self.progress.config(mode='determinate', value=0, maximum=100)
-        self.update_status("⏳ Generating certificates...", "blue")
+        # Templates in the Base folder; the registry picks one per meter
+        template_file = self.find_template_file()
+        if not template_file:
+            self.update_status("✗ No template file found", "red")
+            messagebox.showerror("Template Missing", 
+                               f"No usable Excel template found in:\n{self.template_folder()}\n\n"
+                               f"Please place your certificate template (.xlsx) in the Base folder.")
+            return
+        template_file = self.template_folder()
+        print(f"DEBUG: Using templates in: {template_file}")
+        
+        # Save output in the selected output folder
+        output_path = os.path.abspath(os.path.join(output_folder, output_file))
+        print(f"DEBUG: Output will be saved at: {output_path}")
+        
+        # Two jobs must never write the same file
+        for job in self.jobs.running('generate'):
+            if job.context['output_path'] == output_path:
+                messagebox.showerror("Already Running", 
+                                   f"Job #{job.id} is already writing:\n{output_path}")
+                return
         
-        # Run in thread to avoid blocking UI
-        thread = threading.Thread(target=self._generate_worker, 
-                                 args=(calibration_file, output_folder, output_file, sheet_prefix))
-        thread.start()
+        # Run as a background job to avoid blocking the UI
+        job = self.jobs.submit('generate', f"Generate {sheet_prefix} -> {output_file}", self._generate_job,
+                               calibration_file, output_path, sheet_prefix, template_file, self.all_sheets.get(),
+                               context={'output_path': output_path, 'output_file': output_file})
+        self.add_job_row(job)
+        self.active_job['generate'] = job.id
+        self.progress.config(mode='determinate', value=0, maximum=100)
+        self.update_status(f"⏳ Job #{job.id} queued...", "blue")
     
-    def _generate_worker(self, calibration_file, output_folder, output_file, sheet_prefix):
-        """Worker function for certificate generation"""
+    def template_folder(self):
+        """Folder holding the certificate template"""
+        return os.path.join(os.path.dirname(__file__), 'Base')
+    
+    def find_template_file(self):
+        """Return the default certificate template of the Base folder, or None"""
         try:
-            # Find template file in Base folder
-            base_folder = os.path.join(os.path.dirname(__file__), 'Base')
-            template_files = [f for f in os.listdir(base_folder) if f.endswith('.xlsx') and not f.startswith('~$')]
-            
-            if not template_files:
+            registry = load_registry(self.template_folder())
+        except (OSError, RegistryError) as e:
+            print(f"DEBUG: Template registry error: {e}")
+            return None
+        return registry.path(registry.default)
+    
+    def _generate_job(self, report, calibration_file, output_path, sheet_prefix, template_file, all_sheets=False):
+        """Job function for certificate generation (worker thread: no Tk calls here)"""
+        # Check if output file is already open
+        if os.path.exists(output_path):
+            try:
+                # Try to open in write mode to check if file is locked
+                with open(output_path, 'a'):
+                    pass
+            except PermissionError:
+                raise PermissionError(f"The output file is currently open:\n{os.path.basename(output_path)}\n\n"
+                                      f"Please close it in Excel and try again.")
+        
+        # Generate certificates with progress reported through the job queue
+        def progress_callback(current, total):
+            report(current, total, f"Creating certificate {current} of {total}...")
+        
+        return self._generate(calibration_file, output_path, sheet_prefix, template_file, progress_callback,
+                              all_sheets)
+    
+    def on_generate_event(self, event):
+        """Apply a generation job event to the Generate tab (Tk thread)"""
+        job = event.job
+        active = self.active_job['generate'] == job.id
+        
+        if event.kind == 'started' and active:
+            self.update_status(f"⏳ Generating certificates (job #{job.id})...", "blue")
+        elif event.kind == 'progress' and active:
+            self.update_status(f"⏳ {job.message}", "blue")
+            self.progress.config(value=job.current, maximum=job.total)
+        elif event.kind == 'done':
+            if active:
                 self.progress.config(value=0)
-                self.generate_btn.config(state="normal")
-                self.update_status("✗ No template file found", "red")
-                messagebox.showerror("Template Missing", 
-                                   f"No Excel template file found in:\n{base_folder}\n\n"
-                                   f"Please place your certificate template (.xlsx) in the Base folder.")
-                return
-            
-            template_file = os.path.join(base_folder, template_files[0])
-            print(f"DEBUG: Using template file: {template_file}")
-            
-            # Save output in the selected output folder
-            output_path = os.path.join(output_folder, output_file)
-            print(f"DEBUG: Output will be saved at: {output_path}")
-            
-            # Check if output file is already open
-            if os.path.exists(output_path):
-                try:
-                    # Try to open in write mode to check if file is locked
-                    with open(output_path, 'a'):
-                        pass
-                except PermissionError:
-                    self.progress.config(value=0)
-                    self.generate_btn.config(state="normal")
-                    self.update_status(f"✗ File is open in Excel", "red")
-                    messagebox.showerror("File In Use", 
-                                       f"The output file is currently open:\n{output_file}\n\n"
-                                       f"Please close it in Excel and try again.")
-                    return
-            
-            # Generate certificates with progress callback
-            def progress_callback(current, total):
-                self.root.after(0, lambda: self.update_status(f"⏳ Creating certificate {current} of {total}...", "blue"))
-                self.root.after(0, lambda: self.progress.config(value=current, maximum=total))
-            
-            count = self._generate(calibration_file, output_path, sheet_prefix, template_file, progress_callback)
-            
-            # Success
-            self.progress.config(value=0)
-            self.generate_btn.config(state="normal")
-            self.update_status(f"✓ Success! Created {count} certificates", "green")
+                self.update_status(f"✓ Success! Created {job.result} certificates", "green")
             
             # Show success message with option to open folder
-            result = messagebox.askyesno("Success", 
-                              f"Successfully created {count} certificate sheets!\n\n"
-                              f"Output file saved at:\n{output_path}\n\n"
-                              f"Do you want to open the folder?")
-            
-            if result:
-                # Open folder and select the file
-                import subprocess
-                subprocess.Popen(f'explorer /select,"{output_path}"')
-        
-        except PermissionError as e:
-            # File access error
-            self.progress.config(value=0)
-            self.generate_btn.config(state="normal")
-            self.update_status(f"✗ File is locked", "red")
-            messagebox.showerror("File Access Error", 
-                               f"Cannot access the file (it may be open in Excel):\n\n"
-                               f"{str(e)}\n\n"
-                               f"Please close the file and try again.")
-        
-        except Exception as e:
-            # Other errors
-            self.root.after(0, lambda: self.progress.config(value=0))
-            self.root.after(0, lambda: self.generate_btn.config(state="normal"))
-            self.root.after(0, lambda: self.update_status(f"✗ Error: {str(e)}", "red"))
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Failed to generate certificates:\n\n{str(e)}"))
+            self.show_dialog(self.ask_open_output, job.result, job.context['output_path'])
+        elif event.kind == 'failed':
+            print(job.error_text)
+            if active:
+                self.progress.config(value=0)
+            if isinstance(job.error, PermissionError):
+                # File access error
+                if active:
+                    self.update_status(f"✗ File is locked", "red")
+                self.show_dialog(messagebox.showerror, "File Access Error", 
+                                 f"Cannot access the file (it may be open in Excel):\n\n"
+                                 f"{str(job.error)}\n\n"
+                                 f"Please close the file and try again.")
+            else:
+                # Other errors
+                if active:
+                    self.update_status(f"✗ Error: {str(job.error)}", "red")
+                self.show_dialog(messagebox.showerror, "Error",
+                                 f"Failed to generate certificates:\n\n{str(job.error)}")
     
-    def _generate(self, calibration_file, output_file, sheet_prefix, template_file, progress_callback=None):
-        """Core generation logic using Excel COM to preserve images"""
+    def ask_open_output(self, count, output_path):
+        """Report a finished generation and offer to open its folder"""
+        result = messagebox.askyesno("Success", 
+                          f"Successfully created {count} certificate sheets!\n\n"
+                          f"Output file saved at:\n{output_path}\n\n"
+                          f"Do you want to open the folder?")
+        
+        if result:
+            # Open folder and select the file
+            subprocess.Popen(f'explorer /select,"{output_path}"')
+    
+    def read_site_meters(self, calibration_file, all_sheets=False):
+        """Meters of a calibration file or folder (every sheet with all_sheets), one reading per serial"""
+        ingested = ingest(calibration_file, all_sheets, jobs=os.cpu_count() or 1)
+        for source, count in ingested.sources:
+            print(f"DEBUG: {count} meters from {source_label(source)}")
+        if ingested.duplicates:
+            print(f"DEBUG: {len(ingested.duplicates)} serial(s) delivered again, latest reading used")
+        return ingested.meters
+    
+    def _generate(self, calibration_file, output_file, sheet_prefix, template_file, progress_callback=None,
+                  all_sheets=False):
+        """Core generation logic: in-process engine, or Excel COM when USE_EXCEL_COM is set"""
+        metrics = GenerationMetrics()
+        phases = PhaseTimer(metrics)
+        
+        # Step 1: Extract meter data and run the calibration maths over all meters
+        phases.start('load')
+        meters = self.read_site_meters(calibration_file, all_sheets)
+        calibrate(meters)
+        if USE_EXCEL_COM:
+            return self._generate_excel(meters, output_file, sheet_prefix, template_file, progress_callback)
+        
+        # Step 2: Load the compiled template (logo and signature included)
+        phases.start('template')
+        template_file, routes = resolve_templates(template_file, meters, sheet_prefix)
+        template = load_template(template_file)
+        mapping = load_cell_mapping(template_file)
+        
+        # Step 3: Create certificate sheets, streamed to disk one by one
+        phases.start('names')
+        sheet_names = certificate_sheet_names(meters, sheet_prefix)
+        phases.start('fill')
+        wb_new = build_certificate_workbook(template, meters, sheet_names, streaming=True,
+                                           progress_callback=progress_callback, observer=metrics, mapping=mapping,
+                                           routes=routes)
+        
+        # Step 4: Save next to the output first so an open/locked file is never half written
+        phases.start('save')
+        output_path = os.path.abspath(output_file)
+        tmp_path = os.path.join(os.path.dirname(output_path), f"~${os.path.basename(output_path)}.tmp")
+        save_certificate_workbook(wb_new, tmp_path)
+        os.replace(tmp_path, output_path)
+        write_sheet_templates(output_path, template_file, routes, sheet_names)  # For the PDF export
+        phases.stop()
+        metrics.file_saved(output_path, os.path.getsize(output_path))
+        print(f"DEBUG: Done! Created {len(meters)} certificates")
+        for line in metrics.report():
+            print(f"DEBUG: {line.strip()}")
+        
+        return len(meters)
+    
+    def _generate_excel(self, meters, output_file, sheet_prefix, template_file, progress_callback=None):
+        """Legacy generation through Excel COM (Windows with Excel installed only); meters come calibrated"""
         import win32com.client
         
-        # Step 1: Extract meter data
-        wb_cal = load_workbook(calibration_file)
-        ws_cal = wb_cal['Sheet1']
-        
-        meters = []
-        for row in ws_cal.iter_rows(min_row=5, values_only=False):
-            if row[0].value and row[1].value:
-                before_mwh = row[7].value
-                before_kwh = row[8].value
-                if before_mwh:
-                    before_unit, before_value = 'MWH', before_mwh
-                elif before_kwh:
-                    before_unit, before_value = 'KWH', before_kwh
-                else:
-                    before_unit, before_value = None, None
-                
-                after_mwh = row[13].value if len(row) > 13 else None
-                after_kwh = row[14].value if len(row) > 14 else None
-                if after_mwh:
-                    after_unit, after_value = 'MWH', after_mwh
-                elif after_kwh:
-                    after_unit, after_value = 'KWH', after_kwh
-                else:
-                    after_unit, after_value = None, None
-                
-                meters.append({
-                    'location': str(row[0].value).strip(),
-                    'serial': str(row[1].value).strip(),
-                    'meter_size': row[2].value,
-                    'before_inlet': row[5].value,
-                    'before_outlet': row[4].value,
-                    'before_m3hr': row[6].value,
-                    'before_unit': before_unit,
-                    'before_value': before_value,
-                    'after_inlet': row[11].value if len(row) > 11 else None,
-                    'after_outlet': row[10].value if len(row) > 10 else None,
-                    'after_m3hr': row[12].value if len(row) > 12 else None,
-                    'after_unit': after_unit,
-                    'after_value': after_value,
-                })
-        
-        wb_cal.close()
+        # Step 1: Pick the template for the meters
+        template_file, routes = resolve_templates(template_file, meters, sheet_prefix)
+        if routes:
+            raise ValueError("Excel COM generation copies one template file; this calibration file "
+                             "needs several templates (turn USE_EXCEL_COM off)")
+        template = load_template(template_file)
+        mapping = load_cell_mapping(template_file)
         
         # Step 2: Copy template to output
         output_path = os.path.abspath(output_file)
@@ -436,11 +537,11 @@ class CertificateGeneratorGUI:
         # Step 3: Copy template file to output location
         import shutil
         shutil.copy2(template_path, output_path)
-        print(f"DEBUG: Copied template to {output_path}")
         
         # Step 4: Use Excel COM to duplicate sheets
         excel = None
         wb_new = None
+        settings = None
         try:
             excel = win32com.client.Dispatch("Excel.Application")
             excel.Visible = False
@@ -450,102 +551,50 @@ class CertificateGeneratorGUI:
             wb_new = excel.Workbooks.Open(output_path)
             template_ws = wb_new.Worksheets(1)
             
-            print(f"DEBUG: Starting with {wb_new.Worksheets.Count} sheet(s)")
-            print(f"DEBUG: Processing {len(meters)} meters")
+            # No repaints, recalculation or events while the sheets are filled
+            # (Dispatch may attach to the user's Excel: its settings are put back below)
+            settings = (excel.ScreenUpdating, excel.EnableEvents, excel.Calculation)
+            excel.ScreenUpdating = False
+            excel.EnableEvents = False
+            excel.Calculation = XL_CALCULATION_MANUAL
             
             # Step 4: Create certificate sheets
-            for idx, meter in enumerate(meters, 1):
+            sheet_names = certificate_sheet_names(meters, sheet_prefix)
+            ws_new = None
+            for idx, (meter, sheet_name) in enumerate(zip(meters, sheet_names), 1):
                 # Update progress
                 if progress_callback:
                     progress_callback(idx, len(meters))
                 
-                print(f"DEBUG: Processing meter {idx}/{len(meters)}: {meter['location']}")
-                
-                # Sanitize location name for Excel sheet name
-                # Excel doesn't allow: : \ / ? * [ ]
-                location_clean = (meter['location'].upper()
-                                 .replace(' ', '_')
-                                 .replace('(', '').replace(')', '')
-                                 .replace('&', 'AND')
-                                 .replace('-', '_')
-                                 .replace(':', '')
-                                 .replace('\\', '')
-                                 .replace('/', '')
-                                 .replace('?', '')
-                                 .replace('*', '')
-                                 .replace('[', '')
-                                 .replace(']', '')
-                                 .replace("'", '')
-                                 .replace('"', ''))
-                
-                # Ensure name doesn't exceed 31 characters and isn't empty
-                sheet_name = f"{sheet_prefix}_{location_clean}"[:31].strip('_')
-                if not sheet_name:
-                    sheet_name = f"{sheet_prefix}_Sheet{idx}"
-                
-                print(f"DEBUG: Sheet name: {sheet_name}")
-                
                 # Copy template sheet within the same workbook
                 # First iteration uses existing sheet, subsequent iterations create copies
                 if idx == 1:
                     # Use the existing first sheet
-                    ws_new = wb_new.Worksheets(1)
-                    ws_new.Name = sheet_name
+                    ws_new = template_ws
                 else:
-                    # Copy the template sheet (correct syntax: Before=None, After=target_sheet)
-                    print(f"DEBUG: Before copy - Count: {wb_new.Worksheets.Count}")
-                    template_ws.Copy(None, wb_new.Worksheets(wb_new.Worksheets.Count))
-                    print(f"DEBUG: After copy - Count: {wb_new.Worksheets.Count}")
-                    ws_new = wb_new.Worksheets(wb_new.Worksheets.Count)
-                    ws_new.Name = sheet_name
-                
-                print(f"DEBUG: After processing sheet {idx}, workbook has {wb_new.Worksheets.Count} sheets")
+                    # Copy the template sheet after the previous certificate (Before=None, After=sheet)
+                    template_ws.Copy(None, ws_new)
+                    ws_new = wb_new.Worksheets(idx)
+                ws_new.Name = sheet_name
                 
-                # Fill data
-                ws_new.Range("B7").Value = f"Serial No: {meter['serial']}"
-                ws_new.Range("B8").Value = f"Meter Location : {meter['location']}"
-                meter_size = f"DN-{meter['meter_size']}" if meter['meter_size'] else "DN-65"
-                ws_new.Range("B9").Value = f"Meter Size : {meter_size}"
-                
-                if meter['before_unit'] and meter['before_value'] is not None:
-                    ws_new.Range("I13").Value = f"{meter['before_unit']}= BTU*{meter['before_value']}"
-                if meter['before_inlet'] is not None:
-                    ws_new.Range("D14").Value = float(meter['before_inlet'])
-                if meter['before_outlet'] is not None:
-                    ws_new.Range("D15").Value = float(meter['before_outlet'])
-                if meter['before_m3hr'] is not None:
-                    ws_new.Range("F16").Value = float(meter['before_m3hr'])
-                if meter['before_inlet'] and meter['before_outlet']:
-                    ws_new.Range("D16").Value = abs(float(meter['before_outlet']) - float(meter['before_inlet']))
-                
-                if meter['after_unit'] and meter['after_value'] is not None:
-                    ws_new.Range("I19").Value = f"{meter['after_unit']}= BTU*{meter['after_value']}"
-                if meter['after_inlet'] is not None:
-                    ws_new.Range("D20").Value = float(meter['after_inlet'])
-                if meter['after_outlet'] is not None:
-                    ws_new.Range("D21").Value = float(meter['after_outlet'])
-                if meter['after_m3hr'] is not None:
-                    ws_new.Range("F22").Value = float(meter['after_m3hr'])
-            
-            print(f"DEBUG: Loop complete. Workbook has {wb_new.Worksheets.Count} sheets")
+                # Fill data: one 2-D array assignment instead of a COM call per cell.
+                # Cells the meter does not set get the template contents back, so
+                # values copied from earlier certificates never leak through.
+                address, rows = template.value_block(certificate_values(meter, mapping))
+                ws_new.Range(address).Formula = rows
             
-            # No need to delete default sheets - we're working with copied file
-            
-            print(f"DEBUG: After cleanup, workbook has {wb_new.Worksheets.Count} sheets")
-            
-            # Save and close
-            print(f"DEBUG: Saving workbook...")
             wb_new.Save()  # Use Save() instead of SaveAs() since file already exists
-            print(f"DEBUG: Closing workbook...")
-            wb_new.Close(SaveChanges=False)
-            print(f"DEBUG: Quitting Excel...")
-            excel.Quit()
-            print(f"DEBUG: Done! Created {len(meters)} certificates")
+            write_sheet_templates(output_path, template_file, None, sheet_names)  # For the PDF export
             
             return len(meters)
             
         finally:
-            # Ensure Excel is closed even if there's an error
+            # Restore Excel's settings and close it, also when filling failed
+            try:
+                if settings:
+                    excel.ScreenUpdating, excel.EnableEvents, excel.Calculation = settings
+            except:
+                pass
             try:
                 if wb_new:
                     wb_new.Close(SaveChanges=False)
@@ -604,10 +653,9 @@ class CertificateGeneratorGUI:
     def update_pdf_status(self, message, color="black"):
         """Update PDF status label"""
         self.pdf_status_label.config(text=message, fg=color)
-        self.root.update()
     
     def export_to_pdf(self):
-        """Export selected sheets to PDF"""
+        """Queue a PDF export job for the selected sheets"""
         excel_file = self.pdf_file_entry.get().strip()
         output_folder = self.pdf_output_entry.get().strip()
         selected_indices = self.sheets_listbox.curselection()
@@ -629,102 +677,171 @@ class CertificateGeneratorGUI:
             messagebox.showerror("Error", "Please select an output folder")
             return
         
+        # The page layout (borders, logos, signatures) comes from the template each sheet was
+        # built from, as recorded at generation time; unrecorded sheets use the default template
+        template_file = self.find_template_file()
+        if not template_file:
+            self.update_pdf_status("✗ No template file found", "red")
+            messagebox.showerror("Template Missing", 
+                               f"No Excel template file found in:\n{self.template_folder()}")
+            return
+        sheet_templates = read_sheet_templates(excel_file)
+        print(f"DEBUG: Template record: {'found' if sheet_templates else 'none'}")
+        if sheet_templates is None and load_registry(self.template_folder()).rules:
+            if not messagebox.askyesno("Template Unknown",
+                                       f"{os.path.basename(excel_file)} has no record of the template each "
+                                       f"sheet was built from, and the templates in:\n{self.template_folder()}\n"
+                                       f"are picked per meter.\n\n"
+                                       f"Export every sheet with the layout of "
+                                       f"{os.path.basename(template_file)} anyway?"):
+                return
+        
         # Get selected sheet names
         selected_sheets = [self.sheets_listbox.get(i) for i in selected_indices]
         
-        # Disable button and start export
-        self.export_btn.config(state="disabled")
+        # Combined mode writes <output folder>/<certificate file name>.pdf
+        combined_path = None
+        if self.combined_pdf.get():
+            combined_path = os.path.join(output_folder, os.path.splitext(os.path.basename(excel_file))[0] + '.pdf')
+            title = f"Export {os.path.basename(combined_path)} ({len(selected_sheets)} pages)"
+        else:
+            title = f"Export {len(selected_sheets)} PDF(s) from {os.path.basename(excel_file)}"
+        
+        # Run as a background job to avoid blocking the UI
+        job = self.jobs.submit('export', title,
+                               self._export_job, excel_file, output_folder, selected_sheets, template_file,
+                               combined_path, sheet_templates,
+                               context={'output_folder': output_folder, 'combined_path': combined_path})
+        self.add_job_row(job)
+        self.active_job['export'] = job.id
         self.pdf_progress['value'] = 0
-        self.update_pdf_status(f"Exporting {len(selected_sheets)} sheet(s) to PDF...", "blue")
-        
-        # Run in thread to avoid blocking UI
-        thread = threading.Thread(target=self._export_worker, 
-                                 args=(excel_file, output_folder, selected_sheets))
-        thread.start()
+        self.update_pdf_status(f"Exporting {len(selected_sheets)} sheet(s) to PDF (job #{job.id})...", "blue")
     
-    def _export_worker(self, excel_file, output_folder, selected_sheets):
-        """Worker function for PDF export"""
-        try:
-            # Create output folder if it doesn't exist
-            os.makedirs(output_folder, exist_ok=True)
-            
-            # Import win32com for Excel automation
-            try:
-                import win32com.client
-            except ImportError:
-                self.root.after(0, lambda: messagebox.showerror("Error", 
-                    "PDF export requires pywin32 package.\n\n"
-                    "Install it with:\n"
-                    ".venv\\Scripts\\pip.exe install pywin32"))
-                self.export_btn.config(state="normal")
-                self.update_pdf_status("✗ Missing pywin32 package", "red")
-                return
-            
-            # Initialize Excel application
-            excel = win32com.client.Dispatch("Excel.Application")
-            excel.Visible = False
-            excel.DisplayAlerts = False
-            
-            # Open workbook
-            abs_path = os.path.abspath(excel_file)
-            wb = excel.Workbooks.Open(abs_path)
-            
-            total = len(selected_sheets)
-            exported = []
-            failed = []
-            
-            for idx, sheet_name in enumerate(selected_sheets, 1):
-                try:
-                    # Update progress
-                    progress = (idx / total) * 100
-                    self.pdf_progress['value'] = progress
-                    self.update_pdf_status(f"Exporting {idx}/{total}: {sheet_name}", "blue")
-                    
-                    # Get worksheet
-                    ws = wb.Worksheets(sheet_name)
-                    
-                    # Create PDF filename
-                    pdf_filename = f"{sheet_name}.pdf"
-                    pdf_path = os.path.join(output_folder, pdf_filename)
-                    
-                    # Export to PDF
-                    ws.ExportAsFixedFormat(0, pdf_path)  # 0 = xlTypePDF
-                    exported.append(sheet_name)
-                    
-                except Exception as e:
-                    failed.append((sheet_name, str(e)))
-            
-            # Close workbook and Excel
-            wb.Close(SaveChanges=False)
-            excel.Quit()
-            
-            # Success
-            self.export_btn.config(state="normal")
-            self.pdf_progress['value'] = 100
+    def _export_job(self, report, excel_file, output_folder, selected_sheets, template_file, combined_path=None,
+                    sheet_templates=None):
+        """Job function for PDF export (worker thread: no Tk calls here)"""
+        def progress_callback(current, total, sheet_name):
+            report(current, total, f"Exporting {current}/{total}: {sheet_name}")
+        
+        if combined_path:
+            # One PDF, pages in the selected order, streamed to disk in batches
+            pages, failed = export_combined_pdf(excel_file, selected_sheets, combined_path, template_file,
+                                                progress_callback, jobs=PDF_EXPORT_JOBS,
+                                                sheet_templates=sheet_templates)
+            return pages, failed
+        
+        # Large exports are split over PDF_EXPORT_JOBS processes, each with its own renderer
+        return export_sheet_pdfs(excel_file, selected_sheets, output_folder, template_file,
+                                 progress_callback, jobs=PDF_EXPORT_JOBS, sheet_templates=sheet_templates)
+    
+    def on_export_event(self, event):
+        """Apply a PDF export job event to the Export tab (Tk thread)"""
+        job = event.job
+        active = self.active_job['export'] == job.id
+        output_folder = job.context['output_folder']
+        
+        if event.kind == 'progress' and active:
+            self.pdf_progress['value'] = job.current / job.total * 100
+            self.update_pdf_status(job.message, "blue")
+        elif event.kind == 'done':
+            exported, failed = job.result
+            if active:
+                self.pdf_progress['value'] = 100
             
-            if failed:
+            combined_path = job.context.get('combined_path')
+            if combined_path:
+                if active:
+                    self.update_pdf_status(f"✓ Exported {exported} page(s) to {os.path.basename(combined_path)}",
+                                           "orange" if failed else "green")
+                message = f"Exported {exported} certificate page(s) into one PDF:\n{combined_path}"
+                if failed:
+                    fail_msg = "\n".join([f"- {name}: {err}" for name, err in failed])
+                    self.show_dialog(messagebox.showwarning, "Partial Success",
+                                     f"{message}\n\nFailed ({len(failed)}):\n{fail_msg}")
+                else:
+                    self.show_dialog(messagebox.showinfo, "Success", message)
+            elif failed:
                 fail_msg = "\n".join([f"- {name}: {err}" for name, err in failed])
-                self.update_pdf_status(f"✓ Exported {len(exported)}, {len(failed)} failed", "orange")
-                messagebox.showwarning("Partial Success", 
+                if active:
+                    self.update_pdf_status(f"✓ Exported {len(exported)}, {len(failed)} failed", "orange")
+                self.show_dialog(messagebox.showwarning, "Partial Success", 
                     f"Exported {len(exported)} PDF(s) successfully.\n\n"
                     f"Failed ({len(failed)}):\n{fail_msg}\n\n"
                     f"Output folder: {output_folder}")
             else:
-                self.update_pdf_status(f"✓ Successfully exported {len(exported)} PDF(s)", "green")
-                messagebox.showinfo("Success", 
+                if active:
+                    self.update_pdf_status(f"✓ Successfully exported {len(exported)} PDF(s)", "green")
+                self.show_dialog(messagebox.showinfo, "Success", 
                     f"Successfully exported {len(exported)} PDF file(s)!\n\n"
                     f"Output folder: {output_folder}")
-        
-        except Exception as e:
-            # Error
-            self.export_btn.config(state="normal")
-            self.pdf_progress['value'] = 0
-            self.update_pdf_status(f"✗ Export failed", "red")
-            messagebox.showerror("Error", f"Failed to export PDFs:\n\n{str(e)}")
-
+        elif event.kind == 'failed':
+            print(job.error_text)
+            if active:
+                self.pdf_progress['value'] = 0
+                self.update_pdf_status(f"✗ Export failed", "red")
+            self.show_dialog(messagebox.showerror, "Error", f"Failed to export PDFs:\n\n{str(job.error)}")
+    
+    def add_job_row(self, job):
+        """Add a job to the jobs list; the oldest finished rows make room for new ones"""
+        running = {job.id for job in self.jobs.running()}
+        while len(self.job_rows) >= MAX_JOB_ROWS:
+            finished = [job_id for job_id in self.job_rows if job_id not in running]
+            if not finished:
+                break
+            row = self.job_rows.index(finished[0])
+            del self.job_rows[row]
+            self.jobs_listbox.delete(row)
+        self.job_rows.append(job.id)
+        self.jobs_listbox.insert(tk.END, job.describe())
+        self.jobs_listbox.see(tk.END)
+    
+    def show_dialog(self, dialog, *args):
+        """
+        Open a result dialog once the current poll is over.
+        
+        A modal dialog runs a nested event loop (and nested polls); opened
+        from inside poll_jobs() the outer poll would afterwards apply events
+        older than the ones handled meanwhile.
+        """
+        self.root.after_idle(dialog, *args)
+    
+    def poll_jobs(self):
+        """Apply job progress to the widgets; runs on the Tk thread every JOB_POLL_MS"""
+        # Scheduled first so progress keeps coming while a result dialog is open
+        self.root.after(JOB_POLL_MS, self.poll_jobs)
+        for event in self.jobs.drain():
+            job = event.job
+            if event.kind == 'progress' and job.finished:
+                continue  # The job is already done; its result is shown instead
+            if job.id not in self.job_rows:
+                continue  # Row made room for newer jobs
+            row = self.job_rows.index(job.id)
+            self.jobs_listbox.delete(row)
+            self.jobs_listbox.insert(row, job.describe())
+            if job.state == DONE:
+                self.jobs_listbox.itemconfig(row, fg="green")
+            elif job.state == FAILED:
+                self.jobs_listbox.itemconfig(row, fg="red")
+            
+            if job.kind == 'generate':
+                self.on_generate_event(event)
+            else:
+                self.on_export_event(event)
+    
+    def on_close(self):
+        """Close the window; running jobs are allowed to finish writing their files"""
+        running = self.jobs.running()
+        if running and not messagebox.askyesno(
+                "Jobs Running", 
+                f"{len(running)} job(s) are still running.\n\n"
+                f"Close anyway? Running jobs finish in the background, queued jobs are cancelled."):
+            return
+        self.jobs.shutdown()
+        self.root.destroy()
 
 def main():
     """Launch the GUI application"""
+    multiprocessing.freeze_support()  # PDF export workers in the packaged .exe
     root = tk.Tk()
     app = CertificateGeneratorGUI(root)
     root.mainloop()
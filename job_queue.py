@@ -0,0 +1,170 @@
+"""
+Job Queue
+=========
+Runs long jobs (certificate generation, PDF export) in a worker pool and
+hands their progress back to a single-threaded event loop.
+
+Tk widgets may only be touched from the Tk thread, so jobs never call back
+into the GUI. Every job function gets a `report(current, total, message)`
+callback; it and the job's start, result and error are posted as JobEvents
+on a thread-safe queue. The GUI drains the queue from a root.after() timer
+and updates its widgets there. Several jobs can run at the same time.
+
+Usage:
+    jobs = JobQueue(max_workers=2)
+    jobs.submit('export', "Export TowerB", export_pdfs, excel_file, sheets)
+
+    def poll():
+        for event in jobs.drain():
+            ...                     # update widgets
+        root.after(100, poll)
+"""
+
+import itertools
+import queue
+import threading
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# kind: 'started', 'progress', 'done' or 'failed'
+JobEvent = namedtuple('JobEvent', ['job', 'kind'])
+
+
+class Job:
+    """One submitted job; its fields are only changed on the thread that drains the queue"""
+
+    __slots__ = ('id', 'kind', 'title', 'context', 'state', 'current', 'total', 'message',
+                 'result', 'error', 'error_text')
+
+    def __init__(self, job_id, kind, title, context):
+        self.id = job_id
+        self.kind = kind
+        self.title = title
+        self.context = context
+        self.state = QUEUED
+        self.current = 0
+        self.total = 0
+        self.message = None
+        self.result = None
+        self.error = None
+        self.error_text = None
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+    def describe(self):
+        """One-line status, e.g. '#3 Generate TowerB - 12/48'"""
+        if self.state == RUNNING and self.total:
+            status = f"{self.current}/{self.total}"
+        elif self.state == FAILED:
+            status = f"failed: {self.error}"
+        else:
+            status = self.state
+        return f"#{self.id} {self.title} - {status}"
+
+
+class JobQueue:
+    """Thread pool for jobs plus the event queue their progress arrives on"""
+
+    def __init__(self, max_workers=2):
+        """
+        Args:
+            max_workers: Jobs that run at the same time; later ones wait their turn
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.events = queue.Queue()
+        self.jobs = {}  # Jobs not finished yet; finished jobs are dropped by drain()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, kind, title, func, *args, context=None, **kwargs):
+        """
+        Queue func(report, *args, **kwargs) and return its Job.
+
+        Args:
+            kind: Free-form job type used by the caller to route events (e.g. 'generate')
+            title: Short description shown to the user
+            func: Job function; its first argument is report(current, total, message=None)
+            context: Optional dict of caller data kept on the Job
+        """
+        with self._lock:
+            job = Job(next(self._ids), kind, title, context or {})
+            self.jobs[job.id] = job
+
+        def report(current, total, message=None):
+            self.events.put((job, 'progress', (current, total, message)))
+
+        def run():
+            self.events.put((job, 'started', None))
+            try:
+                result = func(report, *args, **kwargs)
+            except Exception as e:
+                self.events.put((job, 'failed', (e, traceback.format_exc())))
+            else:
+                self.events.put((job, 'done', result))
+
+        self.executor.submit(run)
+        return job
+
+    def drain(self, limit=None):
+        """
+        Apply the queued events to their Jobs and return them (call from the GUI thread).
+
+        Progress events of one job that arrive together are merged into the
+        latest one, so a fast job cannot flood the GUI. Finished jobs are
+        forgotten here: only their events still refer to them.
+
+        Args:
+            limit: Largest number of raw events taken in one call (None for all)
+
+        Returns:
+            list of JobEvent
+        """
+        raw = []
+        while limit is None or len(raw) < limit:
+            try:
+                raw.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+
+        events = []
+        latest_progress = {}
+        for job, kind, data in raw:
+            if kind == 'progress':
+                job.current, job.total, message = data
+                job.message = message or job.message
+                if job.id in latest_progress:
+                    continue
+                latest_progress[job.id] = len(events)
+            elif kind == 'started':
+                job.state = RUNNING
+            elif kind == 'done':
+                job.state = DONE
+                job.result = data
+            elif kind == 'failed':
+                job.state = FAILED
+                job.error, job.error_text = data
+            if job.finished:
+                with self._lock:
+                    self.jobs.pop(job.id, None)
+            events.append(JobEvent(job, kind))
+        return events
+
+    def running(self, kind=None):
+        """Jobs not finished yet (optionally only of one kind)"""
+        with self._lock:
+            return [job for job in self.jobs.values()
+                    if not job.finished and (kind is None or job.kind == kind)]
+
+    def shutdown(self):
+        """Drop queued jobs; running jobs finish in the background"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
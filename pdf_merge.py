@@ -0,0 +1,215 @@
+"""
+PDF Merge
+=========
+Streams the pages of several PDFs into one PDF file with bookmarks.
+
+Used for the combined certificate PDF: pages are rendered with reportlab in
+small batches, and every batch is appended to the output file as soon as it
+is rendered, so memory stays bounded however many pages the document has.
+Only the page list and the bookmark titles are kept until the end.
+
+The input PDFs must be simple, like the ones reportlab writes: a classic
+xref table, no object streams and no incremental updates. For every input
+the merge:
+- copies every object reachable from its pages, renumbered into the output
+- points the pages at the one page tree of the output
+- stores identical objects (the logo and signature pictures, fonts) once
+
+Usage:
+    with PdfBundleWriter("TowerB.pdf", title="Tower B") as bundle:
+        bundle.add_pdf(pdf_bytes, ["12TH AHU1", "12TH AHU4"])
+"""
+
+import hashlib
+import re
+
+
+_XREF_ENTRY_RE = re.compile(rb'(\d{10}) (\d{5}) ([nf])')
+_REF_RE = re.compile(rb'(\d+) 0 R\b')
+_PARENT_RE = re.compile(rb'/Parent \d+ 0 R')
+
+
+def _pdf_text(text):
+    """PDF text string for `text` (UTF-16BE hex, so any character works)"""
+    return b'<FEFF' + text.encode('utf-16-be').hex().upper().encode('ascii') + b'>'
+
+
+class PdfFile:
+    """The objects of a simple PDF file, as {number: (dictionary bytes, stream bytes or None)}"""
+
+    def __init__(self, data):
+        """
+        Args:
+            data: bytes of the PDF file
+        """
+        startxref = data.rindex(b'startxref')
+        xref = int(data[startxref + 9:].split()[0])
+        trailer = data.index(b'trailer', xref)
+        offsets = {}
+        first = int(data[xref:trailer].split()[1])
+        entries = _XREF_ENTRY_RE.findall(data, xref, trailer)
+        for number, (offset, _, kind) in enumerate(entries, first):
+            if kind == b'n':
+                offsets[number] = int(offset)
+
+        self.objects = {}
+        ends = sorted(offsets.values()) + [xref]
+        for number, offset in offsets.items():
+            end = ends[ends.index(offset) + 1]
+            body = data[data.index(b'obj', offset) + 3:data.rindex(b'endobj', offset, end)].strip(b'\r\n')
+            stream = None
+            if body.endswith(b'endstream'):
+                start = body.index(b'stream')
+                # The stream data starts after the EOL that follows the keyword
+                data_start = start + 6 + (2 if body[start + 6:start + 8] == b'\r\n' else 1)
+                stream = body[data_start:body.rindex(b'endstream')]
+                body = body[:start]
+            self.objects[number] = (body.strip(), stream)
+
+        root = int(re.search(rb'/Root (\d+) 0 R', data[trailer:]).group(1))
+        pages = int(re.search(rb'/Pages (\d+) 0 R', self.objects[root][0]).group(1))
+        self.pages = self._page_list(pages)
+
+    def _page_list(self, node):
+        """Page object numbers below a page tree node, in order"""
+        body = self.objects[node][0]
+        if b'/Kids' not in body:
+            return [node]
+        kids = body[body.index(b'/Kids'):]
+        kids = kids[kids.index(b'[') + 1:kids.index(b']')]
+        pages = []
+        for kid in _REF_RE.findall(kids):
+            pages.extend(self._page_list(int(kid)))
+        return pages
+
+    def references(self, number):
+        """Object numbers referenced from an object's dictionary (a page's /Parent excluded)"""
+        body = _PARENT_RE.sub(b'', self.objects[number][0])
+        return [int(ref) for ref in _REF_RE.findall(body)]
+
+
+class PdfBundleWriter:
+    """
+    Writes one PDF from the pages of many PDFs, with a bookmark per page.
+
+    Objects are written to the file as they are added; close() (or leaving
+    the with block) writes the page tree, the bookmarks and the xref table.
+    """
+
+    def __init__(self, path, title=None):
+        """
+        Args:
+            path: Output .pdf file
+            title: Optional document title
+        """
+        self.file = open(path, 'wb')
+        self.title = title
+        self.offsets = [None]  # Object number -> file offset; object 0 is the free list head
+        self.page_tree = self._reserve()
+        self.pages = []
+        self.bookmarks = []
+        self.shared = {}
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def _reserve(self):
+        """Allocate an object number to be written later"""
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def _write_object(self, number, body, stream=None):
+        """Write object `number` at the current position"""
+        self.offsets[number] = self.file.tell()
+        self.file.write(b'%d 0 obj\n' % number)
+        self.file.write(body)
+        if stream is not None:
+            self.file.write(b'\nstream\n')
+            self.file.write(stream)
+            self.file.write(b'endstream')
+        self.file.write(b'\nendobj\n')
+
+    def add_pdf(self, data, bookmarks=None):
+        """
+        Append all pages of a PDF.
+
+        Args:
+            data: bytes of the PDF
+            bookmarks: Optional bookmark title per page (None entries get no bookmark)
+        """
+        source = PdfFile(data)
+        bookmarks = list(bookmarks or [])
+        numbers = {}
+
+        def renumber(match):
+            return b'%d 0 R' % numbers[int(match.group(1))]
+
+        def copy(number, is_page=False):
+            """Copy an object after the objects it references (post-order)"""
+            if number in numbers:
+                return
+            for ref in source.references(number):
+                copy(ref)
+            body, stream = source.objects[number]
+            if is_page:
+                body = _PARENT_RE.sub(b'/Parent %d 0 R' % self.page_tree, body)
+            body = _REF_RE.sub(renumber, body)
+            if not is_page:
+                # Identical objects (pictures, fonts) are stored once
+                key = hashlib.sha1(body + b'\0' + (stream or b'')).digest()
+                if key in self.shared:
+                    numbers[number] = self.shared[key]
+                    return
+            numbers[number] = new_number = self._reserve()
+            if not is_page:
+                self.shared[key] = new_number
+            self._write_object(new_number, body, stream)
+
+        for idx, page in enumerate(source.pages):
+            copy(page, is_page=True)
+            self.pages.append(numbers[page])
+            self.bookmarks.append(bookmarks[idx] if idx < len(bookmarks) else None)
+
+    def close(self):
+        """Write the page tree, bookmarks, catalog and xref table, and close the file"""
+        kids = b' '.join(b'%d 0 R' % page for page in self.pages)
+        self._write_object(self.page_tree, b'<< /Type /Pages /Count %d /Kids [ %s ] >>' % (len(self.pages), kids))
+
+        catalog = b'<< /Type /Catalog /Pages %d 0 R' % self.page_tree
+        marks = [(title, page) for title, page in zip(self.bookmarks, self.pages) if title]
+        if marks:
+            outlines = self._reserve()
+            items = [self._reserve() for _ in marks]
+            for idx, (number, (title, page)) in enumerate(zip(items, marks)):
+                body = b'<< /Title %s /Parent %d 0 R /Dest [ %d 0 R /Fit ]' % (_pdf_text(title), outlines, page)
+                if idx:
+                    body += b' /Prev %d 0 R' % items[idx - 1]
+                if idx + 1 < len(items):
+                    body += b' /Next %d 0 R' % items[idx + 1]
+                self._write_object(number, body + b' >>')
+            self._write_object(outlines, b'<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>'
+                               % (items[0], items[-1], len(items)))
+            catalog += b' /Outlines %d 0 R /PageMode /UseOutlines' % outlines
+        catalog_number = self._reserve()
+        self._write_object(catalog_number, catalog + b' >>')
+
+        info = self._reserve()
+        info_body = b'<< /Producer (Certificate Generator)'
+        if self.title:
+            info_body += b' /Title ' + _pdf_text(self.title)
+        self._write_object(info, info_body + b' >>')
+
+        xref = self.file.tell()
+        self.file.write(b'xref\n0 %d\n0000000000 65535 f \n' % len(self.offsets))
+        for offset in self.offsets[1:]:
+            self.file.write(b'%010d 00000 n \n' % offset)
+        self.file.write(b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                        % (len(self.offsets), catalog_number, info, xref))
+        self.file.close()
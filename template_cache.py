@@ -0,0 +1,176 @@
+"""
+Template Cache
+==============
+Loads certificate templates as CompiledTemplate objects and caches them, so
+the template workbook is only parsed again when it actually changes.
+
+Two cache levels:
+- in-process LRU keyed on (path, size, mtime): repeated calls in one run
+  (batch towers, GUI generations) reuse the compiled template directly
+- on-disk pickles keyed on the content hash: new processes (next run,
+  worker processes) skip parsing as long as the file content is the same
+
+load_xml_writer() keeps TemplateXmlWriters (the direct_xml engine) and
+load_cell_mapping() the compiled cell mappings in in-process LRUs of their
+own (one per kind, so one kind never evicts another); they are cheap to
+build, so they are not pickled.
+
+Usage:
+    template = load_template("Base/Book1.xlsx")
+    writer = load_xml_writer("Base/Book1.xlsx")
+    mapping = load_cell_mapping("Base/Book1.xlsx")
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import openpyxl
+from openpyxl import load_workbook
+
+from cell_mapping import mapping_file_for, read_mapping
+from certificate_template import compile_template
+from template_xml_writer import TemplateXmlWriter
+
+
+# Number of compiled templates (and of writers, and of mappings) kept in memory
+TEMPLATE_CACHE_SIZE = 8
+
+# Where compiled templates are pickled between runs (None disables the disk cache)
+TEMPLATE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.certificate_generator', 'template_cache')
+
+# Bump when CompiledTemplate changes shape so stale pickles are ignored
+CACHE_FORMAT = 2
+
+_memory_caches = {}  # kind ('template', 'xml', 'mapping') -> OrderedDict LRU
+_memory_cache_lock = threading.Lock()
+
+
+def template_hash(template_file):
+    """Return the SHA-256 hex digest of the template file content"""
+    digest = hashlib.sha256()
+    with open(template_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_file(cache_dir, content_hash):
+    """Path of the on-disk pickle for a template with `content_hash`"""
+    return os.path.join(cache_dir, f"{content_hash}-v{CACHE_FORMAT}-openpyxl{openpyxl.__version__}.pickle")
+
+
+def _read_disk_cache(cache_file):
+    """Return the pickled CompiledTemplate in `cache_file`, or None"""
+    try:
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Corrupt or incompatible cache entry: parse the template again
+        return None
+
+
+def _write_disk_cache(cache_file, template):
+    """Pickle `template` to `cache_file`; the cache is best effort"""
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(template, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+
+
+def _cached(kind, source_file, build):
+    """
+    Return build(path) for a file from the in-process LRU of `kind`, building it on a miss.
+
+    Entries are keyed on (path, size, mtime), so a changed file is built again.
+
+    Args:
+        kind: Cache name; every kind keeps its own TEMPLATE_CACHE_SIZE entries
+        source_file: File the object is built from
+        build: function(absolute path) returning the object
+    """
+    path = os.path.abspath(source_file)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+
+    with _memory_cache_lock:
+        cache = _memory_caches.setdefault(kind, OrderedDict())
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            return value
+
+    value = build(path)
+
+    with _memory_cache_lock:
+        cache[key] = value
+        while len(cache) > TEMPLATE_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    return value
+
+
+def load_template(template_file, cache_dir=TEMPLATE_CACHE_DIR):
+    """
+    Return the CompiledTemplate for the first sheet of a template workbook.
+
+    Args:
+        template_file: Path to the template Excel file
+        cache_dir: Directory for the on-disk cache, or None to disable it
+
+    Returns:
+        CompiledTemplate
+    """
+    def build(path):
+        cache_file = _cache_file(cache_dir, template_hash(path)) if cache_dir else None
+        template = _read_disk_cache(cache_file) if cache_file else None
+
+        if template is None:
+            wb_template = load_workbook(path)
+            template = compile_template(wb_template[wb_template.sheetnames[0]])
+            wb_template.close()
+            if cache_file:
+                _write_disk_cache(cache_file, template)
+        return template
+
+    return _cached('template', template_file, build)
+
+
+def load_xml_writer(template_file):
+    """
+    Return a TemplateXmlWriter for a template workbook, reused while the file is unchanged.
+
+    Args:
+        template_file: Path to the template Excel file
+
+    Returns:
+        TemplateXmlWriter
+    """
+    return _cached('xml', template_file, TemplateXmlWriter)
+
+
+def load_cell_mapping(template_file):
+    """
+    Return the compiled CellMapping for a template, reused while its mapping file is unchanged.
+
+    Args:
+        template_file: Path to the template Excel file (its mapping file is looked up next to it)
+
+    Returns:
+        CellMapping
+    """
+    return _cached('mapping', mapping_file_for(template_file), read_mapping)
+
+
+def clear_template_cache():
+    """Drop all in-process cached templates, writers and mappings (the disk cache is left alone)"""
+    with _memory_cache_lock:
+        _memory_caches.clear()
@@ -0,0 +1,356 @@
+"""
+Template Registry
+=================
+Loads every certificate template of a folder (Base/) once and picks the
+template for each meter by rule, so one calibration file can mix meter
+classes and sites that use different certificate layouts.
+
+The rules are read from <folder>/templates.json:
+
+    {
+        "default": "Book1.xlsx",
+        "rules": [
+            {"template": "Book1_Large.xlsx", "meter_size": {"min": 100}},
+            {"template": "ClientX.xlsx", "site": ["ClientX*", "TowerD"]},
+            {"template": "Book1_KWH.xlsx", "unit": "KWH"}
+        ]
+    }
+
+Rules are tried in order; the first one whose conditions all match wins and
+meters that match no rule use the default template. Conditions:
+- site:       sheet prefix of the calibration file (e.g. TowerB); fnmatch
+              patterns, not case sensitive
+- meter_size: DN class; a number, a list of numbers or {"min": .., "max": ..}
+- unit:       MWH or KWH (the before or the after reading)
+A rule without conditions matches every meter. Without templates.json the
+default is Book1.xlsx (or the first template by name) and there are no rules.
+
+Every template keeps its own cell mapping (cell_mapping). The compiled
+templates and mappings stay in memory with the registry, which is reloaded
+only when a file in the folder changes.
+
+A generated workbook records which template each of its sheets was built
+from in <workbook>.templates.json, so the PDF export draws every page with
+the right layout without routing the meters again:
+
+    {"format": 1, "templates": {"C:/.../Base/Book1.xlsx": ["TowerB_12TH_AHU1", ...], ...}}
+
+Usage:
+    registry = load_registry("Base")
+    names = registry.route(meters, site="TowerB")   # template name per meter
+    routes = registry.routes(names)                 # build_certificate_workbook(routes=...)
+    write_sheet_templates("TowerB.xlsx", template_file, routes, sheet_names)
+    read_sheet_templates("TowerB.xlsx")             # {sheet name: template file}
+
+    python template_registry.py Base
+    python template_registry.py Base --input calibration.xlsx --prefix TowerB
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from collections import Counter, namedtuple
+
+from template_cache import load_cell_mapping, load_template, template_hash
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TEMPLATE_DIR = os.path.join(BASE_DIR, 'Base')
+REGISTRY_FILE = 'templates.json'
+DEFAULT_TEMPLATE_NAME = 'Book1.xlsx'
+
+RULE_KEYS = {'template', 'site', 'meter_size', 'unit'}
+
+SHEET_TEMPLATES_FORMAT = 1
+
+# Templates of one certificate file:
+# names:    template file names, in registry order
+# variants: [(CompiledTemplate, CellMapping)] for those names
+# index:    variant index for every meter
+# digest:   hash of the variant templates and mappings (incremental manifests)
+TemplateRoutes = namedtuple('TemplateRoutes', 'names variants index digest')
+
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+class RegistryError(ValueError):
+    """A template folder or templates.json that cannot be used"""
+
+
+def dn_class(meter_size):
+    """DN class of a meter size cell (65, '65', 'DN-65', 'DN 65 mm' -> 65.0), or None"""
+    if meter_size is None or isinstance(meter_size, bool):
+        return None
+    if isinstance(meter_size, (int, float)):
+        return float(meter_size)
+    match = _NUMBER_RE.search(str(meter_size))
+    return float(match.group()) if match else None
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+class TemplateRule:
+    """One routing rule of templates.json"""
+
+    __slots__ = ('template', 'sites', 'sizes', 'min_size', 'max_size', 'units')
+
+    def __init__(self, template, site=None, meter_size=None, unit=None):
+        self.template = template
+        self.sites = [str(pattern).upper() for pattern in _as_list(site)] if site is not None else None
+        self.units = {str(name).upper() for name in _as_list(unit)} if unit is not None else None
+        self.sizes = None
+        self.min_size = self.max_size = None
+        if isinstance(meter_size, dict):
+            unknown = set(meter_size) - {'min', 'max'}
+            if unknown:
+                raise RegistryError(f"{template}: meter_size accepts only min and max, got {', '.join(unknown)}")
+            self.min_size = meter_size.get('min')
+            self.max_size = meter_size.get('max')
+        elif meter_size is not None:
+            self.sizes = {dn_class(size) for size in _as_list(meter_size)}
+            if None in self.sizes:
+                raise RegistryError(f"{template}: invalid meter_size {meter_size!r}")
+
+    def matches(self, meter, size, site):
+        """
+        Args:
+            meter: MeterRecord
+            size: dn_class() of the meter
+            site: sheet prefix in upper case, or None
+        """
+        if self.sites is not None:
+            if site is None or not any(fnmatch.fnmatchcase(site, pattern) for pattern in self.sites):
+                return False
+        if self.sizes is not None and size not in self.sizes:
+            return False
+        if self.min_size is not None and (size is None or size < self.min_size):
+            return False
+        if self.max_size is not None and (size is None or size > self.max_size):
+            return False
+        if self.units is not None:
+            units = {str(unit).upper() for unit in (meter.before_unit, meter.after_unit) if unit}
+            if not units & self.units:
+                return False
+        return True
+
+
+class TemplateRegistry:
+    """The templates of one folder, compiled once, with the rules that route meters to them"""
+
+    def __init__(self, folder=DEFAULT_TEMPLATE_DIR):
+        """
+        Args:
+            folder: Folder with the template .xlsx files (and optionally templates.json)
+        """
+        self.folder = os.path.abspath(folder)
+        self.paths = {name: os.path.join(self.folder, name) for name in sorted(os.listdir(self.folder))
+                      if name.lower().endswith('.xlsx') and not name.startswith('~$')}
+        if not self.paths:
+            raise RegistryError(f"No certificate template (.xlsx) in {self.folder}")
+
+        config = {}
+        config_file = os.path.join(self.folder, REGISTRY_FILE)
+        if os.path.exists(config_file):
+            try:
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            except json.JSONDecodeError as e:
+                raise RegistryError(f"{config_file}: invalid JSON ({e})")
+
+        default = config.get('default')
+        if default is None:
+            default = DEFAULT_TEMPLATE_NAME if DEFAULT_TEMPLATE_NAME in self.paths else next(iter(self.paths))
+        self._check_name(default)
+        self.default = default
+
+        self.rules = []
+        for rule in config.get('rules', []):
+            unknown = set(rule) - RULE_KEYS
+            if unknown or 'template' not in rule:
+                raise RegistryError(f"{config_file}: rules need a template and accept only "
+                                    f"{', '.join(sorted(RULE_KEYS - {'template'}))} ({rule})")
+            self._check_name(rule['template'])
+            self.rules.append(TemplateRule(**rule))
+
+        # Compile every template once; they stay in memory with the registry
+        self.compiled = {name: (load_template(path), load_cell_mapping(path)) for name, path in self.paths.items()}
+
+    def _check_name(self, name):
+        if name not in self.paths:
+            raise RegistryError(f"Template {name!r} not found in {self.folder}")
+
+    def path(self, name):
+        """Path of a template by name"""
+        return self.paths[name]
+
+    def select(self, meter, site=None):
+        """Name of the template for one meter"""
+        size = dn_class(meter.meter_size)
+        site = site.upper() if site else None
+        for rule in self.rules:
+            if rule.matches(meter, size, site):
+                return rule.template
+        return self.default
+
+    def route(self, meters, site=None):
+        """
+        Pick the template of every meter.
+
+        Args:
+            meters: list of MeterRecords
+            site: Sheet prefix of the calibration file (for site rules)
+
+        Returns:
+            list of template names, one per meter
+        """
+        return [self.select(meter, site) for meter in meters]
+
+    def routes(self, names):
+        """TemplateRoutes for the template names returned by route()"""
+        used = [name for name in self.paths if name in set(names)]
+        digest = hashlib.sha256()
+        for name in used:
+            digest.update(f"{name}:{template_hash(self.paths[name])}:{self.compiled[name][1].digest};".encode())
+        return TemplateRoutes(used, [self.compiled[name] for name in used],
+                              [used.index(name) for name in names], digest.hexdigest())
+
+
+def load_registry(folder=DEFAULT_TEMPLATE_DIR):
+    """
+    Return the TemplateRegistry of a folder, reused until a file in the folder changes.
+
+    Args:
+        folder: Template folder
+
+    Returns:
+        TemplateRegistry
+    """
+    folder = os.path.abspath(folder)
+    key = tuple(sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+                       for entry in os.scandir(folder) if entry.is_file()))
+
+    with _registries_lock:
+        registry = _registries.get(folder)
+        if registry is not None and registry[0] == key:
+            return registry[1]
+
+    registry = TemplateRegistry(folder)
+    with _registries_lock:
+        _registries[folder] = (key, registry)
+    return registry
+
+
+def resolve_templates(template, meters, site=None):
+    """
+    Resolve a template file or template folder for the meters of one file.
+
+    Args:
+        template: Template .xlsx file, or a folder of templates (TemplateRegistry)
+        meters: list of MeterRecords
+        site: Sheet prefix (for site rules)
+
+    Returns:
+        (template_file, routes): the template file when every meter uses the
+        same template (routes is None), else the first template used and the
+        TemplateRoutes for a mixed file
+    """
+    if not os.path.isdir(template):
+        return template, None
+    registry = load_registry(template)
+    names = registry.route(meters, site)
+    if len(set(names)) <= 1:
+        return registry.path(names[0] if names else registry.default), None
+    routes = registry.routes(names)
+    return registry.path(next(name for name in registry.paths if name in set(names))), routes
+
+
+def sheet_templates_path(workbook_file):
+    """Path of the record of which template built each sheet of `workbook_file`"""
+    return f"{workbook_file}.templates.json"
+
+
+def write_sheet_templates(workbook_file, template_file, routes, sheet_names):
+    """
+    Record the template of every sheet of a generated workbook.
+
+    Args:
+        workbook_file: The certificate workbook just written
+        template_file: Template file from resolve_templates() (the first
+            template used when routes is set; the others are in its folder)
+        routes: TemplateRoutes of the sheets, or None when they all use template_file
+        sheet_names: Sheet names, in the order of routes.index
+    """
+    if routes:
+        folder = os.path.dirname(os.path.abspath(template_file))
+        groups = {}
+        for sheet_name, number in zip(sheet_names, routes.index):
+            groups.setdefault(os.path.join(folder, routes.names[number]), []).append(sheet_name)
+    else:
+        groups = {os.path.abspath(template_file): list(sheet_names)}
+    record = {'format': SHEET_TEMPLATES_FORMAT, 'templates': groups}
+    with open(sheet_templates_path(workbook_file), 'w', encoding='utf-8') as f:
+        json.dump(record, f, indent=1)
+
+
+def read_sheet_templates(workbook_file):
+    """
+    Return {sheet name: template file} of a generated workbook, or None if it has no record.
+    """
+    try:
+        with open(sheet_templates_path(workbook_file), 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if record.get('format') != SHEET_TEMPLATES_FORMAT:
+        return None
+    return {sheet_name: template_file for template_file, sheet_names in record['templates'].items()
+            for sheet_name in sheet_names}
+
+
+def main():
+    """Show the templates and rules of a folder, and optionally how a calibration file is routed"""
+    parser = argparse.ArgumentParser(description="Show the certificate templates of a folder and their rules")
+    parser.add_argument('folder', nargs='?', default=DEFAULT_TEMPLATE_DIR, help="Template folder (default: Base)")
+    parser.add_argument('--input', help="Calibration file to route")
+    parser.add_argument('--prefix', help="Sheet prefix of the calibration file (for site rules)")
+    args = parser.parse_args()
+
+    try:
+        registry = load_registry(args.folder)
+    except (OSError, RegistryError) as e:
+        print(f"ERROR: {e}")
+        return 1
+
+    print(f"Templates in {registry.folder}:")
+    for name, (template, mapping) in registry.compiled.items():
+        marker = " (default)" if name == registry.default else ""
+        print(f"  {name}{marker}: {len(template.cells)} cells, {len(mapping.setters)} mapped")
+    for rule in registry.rules:
+        conditions = {'site': rule.sites, 'meter_size': sorted(rule.sizes) if rule.sizes else None,
+                      'min': rule.min_size, 'max': rule.max_size,
+                      'unit': sorted(rule.units) if rule.units else None}
+        text = ', '.join(f"{key}={value}" for key, value in conditions.items() if value is not None)
+        print(f"  rule: {text or 'every meter'} -> {rule.template}")
+
+    if args.input:
+        from calibration_reader import read_meters
+        meters = read_meters(args.input)
+        counts = Counter(registry.route(meters, args.prefix))
+        print(f"\n{os.path.basename(args.input)}: {len(meters)} meters")
+        for name, count in counts.most_common():
+            print(f"  {count:5d} -> {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
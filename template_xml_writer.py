@@ -0,0 +1,396 @@
+"""
+Template XML Writer
+===================
+Writes certificate workbooks straight from the template .xlsx package,
+without building any openpyxl cell objects.
+
+A certificate differs from the template in a dozen cells only. The template
+sheet XML is therefore split once around those cells; every certificate
+sheet is the same byte chunks joined with its own cell elements, streamed
+into the output zip. The rest of the package is carried over as it is:
+- styles, theme and shared strings are copied once
+- drawings (and other sheet parts) are cloned per sheet, pointing at the
+  same pictures, so the logo and signature are stored once; printer
+  settings are left out, as openpyxl does
+- workbook.xml, its rels and [Content_Types].xml list the new sheets, and
+  sheet-level names such as the print area are repeated for each sheet
+
+Formula cells lose their cached results and the workbook is flagged for a
+full recalculation on load, so Excel shows values for the substituted cells.
+
+Usage:
+    writer = TemplateXmlWriter("Base/Book1.xlsx")
+    writer.write("CYBER_PARK_TOWER_B_complete.xlsx",
+                 [("TowerB_12TH_AHU1", {"B7": "Serial No: 84089186", "D14": 7.1}), ...])
+"""
+
+import re
+import time
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string
+
+from workbook_merge import (CONTENT_TYPES, MEDIA_FOLDER, WORKBOOK, WORKBOOK_RELS, WORKSHEET_REL,
+                            XlsxPackage, _rels_path, _resolve, _unescape)
+
+
+CALC_CHAIN_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/calcChain'
+PRINTER_SETTINGS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/printerSettings'
+
+_CELL_RE = r'<c r="{}"(?=[\s/>])[^>]*?(?:/>|>.*?</c>)'
+_ROW_RE = r'<row r="{}"(?=[\s/>])[^>]*?(?:/>|>.*?</row>)'
+_CELL_REF_RE = re.compile(r'<c r="([A-Z]+)(\d+)"')
+_ROW_NUM_RE = re.compile(r'<row r="(\d+)"')
+_STYLE_RE = re.compile(r'\ss="(\d+)"')
+_CACHED_VALUE_RE = re.compile(r'(<c\b[^>]*>\s*(?:<f\b[^>]*/>|<f\b[^>]*>.*?</f>))\s*<v>[^<]*</v>', re.S)
+_TAB_SELECTED_RE = re.compile(r'\stabSelected="[^"]*"')
+_UID_RE = re.compile(r'(<worksheet\b[^>]*?)\sxr:uid="[^"]*"')
+_DEFINED_NAME_RE = re.compile(r'<definedName\b([^>]*)>(.*?)</definedName>', re.S)
+_DEFINED_NAMES_RE = re.compile(r'<definedNames>.*?</definedNames>|<definedNames/>', re.S)
+_LOCAL_SHEET_RE = re.compile(r'\slocalSheetId="(\d+)"')
+_SHEETS_RE = re.compile(r'<sheets>.*?</sheets>', re.S)
+_CALC_PR_RE = re.compile(r'<calcPr\b([^>]*?)/>')
+_WORKBOOK_VIEW_ATTR_RE = re.compile(r'\s(?:activeTab|firstSheet)="\d+"')
+_NUMBERED_RE = re.compile(r'^(.*?)(\d*)(\.[^.]+)$')
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+
+def _cell_xml(coordinate, style, value):
+    """Return the <c> element for one substituted cell"""
+    style_attr = f' s="{style}"' if style else ''
+    if value is None:
+        return f'<c r="{coordinate}"{style_attr}/>'
+    if isinstance(value, bool):
+        return f'<c r="{coordinate}"{style_attr} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, int):
+        return f'<c r="{coordinate}"{style_attr}><v>{value}</v></c>'
+    if isinstance(value, float):
+        return f'<c r="{coordinate}"{style_attr}><v>{value:.16g}</v></c>'  # As openpyxl writes numbers
+    text = str(value)
+    if text.startswith('=') and len(text) > 1:
+        # Same rule as openpyxl: a leading '=' makes the value a formula
+        return f'<c r="{coordinate}"{style_attr}><f>{escape(text[1:])}</f></c>'
+    space = ' xml:space="preserve"' if text != text.strip() else ''
+    return f'<c r="{coordinate}"{style_attr} t="inlineStr"><is><t{space}>{escape(text)}</t></is></c>'
+
+
+def _quote_sheet_name(name):
+    """Sheet name as used in a formula reference ('Name'!)"""
+    return "'" + name.replace("'", "''") + "'"
+
+
+def _ensure_cell(xml, coordinate):
+    """Return sheet XML that has a (possibly empty) <c> element for `coordinate`"""
+    if re.search(_CELL_RE.format(coordinate), xml, re.S):
+        return xml
+    column, row = coordinate_from_string(coordinate)
+    column_index = column_index_from_string(column)
+    cell = f'<c r="{coordinate}"/>'
+
+    row_match = re.search(_ROW_RE.format(row), xml, re.S)
+    if row_match is None:
+        # Insert a new row before the first row with a higher number
+        new_row = f'<row r="{row}">{cell}</row>'
+        for match in _ROW_NUM_RE.finditer(xml):
+            if int(match.group(1)) > row:
+                return xml[:match.start()] + new_row + xml[match.start():]
+        if '<sheetData/>' in xml:
+            return xml.replace('<sheetData/>', f'<sheetData>{new_row}</sheetData>', 1)
+        idx = xml.index('</sheetData>')
+        return xml[:idx] + new_row + xml[idx:]
+
+    row_xml = row_match.group(0)
+    if row_xml.endswith('/>') and not row_xml.endswith('</row>'):
+        new_row_xml = row_xml[:-2] + f'>{cell}</row>'
+    else:
+        insert_at = row_xml.rindex('</row>')
+        for match in _CELL_REF_RE.finditer(row_xml):
+            if column_index_from_string(match.group(1)) > column_index:
+                insert_at = match.start()
+                break
+        new_row_xml = row_xml[:insert_at] + cell + row_xml[insert_at:]
+    return xml[:row_match.start()] + new_row_xml + xml[row_match.end():]
+
+
+class SheetXmlTemplate:
+    """The template sheet XML, split around the cells that certificates fill in"""
+
+    def __init__(self, xml):
+        """
+        Args:
+            xml: sheet XML of the template (str)
+        """
+        xml = _CACHED_VALUE_RE.sub(r'\1', xml)  # Formulas are recalculated on load
+        xml = _UID_RE.sub(r'\1', xml)  # Revision ids must stay unique per sheet
+        self.selected_xml = xml
+        self.xml = _TAB_SELECTED_RE.sub('', xml)
+        self._frames = {}
+
+    def _frame(self, coordinates, selected):
+        """Return (chunks, styles) for a set of substituted coordinates"""
+        key = (coordinates, selected)
+        frame = self._frames.get(key)
+        if frame is not None:
+            return frame
+
+        xml = self.selected_xml if selected else self.xml
+        for coordinate in coordinates:
+            xml = _ensure_cell(xml, coordinate)
+        cells = []
+        for coordinate in coordinates:
+            match = re.search(_CELL_RE.format(coordinate), xml, re.S)
+            style = _STYLE_RE.search(xml, match.start(), xml.index('>', match.start()))
+            cells.append((match.start(), match.end(), coordinate, style.group(1) if style else None))
+        cells.sort()
+
+        chunks, styles, position = [], [], 0
+        for start, end, coordinate, style in cells:
+            chunks.append(xml[position:start])
+            styles.append((coordinate, style))
+            position = end
+        chunks.append(xml[position:])
+        frame = self._frames[key] = (chunks, styles)
+        return frame
+
+    def render(self, values, selected=False):
+        """
+        Return the sheet XML with `values` substituted.
+
+        Args:
+            values: dict of {cell coordinate: value}
+            selected: Keep the template's tabSelected flag (first sheet only)
+
+        Returns:
+            bytes
+        """
+        chunks, styles = self._frame(tuple(sorted(values)), selected)
+        parts = [chunks[0]]
+        for (coordinate, style), chunk in zip(styles, chunks[1:]):
+            parts.append(_cell_xml(coordinate, style, values[coordinate]))
+            parts.append(chunk)
+        return ''.join(parts).encode('utf-8')
+
+
+class TemplateXmlWriter:
+    """
+    Writes workbooks of certificate sheets cloned from the first template sheet.
+
+    The template package is read once; write() can be called any number of
+    times.
+    """
+
+    def __init__(self, template_file):
+        """
+        Args:
+            template_file: Path to the template .xlsx file
+        """
+        self.package = package = XlsxPackage(template_file)
+        sheets = package.sheets()
+        self.template_name, self.sheet_part = sheets[0]
+
+        sheet_xml = package.parts[self.sheet_part].decode('utf-8')
+        for rel in package.relationships(self.sheet_part):
+            if rel['Type'] == PRINTER_SETTINGS_REL:
+                # Device specific and not needed to print (openpyxl drops them too)
+                sheet_xml = re.sub(rf'(<pageSetup\b[^>]*?)\sr:id="{rel["Id"]}"', r'\1', sheet_xml)
+        self.sheet = SheetXmlTemplate(sheet_xml)
+
+        # Parts reachable from any template sheet are cloned per sheet; pictures are shared
+        dropped = set()
+        for _, sheet_part in sheets:
+            dropped.add(sheet_part)
+            dropped.update(part for part, _ in self._reachable(sheet_part))
+        reachable = self._reachable(self.sheet_part)
+        self.shared_media = {part for part, _ in reachable if part.startswith(MEDIA_FOLDER)}
+        self.clone_parts = [self.sheet_part] + [part for part, rel_type in reachable
+                                                if not part.startswith(MEDIA_FOLDER)
+                                                and rel_type != PRINTER_SETTINGS_REL]
+
+        for rel in package.relationships(WORKBOOK):
+            if rel['Type'] == CALC_CHAIN_REL:
+                dropped.add(_resolve(WORKBOOK, _unescape(rel['Target'])))
+        dropped.update(_rels_path(part) for part in list(dropped))
+        dropped -= self.shared_media
+        self.kept_parts = [part for part in package.parts
+                           if part not in dropped and part not in (CONTENT_TYPES, WORKBOOK, WORKBOOK_RELS)]
+
+        # Number clones of each part per sheet: drawing1.xml -> drawing<n>.xml
+        self.clone_names = []
+        counts = {}
+        for part in self.clone_parts:
+            stem, _, ext = _NUMBERED_RE.match(part).groups()
+            counts[stem, ext] = counts.get((stem, ext), 0) + 1
+            self.clone_names.append((stem, ext, counts[stem, ext] - 1))
+        self.clone_counts = counts
+        self.clone_rels = {part: [rel for rel in package.relationships(part)
+                                  if rel['Type'] != PRINTER_SETTINGS_REL]
+                           for part in self.clone_parts}
+
+    def _reachable(self, part, seen=None):
+        """Return [(part, relationship type)] for every internal part referenced from `part`"""
+        seen = [] if seen is None else seen
+        for rel in self.package.relationships(part):
+            if rel.get('TargetMode') == 'External':
+                continue
+            target = _resolve(part, _unescape(rel['Target']))
+            if target not in self.package.parts or any(target == found for found, _ in seen):
+                continue
+            seen.append((target, rel['Type']))
+            self._reachable(target, seen)
+        return seen
+
+    def _sheet_parts(self, sheet_number):
+        """Return {template part: output part} for the parts of sheet `sheet_number` (1-based)"""
+        names = {self.sheet_part: f'xl/worksheets/sheet{sheet_number}.xml'}
+        for part, (stem, ext, offset) in zip(self.clone_parts, self.clone_names):
+            if part != self.sheet_part:
+                number = (sheet_number - 1) * self.clone_counts[stem, ext] + offset + 1
+                names[part] = f'{stem}{number}{ext}'
+        return names
+
+    def _rels_xml(self, part, names):
+        """Relationship part for the clone of `part`, pointing at the clones in `names`"""
+        elements = []
+        for rel in self.clone_rels[part]:
+            target = _unescape(rel['Target'])
+            mode = ''
+            if rel.get('TargetMode') == 'External':
+                mode = ' TargetMode="External"'
+            else:
+                resolved = _resolve(part, target)
+                target = '/' + names.get(resolved, resolved)
+            elements.append(f'<Relationship Id="{rel["Id"]}" Type="{rel["Type"]}" '
+                            f'Target={quoteattr(target)}{mode}/>')
+        return (XML_HEADER + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                + ''.join(elements) + '</Relationships>').encode('utf-8')
+
+    def _workbook_xml(self, sheet_names, rel_ids):
+        """workbook.xml listing `sheet_names`, with sheet-level names repeated per sheet"""
+        xml = self.package.parts[WORKBOOK].decode('utf-8')
+        sheets = ''.join(f'<sheet name={quoteattr(name)} sheetId="{idx}" r:id="{rel_id}"/>'
+                         for idx, (name, rel_id) in enumerate(zip(sheet_names, rel_ids), 1))
+        xml = _SHEETS_RE.sub(lambda match: f'<sheets>{sheets}</sheets>', xml, 1)
+
+        template_refs = [escape(_quote_sheet_name(self.template_name)) + '!', escape(self.template_name) + '!']
+        global_names, local_names = [], []
+        for attrs, text in _DEFINED_NAME_RE.findall(xml):
+            local = _LOCAL_SHEET_RE.search(attrs)
+            if local is None:
+                global_names.append(f'<definedName{attrs}>{text}</definedName>')
+            elif local.group(1) == '0':
+                local_names.append((attrs, text))
+        defined_names = list(global_names)
+        for idx, sheet_name in enumerate(sheet_names):
+            new_ref = escape(_quote_sheet_name(sheet_name)) + '!'
+            for attrs, text in local_names:
+                for old_ref in template_refs:
+                    text = text.replace(old_ref, new_ref)
+                attrs = _LOCAL_SHEET_RE.sub(f' localSheetId="{idx}"', attrs)
+                defined_names.append(f'<definedName{attrs}>{text}</definedName>')
+        names_xml = f'<definedNames>{"".join(defined_names)}</definedNames>' if defined_names else ''
+        if _DEFINED_NAMES_RE.search(xml):
+            xml = _DEFINED_NAMES_RE.sub(lambda match: names_xml, xml, 1)
+        else:
+            xml = xml.replace('</sheets>', '</sheets>' + names_xml, 1)
+
+        # Cached formula results were dropped: recalculate everything on open
+        calc_pr = _CALC_PR_RE.search(xml)
+        if calc_pr:
+            attrs = re.sub(r'\sfullCalcOnLoad="[^"]*"', '', calc_pr.group(1))
+            xml = xml[:calc_pr.start()] + f'<calcPr{attrs} fullCalcOnLoad="1"/>' + xml[calc_pr.end():]
+        else:
+            anchor = '</definedNames>' if names_xml else '</sheets>'
+            xml = xml.replace(anchor, anchor + '<calcPr fullCalcOnLoad="1"/>', 1)
+        return _WORKBOOK_VIEW_ATTR_RE.sub('', xml).encode('utf-8')
+
+    def _workbook_rels_xml(self, rel_ids):
+        """Workbook rels: the template's non-sheet parts plus one worksheet rel per sheet"""
+        elements = []
+        for rel in self.package.relationships(WORKBOOK):
+            if rel['Type'] in (WORKSHEET_REL, CALC_CHAIN_REL):
+                continue
+            target = _unescape(rel['Target'])
+            mode = ' TargetMode="External"' if rel.get('TargetMode') == 'External' else ''
+            elements.append(f'<Relationship Id="{rel["Id"]}" Type="{rel["Type"]}" '
+                            f'Target={quoteattr(target)}{mode}/>')
+        for number, rel_id in enumerate(rel_ids, 1):
+            elements.append(f'<Relationship Id="{rel_id}" Type="{WORKSHEET_REL}" '
+                            f'Target="/xl/worksheets/sheet{number}.xml"/>')
+        return (XML_HEADER + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                + ''.join(elements) + '</Relationships>').encode('utf-8')
+
+    def _content_types_xml(self, sheet_count):
+        """[Content_Types].xml for the kept parts and `sheet_count` cloned sheets"""
+        elements = [f'<Default Extension="{extension}" ContentType="{content_type}"/>'
+                    for extension, content_type in self.package.default_types().items()]
+        for part in [WORKBOOK] + self.kept_parts:
+            is_override, content_type = self.package.content_type(part)
+            if is_override:
+                elements.append(f'<Override PartName="/{part}" ContentType="{content_type}"/>')
+        overrides = [(part, self.package.content_type(part)) for part in self.clone_parts]
+        for number in range(1, sheet_count + 1):
+            names = self._sheet_parts(number)
+            for part, (is_override, content_type) in overrides:
+                if is_override:
+                    elements.append(f'<Override PartName="/{names[part]}" ContentType="{content_type}"/>')
+        return (XML_HEADER + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                + ''.join(elements) + '</Types>').encode('utf-8')
+
+    def write(self, output_file, sheets, progress_callback=None, observer=None):
+        """
+        Write a workbook with one sheet per (sheet name, values) pair.
+
+        Args:
+            output_file: Path of the .xlsx to create
+            sheets: list of (sheet name, {cell coordinate: value})
+            progress_callback: Optional function(current, total) called per sheet
+            observer: Optional GenerationObserver told about every sheet written
+
+        Returns:
+            Number of sheets written
+        """
+        sheet_names = [name for name, _ in sheets]
+        lower_names = {name.lower() for name in sheet_names}
+        if len(lower_names) != len(sheet_names):
+            raise ValueError("Duplicate sheet names")
+        for name in sheet_names:
+            if len(name) > 31 or any(char in name for char in '[]:*?/\\'):
+                raise ValueError(f"Invalid sheet name: {name}")
+
+        used_ids = {rel['Id'] for rel in self.package.relationships(WORKBOOK)
+                    if rel['Type'] not in (WORKSHEET_REL, CALC_CHAIN_REL)}
+        rel_ids, counter = [], 0
+        while len(rel_ids) < len(sheets):
+            counter += 1
+            if f"rId{counter}" not in used_ids:
+                rel_ids.append(f"rId{counter}")
+
+        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(CONTENT_TYPES, self._content_types_xml(len(sheets)))
+            for part in self.kept_parts:
+                archive.writestr(part, self.package.parts[part])
+            archive.writestr(WORKBOOK, self._workbook_xml(sheet_names, rel_ids))
+            archive.writestr(WORKBOOK_RELS, self._workbook_rels_xml(rel_ids))
+
+            for number, (sheet_name, values) in enumerate(sheets, 1):
+                if progress_callback:
+                    progress_callback(number, len(sheets))
+                started = time.perf_counter()
+                names = self._sheet_parts(number)
+                archive.writestr(names[self.sheet_part], self.sheet.render(values, selected=number == 1))
+                for part in self.clone_parts:
+                    if part != self.sheet_part:
+                        archive.writestr(names[part], self.package.parts[part])
+                    if self.clone_rels[part]:
+                        archive.writestr(_rels_path(names[part]), self._rels_xml(part, names))
+                if observer:
+                    observer.sheet_written(number, sheet_name, time.perf_counter() - started, len(values))
+
+        return len(sheets)
+
+
+def write_certificates_xml(template_file, output_file, sheets, progress_callback=None):
+    """Write a certificate workbook with TemplateXmlWriter (see TemplateXmlWriter.write)"""
+    return TemplateXmlWriter(template_file).write(output_file, sheets, progress_callback)
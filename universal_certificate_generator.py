@@ -6,89 +6,306 @@ by simply providing the input file path, output file path, and prefix.
 
 Usage:
     python universal_certificate_generator.py
+    python universal_certificate_generator.py --profile   (cProfile/tracemalloc report next to the output)
 
 The script will prompt you for:
 1. Path to calibration Excel file
 2. Output file name
 3. Sheet name prefix (e.g., 'TowerB', 'TowerC', 'GF', 'Basement')
+
+Non-interactive (schedulers, cron): pass --input with files or glob patterns.
+Progress goes to stderr and a JSON summary to stdout. Exit code 0 means every
+file succeeded, 1 that at least one failed, 2 that no input file was found.
+    python universal_certificate_generator.py --input "inputFiles/*.xlsx" --output Output
+    python universal_certificate_generator.py -i cal.xlsx -o TowerB.xlsx -p TowerB --format both
+    python universal_certificate_generator.py -i "incoming/**/*.xlsx" --engine direct_xml --format pdf
+    python universal_certificate_generator.py -i "inputFiles/*.xlsx" --template Base   (template per meter, see template_registry.py)
+    python universal_certificate_generator.py -i site.xlsx --all-sheets -p TowerB      (one sheet per floor)
+    python universal_certificate_generator.py -i "daily/*.csv" --combine -o Site.xlsx  (one file for all inputs)
+    python universal_certificate_generator.py -i site.xlsx -o Site.xlsx --volume-size 500 -j 4   (Site_001.xlsx, ... + Site.volumes.json)
 """
 
-from openpyxl import load_workbook, Workbook
-from copy import copy
+from openpyxl import Workbook
+from openpyxl.workbook.child import avoid_duplicate_name
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import contextlib
+import glob
+import json
 import os
+import re
 import sys
+import tempfile
+import time
+
+from calibration_ingest import ingest, source_label
+from calibration_table import calibrate
+from certificate_manifest import changed_sheets, meter_fingerprint, write_manifest
+from certificate_volumes import VOLUME_GROUPS, plan_volumes, volume_files, volume_index_path, write_volume_index
+from generation_metrics import GenerationMetrics, ObserverGroup, PhaseTimer, profile_call
+from template_cache import load_cell_mapping, load_template, load_xml_writer, template_hash
+from template_registry import read_sheet_templates, resolve_templates, write_sheet_templates
+from workbook_merge import WorkbookMerger, XlsxPackage, deduplicate_media, merge_workbooks
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TEMPLATE = os.path.join(BASE_DIR, 'Base', 'Book1.xlsx')
+DEFAULT_OUTPUT_DIR = os.path.join(BASE_DIR, 'Output')
+
+# Characters Excel rejects in sheet titles
+INVALID_SHEET_TITLE = re.compile(r'[\\*?:/\[\]]')
+
+
+def certificate_values(meter, mapping=None):
+    """
+    Build the cell values that are filled into a certificate sheet.
+    
+    Args:
+        meter: MeterRecord, already run through calibration_table.calibrate()
+        mapping: CellMapping of the template (default: the mapping of DEFAULT_TEMPLATE)
+    
+    Returns:
+        dict of {cell coordinate: value}
+    """
+    return (mapping or load_cell_mapping(DEFAULT_TEMPLATE)).values(meter)
+
+
+def certificate_sheet_names(meters, sheet_prefix):
+    """
+    Build a unique sheet name for every meter.
+    
+    Duplicates get a number appended, the same way openpyxl renames them.
+    Characters Excel does not allow in sheet names (: \\ / ? * [ ]) are dropped.
+    """
+    sheet_names = []
+    for meter in meters:
+        location_clean = (meter.location.upper()
+                         .replace(' ', '_')
+                         .replace('(', '')
+                         .replace(')', '')
+                         .replace('&', 'AND')
+                         .replace('-', '_'))
+        location_clean = INVALID_SHEET_TITLE.sub('', location_clean)
+        sheet_name = f"{sheet_prefix}_{location_clean}"[:31]  # Excel limit is 31 chars
+        sheet_names.append(avoid_duplicate_name(sheet_names, sheet_name))
+    return sheet_names
+
+
+def build_certificate_workbook(template, meters, sheet_names, streaming=False, verbose=False,
+                               progress_callback=None, observer=None, mapping=None, routes=None):
+    """
+    Create a workbook with one certificate sheet per meter.
+    
+    Args:
+        template: CompiledTemplate to stamp onto every sheet
+        meters: list of MeterRecords
+        sheet_names: sheet name for each meter
+        streaming: Write each sheet to disk as it is created (write-only workbook)
+        verbose: Print a line per sheet
+        progress_callback: Optional function(current, total) called per sheet
+        observer: Optional GenerationObserver told about every sheet written
+        mapping: CellMapping of the template (default: the mapping of DEFAULT_TEMPLATE)
+        routes: Optional TemplateRoutes for a file that mixes templates; the
+            template and mapping of every meter are taken from it instead
+    
+    Returns:
+        The unsaved openpyxl Workbook
+    """
+    mapping = mapping or load_cell_mapping(DEFAULT_TEMPLATE)
+    if streaming:
+        wb_new = Workbook(write_only=True)  # Sheets are streamed to disk one by one
+    else:
+        wb_new = Workbook()
+        wb_new.remove(wb_new.active)  # Remove default sheet
+    if routes:
+        # Bind every template of the file, in the same order and with the cell
+        # styles registered up front, so shards and partial workbooks of one
+        # file always get identical style tables (workbook_merge needs that)
+        variants = []
+        for variant_template, variant_mapping in routes.variants:
+            variant_stamp = variant_template.bind(wb_new)
+            for style_array in variant_stamp.style_arrays:
+                wb_new._cell_styles.add(style_array)
+            variants.append((variant_template, variant_mapping, variant_stamp))
+    else:
+        variants = [(template, mapping, template.bind(wb_new))]  # Register template styles once
+    
+    for idx, (meter, sheet_name) in enumerate(zip(meters, sheet_names), 1):
+        if verbose:
+            print(f"   [{idx}/{len(meters)}] {sheet_name}")
+        if progress_callback:
+            progress_callback(idx, len(meters))
+        started = time.perf_counter()
+        
+        # Create new sheet and stamp the compiled template onto it
+        ws_new = wb_new.create_sheet(title=sheet_name)
+        sheet_template, sheet_mapping, stamp = variants[routes.index[idx - 1] if routes else 0]
+        
+        # Fill in the meter data (cell positions are precompiled in the mapping)
+        cells = sheet_mapping.cells(meter)
+        if streaming:
+            # Write the sheet to disk now instead of keeping it in memory
+            stamp.write(ws_new, cells=cells)
+        else:
+            stamp.apply(ws_new)
+            for row, column, value in cells:
+                ws_new.cell(row=row, column=column).value = value
+        
+        if observer:
+            observer.sheet_written(idx, sheet_name, time.perf_counter() - started,
+                                   len(sheet_template.cells) + len(cells))
+    
+    return wb_new
+
+
+def save_certificate_workbook(wb_new, output_file):
+    """Save a certificate workbook, storing the template pictures only once"""
+    wb_new.save(output_file)
+    wb_new.close()
+    # openpyxl writes a copy of the logo and signature for every sheet
+    deduplicate_media(output_file)
+
+
+def write_certificate_shard(template, meters, sheet_names, shard_file, streaming=False, mapping=None,
+                            routes=None):
+    """Worker process entry point: build and save one slice of the certificates"""
+    wb_new = build_certificate_workbook(template, meters, sheet_names, streaming, mapping=mapping, routes=routes)
+    save_certificate_workbook(wb_new, shard_file)
+    return len(meters)
+
+
+def write_certificate_volume(volume_file, template, meters, sheet_names, streaming=False, mapping=None,
+                             routes=None, xml_template_file=None):
+    """
+    Worker process entry point: write one volume of a split run.
+    
+    With xml_template_file the volume is written by the direct_xml engine
+    from that template, otherwise like a shard.
+    
+    Returns:
+        Size of the volume file in bytes
+    """
+    if xml_template_file:
+        sheets = [(sheet_name, mapping.values(meter)) for meter, sheet_name in zip(meters, sheet_names)]
+        load_xml_writer(xml_template_file).write(volume_file, sheets)
+    else:
+        write_certificate_shard(template, meters, sheet_names, volume_file, streaming, mapping, routes)
+    return os.path.getsize(volume_file)
 
-def generate_certificates(calibration_file, output_file, sheet_prefix, template_file):
+
+def update_certificate_workbook(output_file, template, meters, sheet_names, changed, streaming=False,
+                                mapping=None, routes=None):
+    """
+    Rebuild only some sheets of an existing certificate file.
+    
+    Changed sheets are rendered into a small partial workbook whose sheet XML
+    replaces the old sheet XML; every other sheet is copied byte for byte.
+    
+    Args:
+        output_file: Existing certificate file built from the same template
+        template: CompiledTemplate
+        meters: list of MeterRecords for the whole file
+        sheet_names: sheet name for each meter
+        changed: indexes of the sheets to rebuild (new sheets at the end are appended)
+        streaming: Build the partial workbook in write-only mode
+        mapping: CellMapping of the template
+        routes: TemplateRoutes of the whole file when it mixes templates
+    """
+    if not changed:
+        return
+    
+    base = XlsxPackage(output_file)
+    sheet_parts = {name: part for name, part in base.sheets()}
+    
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    with tempfile.TemporaryDirectory(dir=output_dir) as work_dir:
+        partial_file = os.path.join(work_dir, "changed.xlsx")
+        if routes:
+            routes = routes._replace(index=[routes.index[idx] for idx in changed])
+        write_certificate_shard(template, [meters[idx] for idx in changed],
+                                [sheet_names[idx] for idx in changed], partial_file, streaming, mapping, routes)
+        source = XlsxPackage(partial_file)
+        
+        merger = WorkbookMerger(base)
+        for sheet_name, sheet_part in source.sheets():
+            if sheet_name in sheet_parts:
+                merger.replace_sheet(sheet_parts[sheet_name], source, sheet_part)
+            else:
+                merger.add_sheet(source, sheet_name, sheet_part)
+        
+        # Save next to the output first so a failure never leaves a broken file
+        updated_file = os.path.join(work_dir, "updated.xlsx")
+        merger.finish().save(updated_file)
+        os.replace(updated_file, output_file)
+
+
+def generate_certificates(calibration_file, output_file, sheet_prefix, template_file,
+                          streaming=False, jobs=1, incremental=False, direct_xml=False, observer=None,
+                          all_sheets=False, volume_size=None, volume_by=None):
     """
     Generate certificates from a calibration file.
     
     Args:
-        calibration_file: Path to the calibration Excel file
+        calibration_file: Path to the calibration file, or a folder, glob
+            pattern or list of them whose meters all go into one output file
+            (see calibration_ingest)
         output_file: Path for the output Excel file
         sheet_prefix: Prefix for sheet names (e.g., 'TowerB', 'GF')
-        template_file: Path to the template Excel file
+        template_file: Path to the template Excel file, or a template folder
+            (e.g. Base) whose TemplateRegistry picks the template per meter
+        streaming: Write each sheet to disk as it is created (write-only
+            workbook) so memory stays bounded for very large files
+        jobs: Number of worker processes; with more than one, slices of the
+            meter list are rendered in parallel and merged into one file
+        incremental: Only rebuild sheets whose meter data changed since the
+            last incremental run (tracked in <output_file>.manifest.json)
+        direct_xml: Write the file straight from the template package, only
+            substituting the filled cells in the sheet XML (fastest; jobs,
+            streaming and incremental do not apply)
+        observer: Optional GenerationObserver that receives phase, sheet and
+            file events (sheet events are not reported from worker processes)
+        all_sheets: Read every calibration sheet of the Excel files (one sheet
+            per floor), not only Sheet1
+        volume_size: Split the output into workbooks of at most this many
+            sheets, written next to output_file with an index manifest
+            (see certificate_volumes); with jobs > 1 the volumes are
+            written in parallel
+        volume_by: Split the output per 'floor' or per calibration 'source'
+            (sheet or file), optionally combined with volume_size
     """
+    metrics = GenerationMetrics()
+    observer = ObserverGroup([metrics, observer])
+    phases = PhaseTimer(observer)
+    
     print("=" * 70)
     print(f"Universal Certificate Generator")
     print("=" * 70)
     
     # Step 1: Load calibration data
-    print(f"\n[1/5] Loading calibration data from: {os.path.basename(calibration_file)}")
-    if not os.path.exists(calibration_file):
-        print(f"ERROR: File not found: {calibration_file}")
+    inputs = [calibration_file] if isinstance(calibration_file, str) else list(calibration_file)
+    print(f"\n[1/5] Loading calibration data from: {', '.join(os.path.basename(path) for path in inputs)}")
+    missing = [path for path in inputs if not glob.has_magic(path) and not os.path.exists(path)]
+    if missing:
+        print(f"ERROR: File not found: {missing[0]}")
         return False
     
-    wb_cal = load_workbook(calibration_file)
-    ws_cal = wb_cal['Sheet1']
-    
-    # Extract all meter data
-    meters = []
-    for row in ws_cal.iter_rows(min_row=5, values_only=False):
-        if row[0].value and row[1].value:  # Has location and serial
-            # Check MWH first, then KWH for Before Calibration
-            before_mwh = row[7].value  # Column H
-            before_kwh = row[8].value  # Column I
-            if before_mwh:
-                before_unit = 'MWH'
-                before_value = before_mwh
-            elif before_kwh:
-                before_unit = 'KWH'
-                before_value = before_kwh
-            else:
-                before_unit = None
-                before_value = None
-            
-            # Check MWH first, then KWH for After Calibration
-            after_mwh = row[13].value if len(row) > 13 else None  # Column N
-            after_kwh = row[14].value if len(row) > 14 else None  # Column O
-            if after_mwh:
-                after_unit = 'MWH'
-                after_value = after_mwh
-            elif after_kwh:
-                after_unit = 'KWH'
-                after_value = after_kwh
-            else:
-                after_unit = None
-                after_value = None
-            
-            meter_data = {
-                'location': str(row[0].value).strip(),
-                'serial': str(row[1].value).strip(),
-                'meter_size': row[2].value,
-                'before_inlet': row[5].value,      # Column F (Inlet Temp)
-                'before_outlet': row[4].value,     # Column E (Outlet Temp)
-                'before_m3hr': row[6].value,       # Column G
-                'before_unit': before_unit,
-                'before_value': before_value,
-                'after_inlet': row[11].value if len(row) > 11 else None,    # Column L
-                'after_outlet': row[10].value if len(row) > 10 else None,   # Column K
-                'after_m3hr': row[12].value if len(row) > 12 else None,     # Column M
-                'after_unit': after_unit,
-                'after_value': after_value,
-            }
-            meters.append(meter_data)
-    
+    phases.start('load')
+    ingested = ingest(inputs, all_sheets, jobs)  # Every sheet/file, read in parallel with jobs > 1
+    meters = ingested.meters
+    if len(ingested.sources) > 1:
+        for source, count in ingested.sources:
+            print(f"   {count:5d} meters from {source_label(source)}")
+    if ingested.duplicates:
+        print(f"   ! {len(ingested.duplicates)} serial(s) delivered again: the latest reading is used")
+    if not meters:
+        print(f"ERROR: No meters found in {', '.join(os.path.basename(path) for path in inputs)}")
+        return False
+    calibration = calibrate(meters)  # Typed readings and Delta T for every meter
     print(f"   ✓ Found {len(meters)} meters")
+    flagged = calibration.flagged()
+    observer.meters_loaded(len(meters), len(flagged))
+    if flagged:
+        print(f"   ! {len(flagged)} meters flagged (run calibration_table.py for details)")
     
     # Step 2: Load template
     print(f"\n[2/5] Loading template from: {os.path.basename(template_file)}")
@@ -96,105 +313,367 @@ def generate_certificates(calibration_file, output_file, sheet_prefix, template_
         print(f"ERROR: Template file not found: {template_file}")
         return False
     
-    wb_template = load_workbook(template_file)
-    template_sheet = wb_template[wb_template.sheetnames[0]]
-    print(f"   ✓ Template loaded")
+    phases.start('template')
+    template_file, routes = resolve_templates(template_file, meters, sheet_prefix)
+    if routes:
+        print(f"   ✓ {len(routes.variants)} templates for this file:")
+        for number, name in enumerate(routes.names):
+            print(f"     {routes.index.count(number):5d} x {name}")
+        if direct_xml:
+            # The direct_xml writer copies one template package
+            print("   Mixed templates need the openpyxl engine: using it")
+            direct_xml = False
+    else:
+        print(f"   Template: {os.path.basename(template_file)}")
+    if direct_xml:
+        writer = load_xml_writer(template_file)  # Reused while the template is unchanged
+        print(f"   ✓ Template package loaded ({len(writer.package.parts)} parts)")
+    else:
+        template = load_template(template_file)  # Cached unless the template changed
+        print(f"   ✓ Template loaded ({len(template.cells)} cells, {len(template.styles)} styles)")
+    mapping = load_cell_mapping(template_file)  # Which meter fields go into which cells
+    print(f"   ✓ Cell mapping: {os.path.basename(mapping.name)} ({len(mapping.setters)} cells)")
     
-    # Step 3: Create new workbook
-    print(f"\n[3/5] Creating new workbook...")
-    wb_new = Workbook()
-    wb_new.remove(wb_new.active)  # Remove default sheet
+    # Step 3: Name the certificate sheets
+    print(f"\n[3/5] Naming {len(meters)} certificate sheets...")
+    phases.start('names')
+    sheet_names = certificate_sheet_names(meters, sheet_prefix)
     
-    # Step 4: Create certificate sheets
-    print(f"\n[4/5] Creating certificate sheets...")
-    for idx, meter in enumerate(meters, 1):
-        # Create sheet name from location
-        location_clean = (meter['location'].upper()
-                         .replace(' ', '_')
-                         .replace('(', '')
-                         .replace(')', '')
-                         .replace('&', 'AND')
-                         .replace('-', '_'))
-        sheet_name = f"{sheet_prefix}_{location_clean}"[:31]  # Excel limit is 31 chars
-        
-        print(f"   [{idx}/{len(meters)}] {sheet_name}")
-        
-        # Create new sheet by copying template structure
-        ws_new = wb_new.create_sheet(title=sheet_name)
-        
-        # Copy all cells from template
-        for row in template_sheet.iter_rows():
-            for cell in row:
-                new_cell = ws_new[cell.coordinate]
-                if cell.value:
-                    new_cell.value = cell.value
-                if cell.has_style:
-                    new_cell.font = copy(cell.font)
-                    new_cell.border = copy(cell.border)
-                    new_cell.fill = copy(cell.fill)
-                    new_cell.number_format = copy(cell.number_format)
-                    new_cell.protection = copy(cell.protection)
-                    new_cell.alignment = copy(cell.alignment)
-        
-        # Copy column widths and row heights
-        for col_letter, col_dim in template_sheet.column_dimensions.items():
-            ws_new.column_dimensions[col_letter].width = col_dim.width
-        for row_num, row_dim in template_sheet.row_dimensions.items():
-            ws_new.row_dimensions[row_num].height = row_dim.height
-        
-        # Copy merged cells
-        for merged_cell_range in template_sheet.merged_cells.ranges:
-            ws_new.merge_cells(str(merged_cell_range))
+    volumes = None
+    if volume_size or volume_by:
+        volumes = plan_volumes(output_file, meters, volume_size, volume_by, ingested.origins)
+        print(f"   ✓ {len(volumes)} volume(s) of up to {max(len(volume.indexes) for volume in volumes)} sheets")
+        if incremental:
+            print("   Incremental updates work on a single file: the volumes are rebuilt")
+            incremental = False
+    
+    changed = None
+    if incremental and direct_xml:
+        # Sheets written from the template XML cannot be swapped with openpyxl-built ones
+        print("   Incremental updates need the openpyxl engine: full rebuild")
+        incremental = False
+    if incremental:
+        if routes:
+            digest = routes.digest  # A different template set rebuilds every sheet
+        else:
+            digest = f"{template_hash(template_file)}:{mapping.digest}"  # A new mapping rebuilds every sheet
+        fingerprints = [meter_fingerprint(name, meter) for name, meter in zip(sheet_names, meters)]
+        changed = changed_sheets(output_file, digest, sheet_names, fingerprints)
+        if changed is None:
+            print("   No usable manifest (first run, template or sheet list changed): full rebuild")
+    
+    if volumes:
+        # Step 4: Write every volume as its own workbook, in worker processes with jobs > 1
+        workers = min(jobs, len(volumes))
+        print(f"\n[4/5] Creating {len(volumes)} certificate volumes" +
+              (f" with {workers} workers..." if workers > 1 else "..."))
+        phases.start('fill')
+        calls = []
+        for volume in volumes:
+            volume_routes = routes._replace(index=[routes.index[idx] for idx in volume.indexes]) if routes else None
+            calls.append((volume.file, None if direct_xml else template, [meters[idx] for idx in volume.indexes],
+                          [sheet_names[idx] for idx in volume.indexes], streaming, mapping, volume_routes,
+                          template_file if direct_xml else None))
+        with ProcessPoolExecutor(max_workers=workers) if workers > 1 else contextlib.nullcontext() as executor:
+            sizes = (executor.map if executor else map)(write_certificate_volume, *zip(*calls))
+            for idx, (volume, size, call) in enumerate(zip(volumes, sizes, calls), 1):
+                observer.file_saved(volume.file, size)
+                volume_file, _, _, volume_sheets, _, _, volume_routes, _ = call
+                write_sheet_templates(volume_file, template_file, volume_routes, volume_sheets)  # For the PDF export
+                print(f"   [{idx}/{len(volumes)}] {os.path.basename(volume.file)} ({len(volume.indexes)} sheets)")
         
-        # Fill in the meter data
-        ws_new['B7'].value = f"Serial No: {meter['serial']}"
-        ws_new['B8'].value = f"Meter Location : {meter['location']}"
-        meter_size_text = f"DN-{meter['meter_size']}" if meter['meter_size'] else "DN-65"
-        ws_new['B9'].value = f"Meter Size : {meter_size_text}"
+        # Step 5: Index of which certificate is in which volume
+        print(f"\n[5/5] Writing volume index...")
+        phases.start('save')
+        write_volume_index(output_file, volumes, sheet_names, {'size': volume_size, 'by': volume_by})
+        output_file = volume_index_path(output_file)
+        print(f"   ✓ Index saved: {output_file}")
+    elif direct_xml:
+        # Step 4/5: Stream the substituted template sheets straight into the output zip
+        print(f"\n[4/5] Creating certificate sheets from the template XML...")
+        phases.start('fill')
+        sheets = [(sheet_name, mapping.values(meter)) for meter, sheet_name in zip(meters, sheet_names)]
+        print(f"\n[5/5] Writing certificate file...")
+        phases.start('save')  # Sheets are rendered while the zip is written
+        writer.write(output_file, sheets, observer=observer)
+        print(f"   ✓ File saved: {output_file}")
+    elif changed is not None:
+        # Step 4: Rebuild only the sheets whose meter data changed
+        print(f"\n[4/5] Rebuilding {len(changed)} changed certificate sheet(s)...")
+        phases.start('fill')
+        for idx in changed:
+            print(f"   [{sheet_names[idx]}]")
         
-        # Before Calibration
-        if meter['before_unit'] and meter['before_value'] is not None:
-            ws_new['I13'].value = f"{meter['before_unit']}= BTU*{meter['before_value']}"
-        if meter['before_inlet'] is not None:
-            ws_new['D14'].value = float(meter['before_inlet'])
-        if meter['before_outlet'] is not None:
-            ws_new['D15'].value = float(meter['before_outlet'])
-        if meter['before_m3hr'] is not None:
-            ws_new['F16'].value = float(meter['before_m3hr'])
-        if meter['before_inlet'] is not None and meter['before_outlet'] is not None:
-            delta_t = abs(float(meter['before_outlet']) - float(meter['before_inlet']))
-            ws_new['D16'].value = delta_t
+        # Step 5: Swap the rebuilt sheets into the existing file
+        print(f"\n[5/5] Updating certificate file...")
+        phases.start('save')
+        update_certificate_workbook(output_file, template, meters, sheet_names, changed, streaming, mapping,
+                                    routes)
+        print(f"   ✓ File updated: {output_file}")
+    elif jobs > 1 and len(meters) > 1:
+        # Step 4: Render slices of the meter list in worker processes
+        jobs = min(jobs, len(meters))
+        shard_size = -(-len(meters) // jobs)  # ceil division
+        print(f"\n[4/5] Creating certificate sheets in {jobs} shards of up to {shard_size}...")
+        phases.start('fill')
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_file))) as shard_dir:
+            shard_files = []
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = []
+                for start in range(0, len(meters), shard_size):
+                    shard_file = os.path.join(shard_dir, f"shard{len(futures) + 1}.xlsx")
+                    shard_files.append(shard_file)
+                    shard_routes = routes._replace(index=routes.index[start:start + shard_size]) if routes else None
+                    futures.append(executor.submit(
+                        write_certificate_shard, template, meters[start:start + shard_size],
+                        sheet_names[start:start + shard_size], shard_file, streaming, mapping, shard_routes))
+                for idx, future in enumerate(futures, 1):
+                    count = future.result()
+                    print(f"   [{idx}/{len(futures)}] Shard done ({count} sheets)")
+            
+            # Step 5: Merge the shard workbooks into the output file
+            print(f"\n[5/5] Merging {len(shard_files)} shards and saving certificate file...")
+            phases.start('save')
+            merge_workbooks(shard_files, output_file)
+            print(f"   ✓ File saved: {output_file}")
+    else:
+        # Step 4: Create certificate sheets
+        print(f"\n[4/5] Creating certificate sheets...")
+        phases.start('fill')
+        wb_new = build_certificate_workbook(template, meters, sheet_names, streaming, verbose=True,
+                                            observer=observer, mapping=mapping, routes=routes)
         
-        # After Calibration
-        if meter['after_unit'] and meter['after_value'] is not None:
-            ws_new['I19'].value = f"{meter['after_unit']}= BTU*{meter['after_value']}"
-        if meter['after_inlet'] is not None:
-            ws_new['D20'].value = float(meter['after_inlet'])
-        if meter['after_outlet'] is not None:
-            ws_new['D21'].value = float(meter['after_outlet'])
-        if meter['after_m3hr'] is not None:
-            ws_new['F22'].value = float(meter['after_m3hr'])
-    
-    # Step 5: Save the file
-    print(f"\n[5/5] Saving certificate file...")
-    wb_new.save(output_file)
-    print(f"   ✓ File saved: {output_file}")
+        # Step 5: Save the file
+        print(f"\n[5/5] Saving certificate file...")
+        phases.start('save')
+        save_certificate_workbook(wb_new, output_file)
+        print(f"   ✓ File saved: {output_file}")
     
-    # Close workbooks
-    wb_template.close()
-    wb_cal.close()
-    wb_new.close()
+    if incremental:
+        write_manifest(output_file, digest, sheet_names, fingerprints)
+    if not volumes:
+        write_sheet_templates(output_file, template_file, routes, sheet_names)  # For the PDF export
+    phases.stop()
+    if not volumes:
+        observer.file_saved(output_file, os.path.getsize(output_file))
     
     print("\n" + "=" * 70)
     print(f"✓ SUCCESS! Created {len(meters)} certificate sheets")
     print(f"✓ Output: {output_file}")
+    print("Timing:")
+    for line in metrics.report():
+        print(line)
     print("=" * 70)
     
     return True
 
 
-def main():
-    """Main function with interactive prompts"""
+def default_sheet_prefix(calibration_file):
+    """Guess the sheet prefix from the calibration file name (e.g. 'TowerB', 'GF', 'Basement')"""
+    base_name = os.path.splitext(os.path.basename(os.path.normpath(calibration_file)))[0]
+    if "TowerB" in base_name or "TOWER B" in base_name.upper():
+        return "TowerB"
+    elif "TowerC" in base_name or "TOWER C" in base_name.upper():
+        return "TowerC"
+    elif "GROUND" in base_name.upper():
+        return "GF"
+    elif "BASEMENT" in base_name.upper():
+        return "Basement"
+    return "Tower"
+
+
+def expand_inputs(patterns):
+    """
+    Expand file names and glob patterns into a sorted list of calibration files.
+    
+    Excel lock files (~$*.xlsx) are skipped. Plain names are kept as given:
+    a folder is read as one site (calibration_ingest) and a file that does
+    not exist is reported as a failed file.
+    
+    Returns:
+        (files, unmatched): list of paths, list of patterns that matched nothing
+    """
+    files = []
+    unmatched = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = [path for path in sorted(glob.glob(pattern, recursive=True))
+                       if os.path.isfile(path) and not os.path.basename(path).startswith('~$')]
+            if not matches:
+                unmatched.append(pattern)
+        else:
+            matches = [pattern]
+        for path in matches:
+            if os.path.abspath(path) not in map(os.path.abspath, files):
+                files.append(path)
+    return files, unmatched
+
+
+def output_paths(inputs, output):
+    """
+    Map every input file to its output .xlsx file.
+    
+    One input with an .xlsx `output` writes exactly that file. Otherwise
+    `output` is a folder and each input gets <input name>_certificates.xlsx.
+    """
+    if len(inputs) == 1 and output.lower().endswith('.xlsx'):
+        return [output]
+    paths = []
+    for calibration_file in inputs:
+        stem = os.path.splitext(os.path.basename(os.path.normpath(calibration_file)))[0]
+        path = os.path.join(output, f"{stem}_certificates.xlsx")
+        count = 2
+        while path in paths:  # Same file name in two input folders
+            path = os.path.join(output, f"{stem}_{count}_certificates.xlsx")
+            count += 1
+        paths.append(path)
+    return paths
+
+
+def process_file(calibration_file, output_file, sheet_prefix, template_file, output_format='xlsx',
+                 engine='openpyxl', jobs=1, incremental=False, profile=False, all_sheets=False,
+                 volume_size=None, volume_by=None):
+    """
+    Generate one certificate file (and/or its PDFs) for the command-line batch.
+    
+    calibration_file may also be a folder or a list of files whose meters go
+    into one certificate file (see generate_certificates()). With
+    volume_size/volume_by the workbook is split into volumes; 'output' is
+    then their index manifest and 'volumes' lists the volume files.
+    
+    PDFs are written to <output file name>_PDF/, one per certificate. With
+    output_format 'pdf' the workbook is only written to a temporary folder.
+    
+    Returns:
+        dict describing the result (see main())
+    """
+    result = {
+        'input': calibration_file,
+        'output': output_file if output_format != 'pdf' else None,
+        'volumes': None,
+        'pdf_folder': None,
+        'prefix': sheet_prefix,
+        'status': 'failed',
+        'certificates': 0,
+        'flagged': 0,
+        'pdfs': 0,
+        'pdf_failed': [],
+        'seconds': 0.0,
+        'phases': {},
+        'error': None,
+    }
+    start = time.perf_counter()
+    metrics = GenerationMetrics()
+    try:
+        output_folder = os.path.dirname(os.path.abspath(output_file))
+        os.makedirs(output_folder, exist_ok=True)
+        work = tempfile.TemporaryDirectory(dir=output_folder) if output_format == 'pdf' else contextlib.nullcontext()
+        with work as work_dir:
+            xlsx_file = os.path.join(work_dir, os.path.basename(output_file)) if work_dir else output_file
+            options = dict(streaming=engine == 'streaming', jobs=jobs, direct_xml=engine == 'direct_xml',
+                           incremental=incremental and output_format != 'pdf', observer=metrics,
+                           all_sheets=all_sheets, volume_size=volume_size, volume_by=volume_by)
+            if profile:
+                success = profile_call(output_file, generate_certificates, calibration_file, xlsx_file,
+                                       sheet_prefix, template_file, **options)
+            else:
+                success = generate_certificates(calibration_file, xlsx_file, sheet_prefix, template_file, **options)
+            
+            volumes = volume_files(xlsx_file) if success and (volume_size or volume_by) else None
+            if volumes and output_format != 'pdf':
+                result['output'] = volume_index_path(output_file)
+                result['volumes'] = [volume_file for volume_file, _ in volumes]
+            
+            if not success:
+                result['error'] = "Generation failed (see log)"
+            elif output_format in ('pdf', 'both'):
+                from certificate_pdf import export_sheet_pdfs
+                
+                pdf_folder = os.path.splitext(output_file)[0] + '_PDF'
+                print(f"\nExporting PDFs to {pdf_folder}...")
+                exported, failed = [], []
+                for workbook_file, _ in volumes or [(xlsx_file, None)]:
+                    # Every sheet is drawn with the layout of the template it was built from
+                    done, errors = export_sheet_pdfs(workbook_file, None, pdf_folder, jobs=jobs,
+                                                     sheet_templates=read_sheet_templates(workbook_file))
+                    exported.extend(done)
+                    failed.extend(errors)
+                print(f"   ✓ Exported {len(exported)} PDF(s)")
+                result['pdf_folder'] = pdf_folder
+                result['pdfs'] = len(exported)
+                result['pdf_failed'] = [{'sheet': sheet_name, 'error': error} for sheet_name, error in failed]
+                if failed:
+                    result['error'] = f"{len(failed)} PDF(s) failed"
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        print(f"\n✗ ERROR: {result['error']}")
+    
+    summary = metrics.summary()
+    result['certificates'] = summary['meters']
+    result['flagged'] = summary['flagged']
+    result['phases'] = summary['phases']
+    result['seconds'] = time.perf_counter() - start
+    if result['error'] is None:
+        result['status'] = 'ok'
+    return result
+
+
+def run_batch(args):
+    """
+    Non-interactive mode: generate every --input file and print a JSON summary.
+    
+    Progress output goes to stderr so stdout only carries the JSON summary.
+    
+    Returns:
+        Exit code: 0 when every file succeeded, 1 when any failed, 2 when no
+        input file matched
+    """
+    inputs, unmatched = expand_inputs(args.inputs)
+    for pattern in unmatched:
+        print(f"WARNING: No files match {pattern}", file=sys.stderr)
+    if not inputs:
+        print(json.dumps({'files': [], 'succeeded': 0, 'failed': 0, 'error': "No input files"}, indent=2))
+        return 2
+    if args.combine:
+        # The whole site is one job: all inputs go into a single certificate file
+        sheet_prefix = args.prefix or default_sheet_prefix(inputs[0])
+        if args.output.lower().endswith('.xlsx'):
+            output_file = args.output
+        else:
+            output_file = os.path.join(args.output, f"{sheet_prefix}_certificates.xlsx")
+        runs = [(inputs, output_file, sheet_prefix)]
+    elif args.output.lower().endswith('.xlsx') and len(inputs) > 1:
+        print(f"ERROR: --output must be a folder when there are {len(inputs)} input files "
+              f"(or use --combine)", file=sys.stderr)
+        return 2
+    else:
+        runs = [(calibration_file, output_file, args.prefix or default_sheet_prefix(calibration_file))
+                for calibration_file, output_file in zip(inputs, output_paths(inputs, args.output))]
+    
+    start = time.perf_counter()
+    results = []
+    with contextlib.redirect_stdout(sys.stderr):
+        for calibration_file, output_file, sheet_prefix in runs:
+            results.append(process_file(calibration_file, output_file, sheet_prefix, args.template,
+                                        args.format, args.engine, args.jobs, args.incremental, args.profile,
+                                        args.all_sheets, args.volume_size, args.volume_by))
+    
+    failed = sum(1 for result in results if result['status'] != 'ok')
+    print(json.dumps({
+        'files': results,
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'certificates': sum(result['certificates'] for result in results),
+        'seconds': time.perf_counter() - start,
+        'template': args.template,
+        'format': args.format,
+        'engine': args.engine,
+    }, indent=2))
+    return 1 if failed else 0
+
+
+def run_interactive(args):
+    """Prompt for one calibration file and generate its certificates"""
     print("\n" + "=" * 70)
     print("  UNIVERSAL CERTIFICATE GENERATOR")
     print("=" * 70)
@@ -210,7 +689,7 @@ def main():
     cal_file = input("\n1. Calibration file name (e.g., 'CP TOWER B CALIBRATION.xlsx')\n   > ").strip()
     if not cal_file:
         print("ERROR: File name is required")
-        return
+        return 2
     
     cal_file_path = os.path.join(base_dir, cal_file)
     
@@ -218,7 +697,7 @@ def main():
     output_file = input("\n2. Output file name (e.g., 'CYBER_PARK_TOWER_B_complete.xlsx')\n   > ").strip()
     if not output_file:
         print("ERROR: Output file name is required")
-        return
+        return 2
     
     output_file_path = os.path.join(base_dir, output_file)
     
@@ -226,7 +705,7 @@ def main():
     sheet_prefix = input("\n3. Sheet name prefix (e.g., 'TowerB', 'GF', 'Basement')\n   > ").strip()
     if not sheet_prefix:
         print("ERROR: Sheet prefix is required")
-        return
+        return 2
     
     # Template file (fixed)
     template_file = os.path.join(base_dir, 'CYBER_PARK_TOWER_A_complete.xlsx')
@@ -242,23 +721,78 @@ def main():
     confirm = input("\nProceed with generation? (yes/no): ").strip().lower()
     if confirm not in ['yes', 'y']:
         print("Cancelled.")
-        return
+        return 0
     
     # Generate certificates
-    success = generate_certificates(cal_file_path, output_file_path, sheet_prefix, template_file)
+    if args.profile:
+        success = profile_call(output_file_path, generate_certificates,
+                               cal_file_path, output_file_path, sheet_prefix, template_file)
+    else:
+        success = generate_certificates(cal_file_path, output_file_path, sheet_prefix, template_file)
     
     if success:
         print("\n✓ Certificate generation completed successfully!")
+        return 0
     else:
         print("\n✗ Certificate generation failed. Please check the errors above.")
+        return 1
+
+
+def main(argv=None):
+    """Command-line entry point: batch mode with --input, interactive prompts otherwise"""
+    parser = argparse.ArgumentParser(
+        description="Generate certificates for calibration files. Without --input the script asks for "
+                    "one file interactively.")
+    parser.add_argument('-i', '--input', dest='inputs', nargs='+', action='extend', default=[],
+                        metavar='FILE_OR_GLOB',
+                        help="Calibration file(s), folders or glob patterns (e.g. 'inputFiles/*.xlsx'); can be repeated")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT_DIR,
+                        help="Output .xlsx file for a single input, otherwise output folder "
+                             "(default: %(default)s)")
+    parser.add_argument('-p', '--prefix',
+                        help="Sheet name prefix (default: guessed from each file name, e.g. TowerB, GF)")
+    parser.add_argument('-t', '--template', default=DEFAULT_TEMPLATE,
+                        help="Template Excel file, or a template folder whose templates.json picks the "
+                             "template per meter (e.g. Base) (default: %(default)s)")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Worker processes per file (openpyxl and streaming engines, and the PDF export)")
+    parser.add_argument('-f', '--format', choices=('xlsx', 'pdf', 'both'), default='xlsx',
+                        help="Write the workbook, one PDF per certificate (<output>_PDF/), or both")
+    parser.add_argument('--engine', choices=('openpyxl', 'streaming', 'direct_xml'), default='openpyxl',
+                        help="Workbook writer (default: %(default)s)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only rebuild sheets whose meter data changed since the last run")
+    parser.add_argument('--all-sheets', action='store_true',
+                        help="Read every calibration sheet of the Excel files (e.g. one sheet per floor), "
+                             "not only Sheet1")
+    parser.add_argument('--combine', action='store_true',
+                        help="Put the meters of all inputs into one certificate file; a serial found again "
+                             "in a later file replaces the earlier reading")
+    parser.add_argument('--volume-size', type=int, metavar='N',
+                        help="Split each certificate file into workbooks of at most N sheets, with a "
+                             "<output>.volumes.json index")
+    parser.add_argument('--volume-by', choices=VOLUME_GROUPS,
+                        help="Split each certificate file per floor (location before '/') or per "
+                             "calibration sheet/file")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile the run with cProfile and tracemalloc; reports are written next to the output file")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.volume_size is not None and args.volume_size < 1:
+        parser.error("--volume-size must be at least 1")
+    
+    if args.inputs:
+        return run_batch(args)
+    return run_interactive(args)
 
 
 if __name__ == "__main__":
     try:
-        main()
+        sys.exit(main())
     except KeyboardInterrupt:
         print("\n\nOperation cancelled by user.")
-        sys.exit(0)
+        sys.exit(130)
     except Exception as e:
         print(f"\n✗ ERROR: {str(e)}")
         import traceback
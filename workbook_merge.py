@@ -0,0 +1,416 @@
+"""
+Workbook Merge
+==============
+Combines several certificate workbooks into one .xlsx by copying the sheet
+XML parts directly, without loading them into openpyxl.
+
+All input workbooks must be built from the same compiled template, so their
+style tables (xl/styles.xml) are identical and can be shared as-is. For every
+sheet the merge:
+- copies the sheet XML part (and anything it references, e.g. drawings)
+- remaps shared string indices if the sheet uses a shared string table
+- registers the sheet in workbook.xml, the workbook rels and [Content_Types].xml
+
+Identical pictures (the logo and signature on every certificate) are stored
+once: copied sheets reuse media parts that are already in the package, and
+deduplicate_media() does the same for a workbook saved by openpyxl, which
+writes a separate copy of every picture for every sheet.
+
+Usage:
+    merge_workbooks(["part1.xlsx", "part2.xlsx"], "CYBER_PARK_TOWER_B_complete.xlsx")
+    deduplicate_media("CYBER_PARK_TOWER_B_complete.xlsx")
+"""
+
+import hashlib
+import os
+import posixpath
+import re
+import zipfile
+from xml.sax.saxutils import quoteattr
+
+
+CONTENT_TYPES = '[Content_Types].xml'
+WORKBOOK = 'xl/workbook.xml'
+WORKBOOK_RELS = 'xl/_rels/workbook.xml.rels'
+STYLES = 'xl/styles.xml'
+SHARED_STRINGS = 'xl/sharedStrings.xml'
+MEDIA_FOLDER = 'xl/media/'
+
+WORKSHEET_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet'
+SHARED_STRINGS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+SHARED_STRINGS_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml'
+
+_SHEET_RE = re.compile(rb'<sheet\b[^>]*?/>')
+_REL_RE = re.compile(rb'<Relationship\b[^>]*?/>')
+_ATTR_RE = re.compile(rb'([\w:]+)="([^"]*)"')
+_OVERRIDE_RE = re.compile(rb'<Override\b[^>]*?/>')
+_DEFAULT_RE = re.compile(rb'<Default\b[^>]*?/>')
+_SI_RE = re.compile(rb'<si>.*?</si>|<si/>', re.S)
+_SHARED_CELL_RE = re.compile(rb'(<c\b[^>]*\bt="s"[^>]*>\s*<v>)(\d+)(</v>)')
+_NUMBERED_RE = re.compile(r'^(.*?)(\d*)(\.[^.]+)$')
+
+
+def _attrs(element):
+    """Return the attributes of an XML start tag as a dict of str"""
+    return {key.decode(): value.decode() for key, value in _ATTR_RE.findall(element)}
+
+
+def _unescape(value):
+    """Undo XML attribute escaping"""
+    return (value.replace('&quot;', '"').replace('&apos;', "'")
+                 .replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&'))
+
+
+def _insert_before(xml, closing_tag, fragment):
+    """Insert `fragment` before the last `closing_tag` of an XML part"""
+    idx = xml.rindex(closing_tag)
+    return xml[:idx] + fragment + xml[idx:]
+
+
+def _rels_path(part):
+    """Path of the relationship part that belongs to `part`"""
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, '_rels', name + '.rels')
+
+
+def _rels_owner(rels_part):
+    """Part a relationship part belongs to (inverse of _rels_path)"""
+    folder, name = posixpath.split(rels_part)
+    return posixpath.join(posixpath.dirname(folder), name[:-len('.rels')])
+
+
+def _resolve(source_part, target):
+    """Resolve a relationship target relative to its source part"""
+    if target.startswith('/'):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+class XlsxPackage:
+    """An .xlsx file held in memory as {part name: bytes}"""
+
+    def __init__(self, path):
+        with zipfile.ZipFile(path) as archive:
+            self.parts = {name: archive.read(name) for name in archive.namelist()}
+        self._overrides = None
+        self._shared_strings = None
+
+    def relationships(self, part):
+        """Return the relationships of `part` as a list of attribute dicts"""
+        rels = self.parts.get(_rels_path(part))
+        if rels is None:
+            return []
+        return [_attrs(element) for element in _REL_RE.findall(rels)]
+
+    def sheets(self):
+        """Return [(sheet name, sheet part name)] in workbook order"""
+        targets = {rel['Id']: _resolve(WORKBOOK, _unescape(rel['Target']))
+                   for rel in self.relationships(WORKBOOK)}
+        sheets = []
+        for element in _SHEET_RE.findall(self.parts[WORKBOOK]):
+            attrs = _attrs(element)
+            sheets.append((_unescape(attrs['name']), targets[attrs['r:id']]))
+        return sheets
+
+    def shared_strings(self):
+        """Return the raw <si> entries of the shared string table"""
+        if self._shared_strings is None:
+            self._shared_strings = _SI_RE.findall(self.parts.get(SHARED_STRINGS, b''))
+        return self._shared_strings
+
+    def default_types(self):
+        """Return {extension: content type} for the Default content types"""
+        return {attrs['Extension'].lower(): attrs['ContentType']
+                for attrs in map(_attrs, _DEFAULT_RE.findall(self.parts[CONTENT_TYPES]))}
+
+    def content_type(self, part):
+        """Return (is_override, content type) for `part`"""
+        if self._overrides is None:
+            self._overrides = {attrs['PartName'][1:]: attrs['ContentType']
+                               for attrs in map(_attrs, _OVERRIDE_RE.findall(self.parts[CONTENT_TYPES]))}
+        if part in self._overrides:
+            return True, self._overrides[part]
+        extension = posixpath.splitext(part)[1][1:].lower()
+        return False, self.default_types().get(extension)
+
+    def save(self, path):
+        """Write the package to `path`"""
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, data in self.parts.items():
+                archive.writestr(name, data)
+
+
+class WorkbookMerger:
+    """
+    Appends sheets from other packages onto a base package.
+
+    New workbook, rels and content type entries are collected and written
+    once by finish(), so appending thousands of sheets stays linear.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.sheet_names = {name.lower() for name, _ in base.sheets()}
+        self.strings = list(base.shared_strings())
+        self.string_index = {}
+        for idx, entry in enumerate(self.strings):
+            self.string_index.setdefault(entry, idx)
+        self.strings_changed = False
+
+        workbook_rels = {rel['Id'] for rel in base.relationships(WORKBOOK)}
+        self.rel_ids = set(workbook_rels)
+        sheet_ids = [int(_attrs(element)['sheetId']) for element in _SHEET_RE.findall(base.parts[WORKBOOK])]
+        self.next_sheet_id = max(sheet_ids, default=0) + 1
+        self.default_types = base.default_types()
+        self.part_counters = {}
+        self.media_parts = {data: part for part, data in base.parts.items() if part.startswith(MEDIA_FOLDER)}
+
+        self.new_sheets = []
+        self.new_types = []
+        self.new_rels = {}
+
+    def _unique_part(self, part):
+        """Return a part name like `part` that is not used in the base package"""
+        if part not in self.base.parts:
+            return part
+        stem, number, ext = _NUMBERED_RE.match(part).groups()
+        counter = self.part_counters.get((stem, ext), int(number or 1))
+        while True:
+            counter += 1
+            candidate = f"{stem}{counter}{ext}"
+            if candidate not in self.base.parts:
+                self.part_counters[stem, ext] = counter
+                return candidate
+
+    def _add_relationship(self, part, rel_id, rel_type, target, external=False):
+        """Queue a relationship for the rels part of `part`"""
+        mode = ' TargetMode="External"' if external else ''
+        self.new_rels.setdefault(_rels_path(part), []).append(
+            f'<Relationship Id="{rel_id}" Type="{rel_type}" Target={quoteattr(target)}{mode}/>')
+
+    def _register_content_type(self, part, source, source_part):
+        """Give `part` in the base package the content type `source_part` has in `source`"""
+        is_override, content_type = source.content_type(source_part)
+        if content_type is None:
+            return
+        if is_override:
+            self.new_types.append(f'<Override PartName="/{part}" ContentType="{content_type}"/>')
+            return
+        extension = posixpath.splitext(part)[1][1:]
+        if extension.lower() not in self.default_types:
+            self.default_types[extension.lower()] = content_type
+            self.new_types.append(f'<Default Extension="{extension}" ContentType="{content_type}"/>')
+
+    def _remap_strings(self, source, data):
+        """Point shared string indices in sheet XML from `source` at the merged string table"""
+        source_strings = source.shared_strings()
+        if not source_strings:
+            return data
+
+        def remap(match):
+            entry = source_strings[int(match.group(2))]
+            idx = self.string_index.get(entry)
+            if idx is None:
+                idx = self.string_index[entry] = len(self.strings)
+                self.strings.append(entry)
+                self.strings_changed = True
+            return match.group(1) + str(idx).encode() + match.group(3)
+
+        return _SHARED_CELL_RE.sub(remap, data)
+
+    def _copy_part(self, source, source_part, new_part, data=None):
+        """Copy `source_part` (and everything it references) into the base as `new_part`"""
+        self.base.parts[new_part] = source.parts[source_part] if data is None else data
+        self._register_content_type(new_part, source, source_part)
+
+        for rel in source.relationships(source_part):
+            target = _unescape(rel['Target'])
+            if rel.get('TargetMode') == 'External':
+                self._add_relationship(new_part, rel['Id'], rel['Type'], target, external=True)
+                continue
+            target = _resolve(source_part, target)
+            if target.startswith(MEDIA_FOLDER) and source.parts[target] in self.media_parts:
+                # Same picture as one already in the package
+                self._add_relationship(new_part, rel['Id'], rel['Type'], '/' + self.media_parts[source.parts[target]])
+                continue
+            new_target = self._unique_part(target)
+            self._copy_part(source, target, new_target)
+            if new_target.startswith(MEDIA_FOLDER):
+                self.media_parts[source.parts[target]] = new_target
+            self._add_relationship(new_part, rel['Id'], rel['Type'], '/' + new_target)
+
+    def _check_styles(self, source):
+        """Sheets can only be shared between packages with the same style table"""
+        if source.parts.get(STYLES) != self.base.parts.get(STYLES):
+            raise ValueError("Cannot merge workbooks with different style tables")
+
+    def add_sheets(self, source):
+        """Append every sheet of `source` (an XlsxPackage) to the base workbook"""
+        for sheet_name, sheet_part in source.sheets():
+            self.add_sheet(source, sheet_name, sheet_part)
+
+    def add_sheet(self, source, sheet_name, sheet_part):
+        """
+        Append one sheet of `source` to the base workbook.
+
+        Args:
+            source: XlsxPackage the sheet comes from
+            sheet_name: name of the sheet in the merged workbook
+            sheet_part: part name of the sheet XML in `source`
+        """
+        self._check_styles(source)
+        if sheet_name.lower() in self.sheet_names:
+            raise ValueError(f"Duplicate sheet name: {sheet_name}")
+        self.sheet_names.add(sheet_name.lower())
+
+        new_part = self._unique_part('xl/worksheets/sheet1.xml')
+        self._copy_part(source, sheet_part, new_part, self._remap_strings(source, source.parts[sheet_part]))
+
+        counter = len(self.rel_ids) + 1
+        while f"rId{counter}" in self.rel_ids:
+            counter += 1
+        rel_id = f"rId{counter}"
+        self.rel_ids.add(rel_id)
+        self._add_relationship(WORKBOOK, rel_id, WORKSHEET_REL, '/' + new_part)
+
+        self.new_sheets.append(f'<sheet name={quoteattr(sheet_name)} sheetId="{self.next_sheet_id}" '
+                               f'r:id="{rel_id}"/>')
+        self.next_sheet_id += 1
+
+    def replace_sheet(self, base_part, source, sheet_part):
+        """
+        Overwrite the XML of an existing base sheet with a sheet from `source`.
+
+        The base sheet keeps its name, position and related parts (drawings)
+        when they match the new sheet's, which is the case for sheets built
+        from the same template. Otherwise the new sheet's parts are copied.
+        """
+        self._check_styles(source)
+        base_rels = {(rel['Id'], rel['Type']) for rel in self.base.relationships(base_part)}
+        source_rels = {(rel['Id'], rel['Type']) for rel in source.relationships(sheet_part)}
+        data = self._remap_strings(source, source.parts[sheet_part])
+        if base_rels == source_rels:
+            self.base.parts[base_part] = data
+        else:
+            self.base.parts.pop(_rels_path(base_part), None)
+            self._copy_part(source, sheet_part, base_part, data)
+
+    def finish(self):
+        """Write the queued entries into the base package and return it"""
+        parts = self.base.parts
+
+        if self.strings_changed:
+            count = len(self.strings)
+            parts[SHARED_STRINGS] = (
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                + f'count="{count}" uniqueCount="{count}">'.encode()
+                + b''.join(self.strings) + b'</sst>')
+            if SHARED_STRINGS_REL.encode() not in parts[WORKBOOK_RELS]:
+                counter = len(self.rel_ids) + 1
+                while f"rId{counter}" in self.rel_ids:
+                    counter += 1
+                self.rel_ids.add(f"rId{counter}")
+                self._add_relationship(WORKBOOK, f"rId{counter}", SHARED_STRINGS_REL, '/' + SHARED_STRINGS)
+                self.new_types.append(f'<Override PartName="/{SHARED_STRINGS}" ContentType="{SHARED_STRINGS_TYPE}"/>')
+
+        if self.new_sheets:
+            workbook = parts[WORKBOOK]
+            if b'xmlns:r=' not in workbook[:workbook.index(b'>', workbook.index(b'<workbook'))]:
+                workbook = workbook.replace(
+                    b'<workbook', b'<workbook xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"', 1)
+            parts[WORKBOOK] = _insert_before(workbook, b'</sheets>', ''.join(self.new_sheets).encode())
+
+        for rels_part, elements in self.new_rels.items():
+            rels = parts.get(rels_part)
+            if rels is None:
+                rels = (b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                        b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                        b'</Relationships>')
+            parts[rels_part] = _insert_before(rels, b'</Relationships>', ''.join(elements).encode())
+
+        if self.new_types:
+            parts[CONTENT_TYPES] = _insert_before(parts[CONTENT_TYPES], b'</Types>',
+                                                  ''.join(self.new_types).encode())
+
+        self.new_sheets, self.new_types, self.new_rels = [], [], {}
+        return self.base
+
+
+def deduplicate_media(xlsx_file):
+    """
+    Store identical pictures of an .xlsx file only once, rewriting it in place.
+
+    The file is streamed part by part, so only one picture is held in memory
+    at a time.
+
+    Args:
+        xlsx_file: path of the workbook
+
+    Returns:
+        Number of duplicate media parts removed
+    """
+    with zipfile.ZipFile(xlsx_file) as archive:
+        first_part = {}
+        duplicates = {}
+        for info in archive.infolist():
+            if info.filename.startswith(MEDIA_FOLDER):
+                digest = hashlib.sha256(archive.read(info)).digest()
+                duplicates[info.filename] = first_part.setdefault(digest, info.filename)
+        duplicates = {part: first for part, first in duplicates.items() if part != first}
+        if not duplicates:
+            return 0
+
+        def retarget(match):
+            element = match.group(0)
+            attrs = _attrs(element)
+            if attrs.get('TargetMode') == 'External':
+                return element
+            target = _resolve(owner, _unescape(attrs['Target']))
+            if target not in duplicates:
+                return element
+            return element.replace(f'Target="{attrs["Target"]}"'.encode(),
+                                   f'Target={quoteattr("/" + duplicates[target])}'.encode())
+
+        def drop_override(match):
+            return b'' if _attrs(match.group(0))['PartName'][1:] in duplicates else match.group(0)
+
+        tmp_file = f"{xlsx_file}.{os.getpid()}.tmp"
+        try:
+            with zipfile.ZipFile(tmp_file, 'w', zipfile.ZIP_DEFLATED) as output:
+                for info in archive.infolist():
+                    if info.filename in duplicates:
+                        continue
+                    data = archive.read(info)
+                    if info.filename.endswith('.rels'):
+                        owner = _rels_owner(info.filename)
+                        data = _REL_RE.sub(retarget, data)
+                    elif info.filename == CONTENT_TYPES:
+                        data = _OVERRIDE_RE.sub(drop_override, data)
+                    output.writestr(info, data)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+    os.replace(tmp_file, xlsx_file)
+    return len(duplicates)
+
+
+def merge_workbooks(part_files, output_file):
+    """
+    Merge workbooks into one, keeping sheet order.
+
+    Args:
+        part_files: list of .xlsx paths built from the same template
+        output_file: path of the merged .xlsx
+
+    Returns:
+        Number of sheets in the merged workbook
+    """
+    base = XlsxPackage(part_files[0])
+    merger = WorkbookMerger(base)
+    for part_file in part_files[1:]:
+        merger.add_sheets(XlsxPackage(part_file))
+    merger.finish().save(output_file)
+    return len(base.sheets())